@@ -0,0 +1,155 @@
+"""Compare the CodeChef profile parser against the old BeautifulSoup parse.
+
+Usage: python benchmarks/bench_codechef_parser.py [--fixture PATH] [--repeat N]
+
+Parse time is the best of N runs. Peak memory is the growth in max RSS of a
+fresh subprocess while it parses the page once, so allocations made inside
+libxml2 are counted too.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from codechef_parser import parse_codechef_profile
+
+DEFAULT_FIXTURE = os.path.join(ROOT, "benchmarks", "fixtures", "codechef_profile.html")
+
+
+def legacy_parse(page: str) -> dict:
+    # The BeautifulSoup html.parser implementation this parser replaced
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(page, 'html.parser')
+    rating_header = soup.find('div', class_='rating-header')
+    current_rating = None
+    highest_rating = None
+    if rating_header:
+        rating_number = rating_header.find('div', class_='rating-number')
+        if rating_number:
+            current_rating = float(rating_number.text.strip())
+        highest_rating_div = rating_header.find('div', class_='rating-star')
+        if highest_rating_div:
+            highest_text = highest_rating_div.get_text(strip=True)
+            try:
+                highest_rating = float(''.join(filter(str.isdigit, highest_text)))
+            except ValueError:
+                pass
+
+    problems_solved = 0
+    problem_categories = {}
+    problems_section = soup.find('section', {'class': 'rating-data-section problems-solved'})
+    if problems_section:
+        fully_solved_header = problems_section.find('h5', string='Fully Solved')
+        if fully_solved_header:
+            problems_list = fully_solved_header.find_next('article')
+            if problems_list:
+                problems = problems_list.find_all('p')
+                problems_solved = len(problems)
+                for problem in problems:
+                    problem_text = problem.get_text(strip=True)
+                    category = 'practice'
+                    if '(Challenge)' in problem_text:
+                        category = 'challenge'
+                    elif '(Contest)' in problem_text:
+                        category = 'contest'
+                    problem_categories[category] = problem_categories.get(category, 0) + 1
+
+    contests_participated = 0
+    contest_section = soup.find('section', {'class': 'rating-data-section contests-attended'})
+    if contest_section:
+        contests_participated = len(contest_section.find_all('p'))
+
+    return {
+        "total_solved": problems_solved,
+        "rating": current_rating,
+        "highest_rating": highest_rating,
+        "contests_participated": contests_participated,
+        "categories": problem_categories,
+    }
+
+
+PARSERS = {
+    "before": legacy_parse,
+    "after": parse_codechef_profile,
+}
+
+
+def best_time(parser, page: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parser(page)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory_kib(name: str, fixture: str) -> int:
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), "--child", name, "--fixture", fixture]
+    )
+    return int(output.decode().strip())
+
+
+def max_rss_kib() -> int:
+    # ru_maxrss survives exec on Linux (a child would report its parent's
+    # peak), so prefer the per-process high-water mark when available
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def child(name: str, fixture: str):
+    # Imports and the page itself are loaded before the baseline is taken
+    with open(fixture, encoding="utf-8") as f:
+        page = f.read()
+    import bs4  # noqa: F401
+    import lxml.html  # noqa: F401
+    baseline = max_rss_kib()
+    PARSERS[name](page)
+    print(max_rss_kib() - baseline)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixture", default=DEFAULT_FIXTURE)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--child", choices=sorted(PARSERS))
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.fixture)
+        return
+
+    with open(args.fixture, encoding="utf-8") as f:
+        page = f.read()
+
+    before = legacy_parse(page)
+    # The legacy parser predates the solved problem codes; compare what it reports
+    after = {key: value for key, value in parse_codechef_profile(page).items() if key in before}
+    if before != after:
+        sys.exit(f"Parsers disagree:\nbefore: {before}\nafter:  {after}")
+
+    results = {"fixture": os.path.basename(args.fixture), "bytes": len(page.encode("utf-8"))}
+    for name, parse in PARSERS.items():
+        results[name] = {
+            "parse_ms": round(best_time(parse, page, args.repeat) * 1000, 3),
+            "peak_rss_kib": peak_memory_kib(name, args.fixture),
+        }
+    results["speedup"] = round(results["before"]["parse_ms"] / results["after"]["parse_ms"], 1)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
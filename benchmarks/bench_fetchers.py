@@ -0,0 +1,157 @@
+"""Parse CPU time and fetcher throughput, replaying recorded upstream responses.
+
+Usage: python benchmarks/bench_fetchers.py [--profiles N] [--concurrency N] [--repeat N]
+                                           [--latency MS] [--output FILE]
+
+Parse time is CPU time from a response body to the stats dict, the best of
+N runs. Throughput refreshes N distinct profiles per platform through the
+same code paths the refresh jobs and the scheduler use (single-profile
+fetchers and batched cohorts), against the stub server in a separate
+process and a throwaway SQLite database. Nothing touches the network.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+from common import app_environment, load_fixture, max_rss_kib, report, stub_upstreams
+
+COHORT_USER_IDS = 1_000_000
+# Profile URL of each platform the stub serves
+PROFILE_URLS = {
+    "leetcode": "https://leetcode.com/u/{}/",
+    "codechef": "https://www.codechef.com/users/{}",
+    "codeforces": "https://codeforces.com/profile/{}",
+}
+
+
+def best_cpu_time(fn, repeat: int, number: int = 1) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.process_time()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.process_time() - start) / number)
+    return best
+
+
+def bench_parsers(repeat: int) -> dict:
+    from codechef_parser import parse_codechef_profile
+    from codeforces_problems import problem_index
+    from codeforces_sync import apply_submissions
+    from platforms.leetcode import parse_user
+    from models import CodeForcesSyncState
+
+    leetcode_body = json.dumps(load_fixture("leetcode_user.json"))
+    codechef_page = load_fixture("codechef_profile.html")
+    submissions_body = json.dumps(load_fixture("codeforces_user_status.json"))
+    problem_index.add(load_fixture("codeforces_problemset.json")["result"]["problems"])
+
+    def leetcode():
+        data = json.loads(leetcode_body)["data"]
+        return parse_user(data["matchedUser"], data["userContestRanking"], data["recentAcSubmissionList"])
+
+    def codeforces():
+        state = CodeForcesSyncState(handle="bench", solved_problems=[])
+        apply_submissions(state, json.loads(submissions_body)["result"])
+        return problem_index.histograms(state.solved_problems)
+
+    return {
+        "leetcode_ms": round(best_cpu_time(leetcode, repeat, number=1000) * 1000, 4),
+        "codechef_ms": round(best_cpu_time(lambda: parse_codechef_profile(codechef_page), repeat) * 1000, 3),
+        "codeforces_ms": round(best_cpu_time(codeforces, repeat) * 1000, 3),
+        "codeforces_submissions": len(json.loads(submissions_body)["result"]),
+    }
+
+
+async def timed(calls: int, concurrency: int, refresh, batch_size: int = 1) -> dict:
+    # refresh(i) refreshes the i-th profile (or batch of profiles) and
+    # returns how many succeeded
+    semaphore = asyncio.Semaphore(concurrency)
+    succeeded = 0
+
+    async def one(i: int):
+        nonlocal succeeded
+        async with semaphore:
+            result = await refresh(i)
+            succeeded += int(result or 0)
+
+    cpu, wall = time.process_time(), time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    profiles = calls * batch_size
+    return {
+        "profiles": profiles,
+        "succeeded": succeeded,
+        "wall_s": round(wall, 3),
+        "cpu_s": round(cpu, 3),
+        "profiles_per_s": round(profiles / wall, 1),
+    }
+
+
+async def bench_throughput(profiles: int, concurrency: int) -> dict:
+    from codeforces_problems import problem_index
+    from http_client import close_session
+    from models import dispose_engines
+    from platforms import registry
+    from platforms.refresh import refresh_cohort, refresh_profile
+
+    # The problemset download is a daily job, not part of a refresh
+    await problem_index.ensure_fresh()
+
+    def single(platform: str, url: str):
+        return lambda i: refresh_profile(platform, i, url.format(f"bench{i}"), allow_stale=False)
+
+    def cohort(platform: str, batch_size: int, url: str):
+        async def run(i: int):
+            # User ids after the single-profile runs, so every refresh stores a snapshot
+            first = COHORT_USER_IDS + i * batch_size
+            profiles = [(first + j, url.format(f"cohort{i}x{j}")) for j in range(batch_size)]
+            return sum((await refresh_cohort(platform, profiles)).values())
+        return run
+
+    results = {}
+    try:
+        for platform, url in PROFILE_URLS.items():
+            results[platform] = await timed(profiles, concurrency, single(platform, url))
+        # Cohorts: `profiles` profiles in batches of the configured size
+        for adapter in registry:
+            if adapter.batch_size > 0 and adapter.name in PROFILE_URLS:
+                results[f"{adapter.name}_cohort"] = await timed(
+                    max(1, profiles // adapter.batch_size), concurrency,
+                    cohort(adapter.name, adapter.batch_size, PROFILE_URLS[adapter.name]),
+                    batch_size=adapter.batch_size)
+    finally:
+        await close_session()
+        await dispose_engines()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profiles", type=int, default=200, help="Profiles refreshed per platform")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated upstream latency, in milliseconds")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory, stub_upstreams(args.latency) as stub_url:
+        os.environ.update(app_environment(stub_url, os.path.join(directory, "bench.db")))
+        from models import init_db
+        init_db()
+
+        results = {"parse_cpu": bench_parsers(args.repeat)}
+        rss_before = max_rss_kib()
+        results["throughput"] = asyncio.run(bench_throughput(args.profiles, args.concurrency))
+        results["memory"] = {"peak_rss_kib": max_rss_kib(), "refresh_growth_kib": max_rss_kib() - rss_before}
+        results["settings"] = {"profiles": args.profiles, "concurrency": args.concurrency,
+                               "latency_ms": args.latency, "repeat": args.repeat}
+    report("fetchers", results, args.output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""API latency under concurrent load, with the upstreams replaced by recorded responses.
+
+Usage: python benchmarks/bench_load.py [--users N] [--requests N] [--concurrency N]
+                                       [--latency MS] [--output FILE]
+
+The app runs under uvicorn in its own process, against a throwaway SQLite
+database and the stub server; this process only sends requests, so its own
+CPU time doesn't skew the numbers. Phases:
+
+1. track: every user POSTs /track-profiles with one profile per platform;
+   the refreshes run in the background and the phase ends when all jobs
+   have finished.
+2. stats_cold: GET /user/{id}/stats once per user (nothing cached yet).
+3. stats: --requests GETs spread over the users at random.
+4. stats_revalidate: the same with If-None-Match, answered with 304.
+
+Latencies are reported as percentiles; the app's peak RSS and CPU time
+come from /proc.
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+from common import ROOT, app_environment, free_port, max_rss_kib, report, running, stub_upstreams, summarize
+
+SEED = 17
+
+
+def process_cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    # utime and stime, fields 14 and 15 of stat(5)
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def run_phase(count: int, concurrency: int, request) -> dict:
+    # request(i) sends the i-th request and returns its status
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = {}
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            status = await request(i)
+            latencies.append(time.perf_counter() - start)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    wall = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    wall = time.perf_counter() - wall
+    return {**summarize(latencies), "requests_per_s": round(count / wall, 1), "statuses": statuses}
+
+
+async def wait_for_jobs(session: aiohttp.ClientSession, base_url: str, job_ids, timeout: float) -> dict:
+    pending = set(job_ids)
+    outcome = {}
+    deadline = time.monotonic() + timeout
+    while pending and time.monotonic() < deadline:
+        for job_id in list(pending):
+            async with session.get(f"{base_url}/jobs/{job_id}") as response:
+                status = (await response.json())["status"]
+            if status in ("succeeded", "failed"):
+                pending.discard(job_id)
+                outcome[status] = outcome.get(status, 0) + 1
+        if pending:
+            await asyncio.sleep(0.05)
+    if pending:
+        outcome["unfinished"] = len(pending)
+    return outcome
+
+
+async def load(base_url: str, users: int, requests: int, concurrency: int, job_timeout: float) -> dict:
+    rng = random.Random(SEED)
+    results = {}
+    user_ids = [None] * users
+    job_ids = []
+    etags = {}
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+
+        async def track(i: int) -> int:
+            profiles = {
+                "leetcode_url": f"https://leetcode.com/u/load{i}/",
+                "codechef_url": f"https://www.codechef.com/users/load{i}",
+                "codeforces_url": f"https://codeforces.com/profile/load{i}",
+            }
+            async with session.post(f"{base_url}/track-profiles", json=profiles) as response:
+                body = await response.json()
+            user_ids[i] = body.get("user_id")
+            job_ids.extend(body.get("jobs", {}).values())
+            return response.status
+
+        async def stats(user_id: int, etag: str = None) -> int:
+            headers = {"If-None-Match": etag} if etag else {}
+            async with session.get(f"{base_url}/user/{user_id}/stats", headers=headers) as response:
+                await response.read()
+                if response.status == 200:
+                    etags[user_id] = response.headers.get("ETag")
+                return response.status
+
+        drain = time.perf_counter()
+        results["track"] = await run_phase(users, concurrency, track)
+        results["track"]["jobs"] = await wait_for_jobs(session, base_url, job_ids, job_timeout)
+        drain = time.perf_counter() - drain
+        results["track"]["refresh_all_s"] = round(drain, 3)
+        results["track"]["profiles_per_s"] = round(len(job_ids) / drain, 1)
+
+        results["stats_cold"] = await run_phase(users, concurrency, lambda i: stats(user_ids[i]))
+        targets = [rng.choice(user_ids) for _ in range(requests)]
+        results["stats"] = await run_phase(requests, concurrency, lambda i: stats(targets[i]))
+        results["stats_revalidate"] = await run_phase(
+            requests, concurrency, lambda i: stats(targets[i], etags.get(targets[i]))
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100, help="Users created through /track-profiles")
+    parser.add_argument("--requests", type=int, default=2000, help="GET /user/{id}/stats requests per phase")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated upstream latency, in milliseconds")
+    parser.add_argument("--job-timeout", type=float, default=300.0)
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory, stub_upstreams(args.latency) as stub_url:
+        env = dict(os.environ, **app_environment(stub_url, os.path.join(directory, "bench.db")))
+        subprocess.run([sys.executable, "-c", "from models import init_db; init_db()"], cwd=ROOT, env=env, check=True)
+
+        port = free_port()
+        app = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+               "--log-level", "warning", "--no-access-log"]
+        with running(app, port, env) as process:
+            cpu = process_cpu_seconds(process.pid)
+            rss = max_rss_kib(str(process.pid))
+            results = asyncio.run(load(f"http://127.0.0.1:{port}", args.users, args.requests,
+                                       args.concurrency, args.job_timeout))
+            results["app"] = {
+                "cpu_s": round(process_cpu_seconds(process.pid) - cpu, 3),
+                "startup_rss_kib": rss,
+                "peak_rss_kib": max_rss_kib(str(process.pid)),
+            }
+    results["settings"] = {"users": args.users, "requests": args.requests,
+                           "concurrency": args.concurrency, "latency_ms": args.latency}
+    report("load", results, args.output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
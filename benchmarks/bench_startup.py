@@ -0,0 +1,81 @@
+"""Start-up time and memory of the app's entry points.
+
+Usage: python benchmarks/bench_startup.py [--repeat N] [--output FILE]
+
+Each entry point's modules are imported in a fresh interpreter, N times;
+import_ms is the best time spent importing them, startup_ms the best wall
+time of the whole process (interpreter start-up included) and rss_kib its
+peak resident memory. Nothing connects to a database or an upstream.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import BENCHMARK_ENVIRONMENT, ROOT, report
+
+# Entry point -> modules it imports before doing any work
+ENTRY_POINTS = {
+    # uvicorn main:app
+    "api": ["main"],
+    # python scheduler.py
+    "scheduler_worker": ["scheduler", "jobs", "http_client"],
+    # python refresh.py, once its arguments are parsed
+    "refresh_cli": ["refresh", "models", "jobs", "scheduler", "platforms.refresh", "http_client"],
+    # Scripts that only need the models and the platform registry (init_db.py)
+    "registry": ["models", "platforms"],
+}
+
+# Runs in the child; must not import anything but the standard library
+# before the measurement starts
+CHILD = """
+import importlib, json, sys, time
+start = time.perf_counter()
+for name in sys.argv[1:]:
+    importlib.import_module(name)
+elapsed = time.perf_counter() - start
+with open("/proc/self/status") as f:
+    rss = next((int(line.split()[1]) for line in f if line.startswith("VmHWM:")), 0)
+print(json.dumps({"import_s": elapsed, "rss_kib": rss}))
+"""
+
+
+def measure(modules, env: dict) -> dict:
+    start = time.perf_counter()
+    output = subprocess.check_output([sys.executable, "-c", CHILD, *modules], cwd=ROOT, env=env)
+    wall = time.perf_counter() - start
+    result = json.loads(output.decode().strip().splitlines()[-1])
+    result["wall_s"] = wall
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env.update(BENCHMARK_ENVIRONMENT)
+        env["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'startup.db')}"
+        env["PYTHONDONTWRITEBYTECODE"] = "1"
+
+        results = {"settings": {"repeat": args.repeat}}
+        for name, modules in ENTRY_POINTS.items():
+            # The first run also warms the bytecode and filesystem caches
+            measure(modules, env)
+            samples = [measure(modules, env) for _ in range(args.repeat)]
+            results[name] = {
+                "import_ms": round(min(sample["import_s"] for sample in samples) * 1000, 1),
+                "startup_ms": round(min(sample["wall_s"] for sample in samples) * 1000, 1),
+                "rss_kib": min(sample["rss_kib"] for sample in samples),
+            }
+    report("startup", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Shared setup for the offline benchmarks: the stub upstream, the app's environment and statistics."""
+import contextlib
+import json
+import os
+import platform
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.join(ROOT, "benchmarks")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+from stub_server import load_fixture, stub_environment  # noqa: E402,F401
+
+# Limits that would otherwise make the numbers measure the politeness
+# settings rather than the code
+BENCHMARK_ENVIRONMENT = {
+    "RATE_LIMIT_LEETCODE": "100000",
+    "RATE_LIMIT_CODECHEF": "100000",
+    "RATE_LIMIT_CODEFORCES": "100000",
+    "RATE_LIMIT_BURST": "1000",
+    "CONCURRENCY_INITIAL": "32",
+    "CONCURRENCY_MAX": "32",
+    "HTTP_LIMIT_PER_HOST": "32",
+    "LOG_LEVEL": "WARNING",
+    "SCHEDULER_ENABLED": "0",
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args} exited with status {process.returncode}")
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port), timeout=0.5):
+            return
+        time.sleep(0.05)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout}s")
+
+
+@contextlib.contextmanager
+def running(args, port: int, env=None):
+    process = subprocess.Popen(args, cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    try:
+        wait_for_port(port, process)
+        yield process
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+@contextlib.contextmanager
+def stub_upstreams(latency_ms: float = 0.0):
+    # The stub runs in its own process so its CPU time isn't measured
+    port = free_port()
+    args = [sys.executable, os.path.join(BENCHMARKS, "stub_server.py"), "--port", str(port), "--latency", str(latency_ms)]
+    with running(args, port):
+        yield f"http://127.0.0.1:{port}"
+
+
+def app_environment(stub_url: str, database_path: str) -> dict:
+    # Must be applied before the app's modules are imported
+    env = dict(BENCHMARK_ENVIRONMENT)
+    env.update(stub_environment(stub_url))
+    env["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{database_path}"
+    return env
+
+
+def summarize(samples) -> dict:
+    # Latencies in seconds -> milliseconds
+    ordered = sorted(samples)
+    if not ordered:
+        return {"count": 0}
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(percentile(50) * 1000, 3),
+        "p90_ms": round(percentile(90) * 1000, 3),
+        "p99_ms": round(percentile(99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def max_rss_kib(pid: str = "self") -> int:
+    # Peak resident set size of a process
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if pid == "self" else 0
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def report(name: str, results: dict, output: str = None):
+    results = {
+        "benchmark": name,
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        **results,
+    }
+    text = json.dumps(results, indent=2)
+    print(text)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
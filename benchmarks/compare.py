@@ -0,0 +1,77 @@
+"""Compare two benchmark result files and flag regressions.
+
+Usage: python benchmarks/compare.py BASELINE.json CURRENT.json [--threshold PCT]
+
+Both files come from the same benchmark's --output. Timings, CPU and
+memory (*_ms, *_s, *_kib) are better when lower, throughput (*_per_s) when
+higher. Exits with status 1 if any of them got worse by more than the
+threshold, so it can gate a CI job; run both sides on the same machine.
+"""
+import argparse
+import json
+import sys
+
+# Single samples are too noisy to gate on
+IGNORED = {"max_ms", "settings"}
+
+
+def metrics(results: dict, prefix: str = ""):
+    for key, value in results.items():
+        if key in IGNORED:
+            continue
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from metrics(value, name + ".")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            if key.endswith("_per_s"):
+                yield name, value, True
+            elif key.endswith(("_ms", "_s", "_kib")):
+                yield name, value, False
+
+
+def compare(baseline: dict, current: dict, threshold: float):
+    current_metrics = {name: value for name, value, _ in metrics(current)}
+    regressions = []
+    rows = []
+    for name, before, higher_is_better in metrics(baseline):
+        after = current_metrics.get(name)
+        if after is None or before == 0:
+            continue
+        change = (after - before) / before * 100
+        worse = -change if higher_is_better else change
+        flag = "REGRESSION" if worse > threshold else ""
+        if flag:
+            regressions.append(name)
+        rows.append((name, before, after, change, flag))
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=15.0, help="Allowed slowdown, in percent")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if baseline.get("benchmark") != current.get("benchmark"):
+        sys.exit(f"Different benchmarks: {baseline.get('benchmark')} vs {current.get('benchmark')}")
+    if baseline.get("settings") != current.get("settings"):
+        print(f"Warning: settings differ: {baseline.get('settings')} vs {current.get('settings')}")
+
+    rows, regressions = compare(baseline, current, args.threshold)
+    print(f"{baseline.get('benchmark')}: {baseline.get('revision')} -> {current.get('revision')}")
+    width = max((len(row[0]) for row in rows), default=0)
+    for name, before, after, change, flag in rows:
+        print(f"{name:<{width}}  {before:>12g}  {after:>12g}  {change:>+8.1f}%  {flag}")
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed by more than {args.threshold:g}%")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""Local stand-in for LeetCode, CodeChef and Codeforces that replays the recorded fixtures.
+
+Usage: python benchmarks/stub_server.py [--port N] [--latency MS]
+
+Every platform lives under its own path prefix; point the app at it with
+
+    LEETCODE_BASE_URL=http://127.0.0.1:N/leetcode
+    CODECHEF_BASE_URL=http://127.0.0.1:N/codechef
+    CODEFORCES_BASE_URL=http://127.0.0.1:N/codeforces
+
+Any username or handle is known and gets the same recorded profile, except
+those starting with "missing", which behave like unknown users. Responses
+are serialized once up front so the stub costs as little CPU as possible.
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import re
+from functools import lru_cache
+
+from aiohttp import web
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+_MATCHED_USER = re.compile(r"(\w+): matchedUser\(username: \$(\w+)\)")
+_CONTEST_RANKING = re.compile(r"(\w+): userContestRanking\(username: \$(\w+)\)")
+_RECENT_AC = re.compile(r"(\w+): recentAcSubmissionList\(username: \$(\w+)")
+
+
+def load_fixture(name: str):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read() if name.endswith(".html") else json.load(f)
+
+
+def stub_environment(base_url: str) -> dict:
+    # Environment variables that send the app's upstream requests to the stub
+    return {
+        "LEETCODE_BASE_URL": f"{base_url}/leetcode",
+        "CODECHEF_BASE_URL": f"{base_url}/codechef",
+        "CODEFORCES_BASE_URL": f"{base_url}/codeforces",
+    }
+
+
+def build_app(latency: float = 0.0) -> web.Application:
+    leetcode = load_fixture("leetcode_user.json")["data"]
+    codechef_page = load_fixture("codechef_profile.html").encode("utf-8")
+    user_info = load_fixture("codeforces_user_info.json")["result"][0]
+    submissions = load_fixture("codeforces_user_status.json")["result"]
+    problemset = json.dumps(load_fixture("codeforces_problemset.json")).encode("utf-8")
+    user_not_found = json.dumps({"status": "FAILED", "comment": "handles: User with handle {} not found"})
+
+    @lru_cache(maxsize=None)
+    def submissions_page(start: int, count: int) -> bytes:
+        return json.dumps({"status": "OK", "result": submissions[start - 1:start - 1 + count]}).encode("utf-8")
+
+    def json_body(body: bytes, status: int = 200) -> web.Response:
+        return web.Response(body=body, status=status, content_type="application/json")
+
+    @web.middleware
+    async def simulated_latency(request, handler):
+        if latency:
+            await asyncio.sleep(latency)
+        return await handler(request)
+
+    async def graphql(request):
+        body = await request.json()
+        query, variables = body["query"], body.get("variables") or {}
+        data = {}
+        for alias, variable in _MATCHED_USER.findall(query):
+            username = variables[variable]
+            if username.startswith("missing"):
+                data[alias] = None
+            else:
+                data[alias] = dict(copy.deepcopy(leetcode["matchedUser"]), username=username)
+        for alias, variable in _CONTEST_RANKING.findall(query):
+            data[alias] = None if variables[variable].startswith("missing") else leetcode["userContestRanking"]
+        for alias, variable in _RECENT_AC.findall(query):
+            data[alias] = None if variables[variable].startswith("missing") else leetcode["recentAcSubmissionList"]
+        return web.json_response({"data": data})
+
+    async def codechef_profile(request):
+        if request.match_info["username"].startswith("missing"):
+            return web.Response(status=404, text="Not Found")
+        return web.Response(body=codechef_page, content_type="text/html", charset="utf-8")
+
+    async def codeforces_user_info(request):
+        handles = request.query.get("handles", "").split(";")
+        for handle in handles:
+            if handle.startswith("missing"):
+                return json_body(user_not_found.format(handle).encode("utf-8"), status=400)
+        return web.json_response({"status": "OK", "result": [dict(user_info, handle=handle) for handle in handles]})
+
+    async def codeforces_user_status(request):
+        if request.query.get("handle", "").startswith("missing"):
+            return json_body(user_not_found.format(request.query["handle"]).encode("utf-8"), status=400)
+        start = int(request.query.get("from", "1"))
+        count = int(request.query.get("count", str(len(submissions))))
+        return json_body(submissions_page(start, count))
+
+    async def codeforces_problemset(request):
+        return json_body(problemset)
+
+    app = web.Application(middlewares=[simulated_latency])
+    app.router.add_post("/leetcode/graphql", graphql)
+    app.router.add_get("/codechef/users/{username}", codechef_profile)
+    app.router.add_get("/codeforces/api/user.info", codeforces_user_info)
+    app.router.add_get("/codeforces/api/user.status", codeforces_user_status)
+    app.router.add_get("/codeforces/api/problemset.problems", codeforces_problemset)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Added delay per response, in milliseconds")
+    args = parser.parse_args()
+
+    for name, value in stub_environment(f"http://{args.host}:{args.port}").items():
+        print(f"{name}={value}", flush=True)
+    web.run_app(build_app(args.latency / 1000), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
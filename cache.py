@@ -0,0 +1,208 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from metrics import UPSTREAM_CACHE_LOOKUPS
+from coordination import coordinator, SQLiteCacheStore
+
+logger = logging.getLogger(__name__)
+
+# Seconds a cached upstream result is served without revalidation
+CACHE_TTLS = {
+    "leetcode": float(os.getenv("CACHE_TTL_LEETCODE", "600")),
+    "codechef": float(os.getenv("CACHE_TTL_CODECHEF", "1800")),
+    "codeforces": float(os.getenv("CACHE_TTL_CODEFORCES", "300")),
+}
+CACHE_DEFAULT_TTL = float(os.getenv("CACHE_TTL_DEFAULT", "600"))
+# Past its TTL an entry is still served (and refreshed in the background) up to this age
+CACHE_MAX_STALE = float(os.getenv("CACHE_MAX_STALE", "86400"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Optional SQLite file so the cache survives restarts (with a shared
+# COORDINATION_BACKEND the coordination store is used instead)
+CACHE_PATH = os.getenv("UPSTREAM_CACHE_PATH")
+# With a shared COORDINATION_BACKEND only one process fetches a handle at a
+# time; the others wait up to this long for its result
+FETCH_LEASE_TTL = float(os.getenv("FETCH_LEASE_TTL", "60"))
+FETCH_LEASE_POLL = 0.25
+
+
+class CacheEntry:
+    __slots__ = ("value", "payload", "stored_at")
+
+    def __init__(self, value: Any, payload: str, stored_at: float):
+        self.value = value
+        self.payload = payload
+        self.stored_at = stored_at
+
+    @property
+    def size(self) -> int:
+        return len(self.payload)
+
+
+class UpstreamCache:
+    # LRU cache of upstream results keyed by (platform, handle), bounded by the
+    # total size of the JSON-encoded values. An optional store (SQLite file or
+    # Redis) backs it, and is shared when several processes use the same one.
+    # The store's calls block, so they run in a worker thread.
+
+    def __init__(self, ttls: Dict[str, float] = CACHE_TTLS, max_bytes: int = CACHE_MAX_BYTES,
+                 max_stale: float = CACHE_MAX_STALE, store=None, coordinator=coordinator):
+        self.ttls = ttls
+        self.max_bytes = max_bytes
+        self.max_stale = max_stale
+        self._entries: "OrderedDict[Tuple[str, str], CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self._store_backend = store
+        self._coordinator = coordinator
+
+    def ttl(self, platform: str) -> float:
+        return self.ttls.get(platform, CACHE_DEFAULT_TTL)
+
+    @staticmethod
+    def _key(platform: str, handle: str) -> Tuple[str, str]:
+        # Handles are case-insensitive on all supported platforms
+        return (platform, handle.lower())
+
+    async def get_entry(self, platform: str, handle: str) -> Optional[CacheEntry]:
+        key = self._key(platform, handle)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None and (time.time() - entry.stored_at < self.ttl(platform) or not self._coordinator.shared):
+            return entry
+        # Another process may have refreshed it since
+        stored = await self._load(key)
+        if stored is not None and (entry is None or stored.stored_at > entry.stored_at):
+            self._store(key, stored)
+            return stored
+        return entry
+
+    async def set(self, platform: str, handle: str, value: Any, stored_at: Optional[float] = None):
+        key = self._key(platform, handle)
+        entry = CacheEntry(value, json.dumps(value, separators=(",", ":")), stored_at or time.time())
+        if entry.size > self.max_bytes:
+            return
+        self._store(key, entry)
+        if self._store_backend is not None:
+            expire_after = entry.stored_at + self.ttl(platform) + self.max_stale - time.time()
+            await asyncio.to_thread(
+                self._store_backend.set, key[0], key[1], entry.payload, entry.stored_at, expire_after
+            )
+
+    async def invalidate(self, platform: str, handle: str):
+        key = self._key(platform, handle)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry.size
+        if self._store_backend is not None:
+            await asyncio.to_thread(self._store_backend.delete, *key)
+
+    def _store(self, key: Tuple[str, str], entry: CacheEntry):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            # Evict least recently used entries until we fit again
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+
+    def _read(self, key: Tuple[str, str]) -> Optional[CacheEntry]:
+        row = self._store_backend.get(*key)
+        if row is None:
+            return None
+        return CacheEntry(json.loads(row[0]), row[0], row[1])
+
+    async def _load(self, key: Tuple[str, str]) -> Optional[CacheEntry]:
+        if self._store_backend is None:
+            return None
+        return await asyncio.to_thread(self._read, key)
+
+    async def fetch(self, platform: str, handle: str, loader: Callable[[], Awaitable[Any]],
+                    allow_stale: bool = True) -> Any:
+        # Fresh hit: serve directly. Stale hit: serve it and refresh in the
+        # background. Miss (or too stale, or allow_stale=False): wait for the loader.
+        entry = await self.get_entry(platform, handle)
+        if entry is not None:
+            age = time.time() - entry.stored_at
+            if age < self.ttl(platform):
+                UPSTREAM_CACHE_LOOKUPS.inc(platform=platform, result="fresh")
+                return entry.value
+            if allow_stale and age < self.ttl(platform) + self.max_stale:
+                UPSTREAM_CACHE_LOOKUPS.inc(platform=platform, result="stale")
+                self._refresh(platform, handle, loader)
+                return entry.value
+        UPSTREAM_CACHE_LOOKUPS.inc(platform=platform, result="miss")
+        return await asyncio.shield(self._refresh(platform, handle, loader))
+
+    def _refresh(self, platform: str, handle: str, loader: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        # Concurrent misses for the same key share one upstream request
+        key = self._key(platform, handle)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load_and_store(platform, handle, loader))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._refresh_done(key, done))
+        return task
+
+    def _refresh_done(self, key: Tuple[str, str], task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Refresh of {key[0]}/{key[1]} failed: {task.exception()!r}")
+
+    async def _load_and_store(self, platform: str, handle: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        if self._coordinator.shared:
+            return await self._load_across_processes(platform, handle, loader)
+        value = await loader()
+        # Failed loads return None and are not cached
+        if value is not None:
+            await self.set(platform, handle, value)
+        return value
+
+    async def _load_across_processes(self, platform: str, handle: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        # Like the in-process de-duplication in _refresh, but across workers:
+        # whoever holds the handle's lease fetches, the rest pick up its result
+        key = self._key(platform, handle)
+        lease = f"fetch:{key[0]}:{key[1]}"
+        started = time.time()
+        while not await self._coordinator.acquire(lease, FETCH_LEASE_TTL):
+            await asyncio.sleep(FETCH_LEASE_POLL)
+            stored = await self._load(key)
+            if stored is not None and stored.stored_at >= started:
+                self._store(key, stored)
+                return stored.value
+            if time.time() - started > FETCH_LEASE_TTL:
+                break
+        try:
+            value = await loader()
+            if value is not None:
+                await self.set(platform, handle, value)
+            return value
+        finally:
+            await self._coordinator.release(lease)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+def default_store():
+    # The coordination backend's store when processes share state, otherwise
+    # the optional local file
+    if coordinator.cache_store is not None:
+        return coordinator.cache_store
+    return SQLiteCacheStore(CACHE_PATH) if CACHE_PATH else None
+
+
+upstream_cache = UpstreamCache(store=default_store())
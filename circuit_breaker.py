@@ -0,0 +1,100 @@
+import os
+import time
+from typing import Dict
+
+# Consecutive failures (timeouts, connection errors, 429/5xx) that open a circuit
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+# Seconds an open circuit rejects requests before letting a probe through;
+# doubles each time a probe fails, up to the max
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+CIRCUIT_RESET_TIMEOUT_MAX = float(os.getenv("CIRCUIT_RESET_TIMEOUT_MAX", "600"))
+# Requests allowed through at once while half-open
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "1"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_TIMEOUT,
+                 half_open_probes: int = CIRCUIT_HALF_OPEN_PROBES):
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self.probes = 0
+        if self.state == HALF_OPEN:
+            if self.probes >= self.half_open_probes:
+                self.rejected += 1
+                return False
+            self.probes += 1
+        return True
+
+    def record_success(self):
+        if self.state == HALF_OPEN:
+            self.reset_timeout = self.base_reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN:
+            # The probe failed: stay open, for longer
+            self.reset_timeout = min(self.reset_timeout * 2, CIRCUIT_RESET_TIMEOUT_MAX)
+            self._open()
+        elif self.state == CLOSED and self.failures >= self.failure_threshold:
+            self._open()
+
+    def release_probe(self):
+        # A probe that ended without a verdict (e.g. the caller gave up)
+        if self.state == HALF_OPEN and self.probes > 0:
+            self.probes -= 1
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+
+    def retry_in(self) -> float:
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "retry_in": round(self.retry_in(), 3),
+            "rejected": self.rejected,
+        }
+
+
+class PlatformCircuitBreakers:
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def breaker(self, platform: str) -> CircuitBreaker:
+        breaker = self._breakers.get(platform)
+        if breaker is None:
+            breaker = CircuitBreaker()
+            self._breakers[platform] = breaker
+        return breaker
+
+    def state(self) -> dict:
+        return {platform: breaker.snapshot() for platform, breaker in self._breakers.items()}
+
+
+circuit_breakers = PlatformCircuitBreakers()
@@ -0,0 +1,146 @@
+from typing import Dict, Iterable, Optional, Tuple
+
+from lxml import etree, html as lxml_html
+
+# Only these three elements of the (large) profile page are kept as trees;
+# everything else is dropped as soon as lxml has parsed past it.
+RATING_HEADER = ("div", "rating-header")
+PROBLEMS_SOLVED = ("section", "problems-solved")
+CONTESTS_ATTENDED = ("section", "contests-attended")
+SECTIONS = (RATING_HEADER, PROBLEMS_SOLVED, CONTESTS_ATTENDED)
+
+# Characters fed to the parser at a time; parsing stops at the end of the
+# chunk in which the last wanted element is closed
+FEED_CHUNK_SIZE = 16384
+
+Section = Tuple[str, str]
+
+
+def _has_class(element, class_name: str) -> bool:
+    return class_name in (element.get("class") or "").split()
+
+
+def _xpath_class(class_name: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')"
+
+
+def extract_sections(page: str, sections: Iterable[Section] = SECTIONS) -> Dict[Section, lxml_html.HtmlElement]:
+    # The first <tag> carrying class_name of each (tag, class_name), parsed
+    # by lxml's HTML parser from the start of the page, so scripts, comments
+    # and unclosed tags are handled as a browser would. Elements outside the
+    # wanted ones are cleared once closed. A section missing from the page,
+    # or cut off by a parse error, is left out.
+    sections = list(sections)
+    parser = etree.HTMLPullParser(events=("start", "end"), tag=tuple({tag for tag, _ in sections}))
+    parser.set_element_class_lookup(lxml_html.HtmlElementClassLookup())
+    found: Dict[Section, lxml_html.HtmlElement] = {}
+    current = None  # (section, element) being read
+
+    def handle_events() -> bool:
+        # True once every section is complete
+        nonlocal current
+        for event, element in parser.read_events():
+            if current is not None:
+                if event == "end" and element is current[1]:
+                    # Detached, so XPath axes stay within the section
+                    parent = element.getparent()
+                    if parent is not None:
+                        parent.remove(element)
+                    found[current[0]] = element
+                    current = None
+                    if len(found) == len(sections):
+                        return True
+            elif event == "start":
+                for section in sections:
+                    if section not in found and element.tag == section[0] and _has_class(element, section[1]):
+                        current = (section, element)
+                        break
+            else:
+                element.clear(keep_tail=True)
+        return False
+
+    try:
+        for start in range(0, len(page), FEED_CHUNK_SIZE):
+            parser.feed(page[start:start + FEED_CHUNK_SIZE])
+            if handle_events():
+                return found
+        parser.close()
+        handle_events()
+    except (etree.ParserError, etree.XMLSyntaxError):
+        pass
+    return found
+
+
+def extract_element(page: str, tag: str, class_name: str) -> Optional[lxml_html.HtmlElement]:
+    return extract_sections(page, [(tag, class_name)]).get((tag, class_name))
+
+
+def _to_float(text: str) -> Optional[float]:
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def parse_rating(rating_header: Optional[lxml_html.HtmlElement]):
+    current_rating = None
+    highest_rating = None
+    if rating_header is not None:
+        rating_number = rating_header.xpath(f".//div[{_xpath_class('rating-number')}]")
+        if rating_number:
+            current_rating = _to_float(rating_number[0].text_content().strip())
+
+        # Get highest rating
+        highest_rating_div = rating_header.xpath(f".//div[{_xpath_class('rating-star')}]")
+        if highest_rating_div:
+            highest_text = highest_rating_div[0].text_content()
+            highest_rating = _to_float(''.join(filter(str.isdigit, highest_text)))
+    return current_rating, highest_rating
+
+
+def parse_problems_solved(section: Optional[lxml_html.HtmlElement]):
+    problems_solved = 0
+    problem_categories = {}
+    problem_codes = []
+    if section is None:
+        return problems_solved, problem_categories, problem_codes
+
+    # Fully solved problems are listed in the first <article> after the heading
+    articles = section.xpath(".//h5[normalize-space(.)='Fully Solved'][1]/following::article[1]")
+    if articles:
+        problems = articles[0].xpath(".//p")
+        problems_solved = len(problems)
+        for problem in problems:
+            problem_text = problem.text_content()
+            category = 'practice'  # Default category
+            if '(Challenge)' in problem_text:
+                category = 'challenge'
+            elif '(Contest)' in problem_text:
+                category = 'contest'
+            problem_categories[category] = problem_categories.get(category, 0) + 1
+            # Each solved problem is a link labelled with its code
+            for link in problem.iter("a"):
+                code = (link.text or "").strip()
+                if code:
+                    problem_codes.append(code)
+    return problems_solved, problem_categories, problem_codes
+
+
+def parse_contests_attended(section: Optional[lxml_html.HtmlElement]) -> int:
+    if section is None:
+        return 0
+    return len(section.xpath(".//p"))
+
+
+def parse_codechef_profile(page: str) -> dict:
+    sections = extract_sections(page)
+    current_rating, highest_rating = parse_rating(sections.get(RATING_HEADER))
+    problems_solved, problem_categories, problem_codes = parse_problems_solved(sections.get(PROBLEMS_SOLVED))
+    return {
+        "total_solved": problems_solved,
+        "rating": current_rating,
+        "highest_rating": highest_rating,
+        "contests_participated": parse_contests_attended(sections.get(CONTESTS_ATTENDED)),
+        "categories": problem_categories,
+        "solved_problems": problem_codes,
+    }
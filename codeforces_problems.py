@@ -0,0 +1,154 @@
+import asyncio
+import calendar
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import run_in_session, CodeForcesProblem
+from http_client import upstream_request, upstream_url
+from coordination import coordinator
+
+logger = logging.getLogger(__name__)
+
+PROBLEMSET_URL = upstream_url("codeforces", "/api/problemset.problems")
+# The problemset (a few MB) is downloaded at most this often
+PROBLEMSET_REFRESH_INTERVAL = float(os.getenv("CODEFORCES_PROBLEMSET_REFRESH_INTERVAL", "86400"))
+# Wait before retrying after a failed download
+PROBLEMSET_RETRY_INTERVAL = float(os.getenv("CODEFORCES_PROBLEMSET_RETRY_INTERVAL", "600"))
+# Only one worker process downloads at a time; the others check the table again after this
+PROBLEMSET_LEASE_TTL = 300
+PROBLEMSET_LEASE_RETRY = 5
+
+
+def problem_key(problem: dict) -> str:
+    return f"{problem.get('contestId', '')}{problem.get('index', '')}"
+
+
+def _load_problems(db: Session) -> Tuple[Dict[str, Tuple[List[str], Optional[int]]], Optional[datetime]]:
+    problems = {
+        problem_id: (tags or [], rating)
+        for problem_id, tags, rating in db.query(
+            CodeForcesProblem.problem_id, CodeForcesProblem.tags, CodeForcesProblem.rating
+        )
+    }
+    updated_at = db.query(func.max(CodeForcesProblem.updated_at)).scalar()
+    if isinstance(updated_at, str):
+        updated_at = datetime.fromisoformat(updated_at)
+    return problems, updated_at
+
+
+def store_problems(db: Session, problems: List[dict]):
+    # Upsert; problems only known from submissions (gym, new rounds) are kept
+    now = datetime.utcnow()
+    existing = {row.problem_id: row for row in db.query(CodeForcesProblem)}
+    for problem in problems:
+        problem_id = problem_key(problem)
+        row = existing.get(problem_id)
+        if row is None:
+            row = CodeForcesProblem(problem_id=problem_id)
+            db.add(row)
+            existing[problem_id] = row
+        row.name = problem.get('name')
+        row.rating = problem.get('rating')
+        row.tags = problem.get('tags', [])
+        row.updated_at = now
+    db.commit()
+
+
+def add_problems(db: Session, problems: List[dict]):
+    # Problems seen in submissions that the index doesn't know yet; they have
+    # no updated_at until problemset.problems lists them
+    for problem in problems:
+        db.merge(CodeForcesProblem(
+            problem_id=problem_key(problem),
+            name=problem.get('name'),
+            rating=problem.get('rating'),
+            tags=problem.get('tags', [])
+        ))
+    db.commit()
+
+
+class ProblemIndex:
+    # problem id -> (tags, rating), loaded from the codeforces_problems table
+    # and refreshed from problemset.problems once it is a day old
+
+    def __init__(self, refresh_interval: float = PROBLEMSET_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._problems: Dict[str, Tuple[List[str], Optional[int]]] = {}
+        self._fresh_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    def __len__(self) -> int:
+        return len(self._problems)
+
+    async def ensure_fresh(self):
+        if time.time() < self._fresh_until:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if time.time() < self._fresh_until:
+                return
+            # Another process may have downloaded it already
+            problems, updated_at = await run_in_session(_load_problems)
+            self._problems.update(problems)
+            if updated_at is not None:
+                self._fresh_until = calendar.timegm(updated_at.timetuple()) + self.refresh_interval
+                if time.time() < self._fresh_until:
+                    return
+            if not await coordinator.acquire("codeforces-problemset", PROBLEMSET_LEASE_TTL):
+                self._fresh_until = time.time() + PROBLEMSET_LEASE_RETRY
+                return
+            try:
+                await self.refresh()
+            except Exception as e:
+                # Keep serving the previous index and try again later
+                self._fresh_until = time.time() + PROBLEMSET_RETRY_INTERVAL
+                logger.warning(f"Failed to refresh the Codeforces problemset: {str(e)}")
+            finally:
+                await coordinator.release("codeforces-problemset")
+
+    async def refresh(self):
+        async with upstream_request("codeforces", "GET", PROBLEMSET_URL) as response:
+            if response.status != 200:
+                raise RuntimeError(f"problemset.problems returned status code {response.status}")
+            data = await response.json(content_type=None)
+        if data.get('status') != 'OK':
+            raise RuntimeError(f"problemset.problems error: {data.get('comment', 'Unknown error')}")
+
+        problems = data['result']['problems']
+        await run_in_session(store_problems, problems)
+        for problem in problems:
+            self._problems[problem_key(problem)] = (problem.get('tags', []), problem.get('rating'))
+        self._fresh_until = time.time() + self.refresh_interval
+        logger.info(f"Loaded {len(problems)} Codeforces problems")
+
+    def missing(self, problems: Iterable[dict]) -> List[dict]:
+        return [problem for problem in problems if problem_key(problem) not in self._problems]
+
+    def add(self, problems: Iterable[dict]):
+        for problem in problems:
+            self._problems[problem_key(problem)] = (problem.get('tags', []), problem.get('rating'))
+
+    def histograms(self, problem_ids: Iterable[str]) -> Tuple[Dict[str, int], Dict[str, int]]:
+        # Tag counts and counts per difficulty rating over the given problems
+        tags: Dict[str, int] = {}
+        ratings: Dict[str, int] = {}
+        for problem_id in problem_ids:
+            entry = self._problems.get(problem_id)
+            if entry is None:
+                continue
+            problem_tags, rating = entry
+            for tag in problem_tags:
+                tags[tag] = tags.get(tag, 0) + 1
+            if rating is not None:
+                ratings[str(rating)] = ratings.get(str(rating), 0) + 1
+        return tags, ratings
+
+
+problem_index = ProblemIndex()
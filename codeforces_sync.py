@@ -0,0 +1,153 @@
+import logging
+import os
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from models import run_in_session, CodeForcesSyncState, ProfileHandle
+from http_client import upstream_request, upstream_url
+from codeforces_problems import problem_index, problem_key, add_problems
+from metrics import PARSE_SECONDS
+from solved import add_solved
+from platforms.base import solved_entry
+
+logger = logging.getLogger(__name__)
+
+SUBMISSIONS_URL = upstream_url("codeforces", "/api/user.status")
+# Small first page for the common "a few new submissions" case, bigger ones after
+FIRST_PAGE_SIZE = int(os.getenv("CODEFORCES_FIRST_PAGE_SIZE", "100"))
+PAGE_SIZE = int(os.getenv("CODEFORCES_PAGE_SIZE", "1000"))
+
+# Verdicts that can still change on a later refresh
+PENDING_VERDICTS = {None, "TESTING", "SUBMITTED"}
+
+
+class CodeForcesSyncError(Exception):
+    pass
+
+
+async def fetch_new_submissions(handle: str, last_submission_id: int) -> list:
+    # user.status returns newest submissions first, so page until we reach
+    # a submission that was already counted.
+    submissions = []
+    start = 1
+    count = FIRST_PAGE_SIZE if last_submission_id else PAGE_SIZE
+    while True:
+        params = {'handle': handle, 'from': str(start), 'count': str(count)}
+        async with upstream_request("codeforces", "GET", SUBMISSIONS_URL, params=params) as response:
+            if response.status != 200:
+                raise CodeForcesSyncError(f"CodeForces Submissions API returned status code: {response.status}")
+            data = await response.json(content_type=None)
+        if data['status'] != 'OK':
+            raise CodeForcesSyncError(f"CodeForces Submissions API error: {data.get('comment', 'Unknown error')}")
+
+        page = data['result']
+        for submission in page:
+            if submission['id'] <= last_submission_id:
+                return submissions
+            submissions.append(submission)
+        if len(page) < count:
+            return submissions
+        start += count
+        count = PAGE_SIZE
+
+
+def apply_submissions(state: CodeForcesSyncState, submissions: list) -> list:
+    # Returns the first accepted submission of each newly solved problem
+    solved_problems = set(state.solved_problems or [])
+    newly_solved = []
+    last_submission_id = state.last_submission_id or 0
+    oldest_pending: Optional[int] = None
+
+    # Oldest first, so first-solve order matches the submission history
+    for submission in reversed(submissions):
+        verdict = submission.get('verdict')
+        if verdict in PENDING_VERDICTS:
+            if oldest_pending is None:
+                oldest_pending = submission['id']
+            continue
+        if oldest_pending is None:
+            last_submission_id = max(last_submission_id, submission['id'])
+        if verdict != 'OK':
+            continue
+        problem = submission['problem']
+        problem_id = problem_key(problem)
+        if problem_id not in solved_problems:
+            solved_problems.add(problem_id)
+            newly_solved.append(submission)
+
+    # Submissions still being judged are fetched again next time
+    state.last_submission_id = last_submission_id
+    state.solved_problems = sorted(solved_problems)
+    return newly_solved
+
+
+def update_histograms(state: dict) -> dict:
+    # Tag and rating counts are looked up in the problemset index, so they
+    # follow re-tagged problems without re-reading any submissions
+    if len(problem_index):
+        state["problem_tags"], state["problem_ratings"] = problem_index.histograms(state["solved_problems"])
+    return state
+
+
+def state_to_dict(state: CodeForcesSyncState) -> dict:
+    return {
+        "last_submission_id": state.last_submission_id or 0,
+        "solved_problems": list(state.solved_problems or []),
+        "problem_tags": dict(state.problem_tags or {}),
+        "problem_ratings": dict(state.problem_ratings or {}),
+    }
+
+
+def load_sync_state(db: Session, key: str) -> dict:
+    state = db.get(CodeForcesSyncState, key)
+    if state is None:
+        state = CodeForcesSyncState(
+            handle=key, last_submission_id=0, solved_problems=[], problem_tags={}, problem_ratings={}
+        )
+        db.add(state)
+        db.commit()
+    return state_to_dict(state)
+
+
+def store_submissions(db: Session, key: str, submissions: list) -> dict:
+    state = db.get(CodeForcesSyncState, key)
+    with PARSE_SECONDS.time(platform="codeforces"):
+        first_accepted = apply_submissions(state, submissions)
+    newly_solved = [submission['problem'] for submission in first_accepted]
+    # Gym and brand-new problems aren't in problemset.problems yet
+    missing = problem_index.missing(newly_solved)
+    if missing:
+        add_problems(db, missing)
+        problem_index.add(missing)
+    result = update_histograms(state_to_dict(state))
+    state.problem_tags = result["problem_tags"]
+    state.problem_ratings = result["problem_ratings"]
+    # New solves are stored in the same transaction as the advanced sync
+    # state: these submissions won't be downloaded again
+    if first_accepted:
+        owners = [user_id for user_id, in db.query(ProfileHandle.user_id).filter(
+            ProfileHandle.platform == "codeforces", ProfileHandle.handle == key
+        )]
+        if owners:
+            entries = [
+                solved_entry(problem_key(submission['problem']), submission.get('creationTimeSeconds'),
+                             submission['problem'].get('tags', []))
+                for submission in first_accepted
+            ]
+            add_solved(db, "codeforces", {user_id: entries for user_id in owners})
+    db.commit()
+    return result
+
+
+async def sync_codeforces_submissions(handle: str) -> dict:
+    # No database session is held across the HTTP round-trips
+    key = handle.lower()
+    await problem_index.ensure_fresh()
+    state = await run_in_session(load_sync_state, key)
+
+    submissions = await fetch_new_submissions(handle, state["last_submission_id"])
+    logger.debug(f"CodeForces sync for {handle}: {len(submissions)} new submissions")
+    if submissions:
+        state = await run_in_session(store_submissions, key, submissions)
+    return update_histograms(state)
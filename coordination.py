@@ -0,0 +1,340 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional, Tuple
+
+from models import configure_sqlite_connection
+
+logger = logging.getLogger(__name__)
+
+# How API and worker processes share refresh leases, rate-limit buckets and
+# the upstream cache: "local" (one process, nothing shared), "sqlite" (tables
+# in COORDINATION_SQLITE_PATH, for several workers on one host) or "redis"
+COORDINATION_BACKEND = os.getenv("COORDINATION_BACKEND", "local")
+COORDINATION_SQLITE_PATH = os.getenv("COORDINATION_SQLITE_PATH", "./coordination.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Prepended to every Redis key, so several deployments can share a server
+REDIS_KEY_PREFIX = os.getenv("REDIS_KEY_PREFIX", "profile-tracker:")
+# Seconds between sweeps of expired upstream cache entries out of a SQLite store
+CACHE_STORE_PURGE_INTERVAL = float(os.getenv("CACHE_STORE_PURGE_INTERVAL", "300"))
+
+
+def connect_sqlite(path: str) -> sqlite3.Connection:
+    # Autocommit connection shared by threads (callers serialize on a lock)
+    connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    configure_sqlite_connection(connection)
+    return connection
+
+
+class SQLiteCacheStore:
+    # Upstream cache entries in a SQLite file: survives restarts and, in WAL
+    # mode, is shared by every process that opens the same file. Entries too
+    # stale to serve are ignored, and swept out by the next write after
+    # CACHE_STORE_PURGE_INTERVAL.
+
+    def __init__(self, path: str, purge_interval: float = CACHE_STORE_PURGE_INTERVAL):
+        self.path = path
+        self.purge_interval = purge_interval
+        self._purged_at = 0.0
+        self._db = connect_sqlite(path)
+        self._lock = threading.Lock()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS upstream_cache ("
+            "platform TEXT NOT NULL, handle TEXT NOT NULL, payload TEXT NOT NULL, "
+            "stored_at REAL NOT NULL, expires_at REAL NOT NULL, PRIMARY KEY (platform, handle))"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(upstream_cache)")}
+        if "expires_at" not in columns:
+            # Stores written before entries expired: the old rows expire at once
+            self._db.execute("ALTER TABLE upstream_cache ADD COLUMN expires_at REAL NOT NULL DEFAULT 0")
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_upstream_cache_expires_at ON upstream_cache (expires_at)")
+
+    def get(self, platform: str, handle: str) -> Optional[Tuple[str, float]]:
+        # (JSON payload, stored_at) or None
+        with self._lock:
+            return self._db.execute(
+                "SELECT payload, stored_at FROM upstream_cache WHERE platform = ? AND handle = ? AND expires_at > ?",
+                (platform, handle, time.time()),
+            ).fetchone()
+
+    def set(self, platform: str, handle: str, payload: str, stored_at: float, expire_after: float):
+        # expire_after: seconds until the entry is too stale to serve at all
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO upstream_cache (platform, handle, payload, stored_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (platform, handle, payload, stored_at, now + expire_after),
+            )
+            if now - self._purged_at >= self.purge_interval:
+                self._purged_at = now
+                self._db.execute("DELETE FROM upstream_cache WHERE expires_at <= ?", (now,))
+
+    def delete(self, platform: str, handle: str):
+        with self._lock:
+            self._db.execute("DELETE FROM upstream_cache WHERE platform = ? AND handle = ?", (platform, handle))
+
+
+class Coordinator:
+    # Leases that let one process at a time do a job (fetch a handle, run
+    # the scheduler), and the store backing the upstream cache
+
+    shared = False
+    cache_store = None
+
+    def __init__(self):
+        self.owner = uuid.uuid4().hex
+
+    async def acquire(self, name: str, ttl: float) -> bool:
+        # Take (or extend) a lease for ttl seconds; False while another
+        # process holds it
+        raise NotImplementedError
+
+    async def release(self, name: str):
+        raise NotImplementedError
+
+
+class LocalCoordinator(Coordinator):
+    # Single process: it is the only lease holder, and rate limits and the
+    # upstream cache stay in memory (rate_limit.TokenBucket, cache.UpstreamCache)
+
+    async def acquire(self, name: str, ttl: float) -> bool:
+        return True
+
+    async def release(self, name: str):
+        pass
+
+
+class SharedCoordinator(Coordinator):
+    # Backends shared by several processes, which also keep the rate-limit
+    # buckets (rate_limit.SharedTokenBucket) and the upstream cache entries
+
+    shared = True
+
+    async def take_token(self, bucket: str, rate: float, capacity: float) -> float:
+        # 0 if a token was taken, otherwise the seconds to wait before retrying
+        raise NotImplementedError
+
+    async def block(self, bucket: str, delay: float):
+        # Hold back every process's requests through this bucket for delay seconds
+        raise NotImplementedError
+
+
+class SQLiteCoordinator(SharedCoordinator):
+    # Processes on one host share a SQLite file in WAL mode. Each operation is
+    # one short transaction; waits for the write lock are bounded by
+    # SQLITE_BUSY_TIMEOUT and run in a worker thread, off the event loop.
+
+    def __init__(self, path: str = COORDINATION_SQLITE_PATH):
+        super().__init__()
+        self.path = path
+        self.cache_store = SQLiteCacheStore(path)
+        self._db = connect_sqlite(path)
+        self._lock = threading.Lock()
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            "name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS rate_buckets ("
+            "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, blocked_until REAL NOT NULL);"
+        )
+
+    def _acquire(self, name: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at < ?",
+                (name, self.owner, now + ttl, now),
+            )
+            return cursor.rowcount > 0
+
+    def _release(self, name: str):
+        with self._lock:
+            self._db.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, self.owner))
+
+    def _take_token(self, bucket: str, rate: float, capacity: float) -> float:
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two processes can't
+            # both read the same token count
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT tokens, updated_at, blocked_until FROM rate_buckets WHERE name = ?", (bucket,)
+                ).fetchone()
+                tokens, updated_at, blocked_until = row or (capacity, now, 0.0)
+                if now < blocked_until:
+                    wait = blocked_until - now
+                else:
+                    tokens = min(capacity, tokens + max(0.0, now - updated_at) * rate)
+                    updated_at = now
+                    if tokens >= 1:
+                        tokens -= 1
+                        wait = 0.0
+                    else:
+                        wait = (1 - tokens) / rate
+                self._db.execute(
+                    "INSERT OR REPLACE INTO rate_buckets (name, tokens, updated_at, blocked_until) VALUES (?, ?, ?, ?)",
+                    (bucket, tokens, updated_at, blocked_until),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return wait
+
+    def _block(self, bucket: str, delay: float):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO rate_buckets (name, tokens, updated_at, blocked_until) VALUES (?, 0, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET blocked_until = MAX(blocked_until, excluded.blocked_until)",
+                (bucket, now, now + delay),
+            )
+
+    async def acquire(self, name: str, ttl: float) -> bool:
+        return await asyncio.to_thread(self._acquire, name, ttl)
+
+    async def release(self, name: str):
+        await asyncio.to_thread(self._release, name)
+
+    async def take_token(self, bucket: str, rate: float, capacity: float) -> float:
+        return await asyncio.to_thread(self._take_token, bucket, rate, capacity)
+
+    async def block(self, bucket: str, delay: float):
+        await asyncio.to_thread(self._block, bucket, delay)
+
+
+# Lua keeps each read-modify-write atomic on the server and uses the server's
+# clock, so processes on different hosts agree on time
+REDIS_ACQUIRE = """
+local owner = redis.call('GET', KEYS[1])
+if not owner or owner == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+return 0
+"""
+REDIS_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+REDIS_TAKE_TOKEN = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at', 'blocked_until')
+local tokens = tonumber(state[1]) or capacity
+local updated_at = tonumber(state[2]) or now
+local blocked_until = tonumber(state[3]) or 0
+local wait = 0
+if now < blocked_until then
+    wait = blocked_until - now
+else
+    tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+    updated_at = now
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = (1 - tokens) / rate
+    end
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', updated_at, 'blocked_until', blocked_until)
+redis.call('EXPIRE', KEYS[1], 86400)
+return tostring(wait)
+"""
+REDIS_BLOCK = """
+local clock = redis.call('TIME')
+local blocked_until = tonumber(clock[1]) + tonumber(clock[2]) / 1000000 + tonumber(ARGV[1])
+if blocked_until > (tonumber(redis.call('HGET', KEYS[1], 'blocked_until')) or 0) then
+    redis.call('HSET', KEYS[1], 'blocked_until', blocked_until)
+    redis.call('EXPIRE', KEYS[1], 86400)
+end
+return 0
+"""
+
+
+class RedisCacheStore:
+    # Upstream cache entries as Redis hashes that expire once they are too
+    # stale to serve
+
+    def __init__(self, client, prefix: str):
+        self._client = client
+        self.prefix = prefix
+
+    def _key(self, platform: str, handle: str) -> str:
+        return f"{self.prefix}cache:{platform}:{handle}"
+
+    def get(self, platform: str, handle: str) -> Optional[Tuple[str, float]]:
+        payload, stored_at = self._client.hmget(self._key(platform, handle), "payload", "stored_at")
+        if payload is None or stored_at is None:
+            return None
+        return payload.decode("utf-8"), float(stored_at)
+
+    def set(self, platform: str, handle: str, payload: str, stored_at: float, expire_after: float):
+        key = self._key(platform, handle)
+        with self._client.pipeline() as pipeline:
+            pipeline.hset(key, mapping={"payload": payload, "stored_at": stored_at})
+            pipeline.expire(key, max(int(expire_after), 1))
+            pipeline.execute()
+
+    def delete(self, platform: str, handle: str):
+        self._client.delete(self._key(platform, handle))
+
+
+class RedisCoordinator(SharedCoordinator):
+    # Processes on any number of hosts share one Redis server
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = REDIS_KEY_PREFIX):
+        super().__init__()
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("COORDINATION_BACKEND=redis needs the redis package (pip install redis)")
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self.cache_store = RedisCacheStore(self._client, prefix)
+        self._acquire_script = self._client.register_script(REDIS_ACQUIRE)
+        self._release_script = self._client.register_script(REDIS_RELEASE)
+        self._take_token_script = self._client.register_script(REDIS_TAKE_TOKEN)
+        self._block_script = self._client.register_script(REDIS_BLOCK)
+
+    def _key(self, *parts: str) -> str:
+        return self.prefix + ":".join(parts)
+
+    async def acquire(self, name: str, ttl: float) -> bool:
+        acquired = await asyncio.to_thread(
+            self._acquire_script, keys=[self._key("lease", name)], args=[self.owner, int(ttl * 1000)]
+        )
+        return bool(acquired)
+
+    async def release(self, name: str):
+        await asyncio.to_thread(self._release_script, keys=[self._key("lease", name)], args=[self.owner])
+
+    async def take_token(self, bucket: str, rate: float, capacity: float) -> float:
+        wait = await asyncio.to_thread(self._take_token_script, keys=[self._key("bucket", bucket)], args=[rate, capacity])
+        return float(wait)
+
+    async def block(self, bucket: str, delay: float):
+        await asyncio.to_thread(self._block_script, keys=[self._key("bucket", bucket)], args=[delay])
+
+
+def create_coordinator(backend: str = COORDINATION_BACKEND) -> Coordinator:
+    if backend == "local":
+        return LocalCoordinator()
+    if backend == "sqlite":
+        return SQLiteCoordinator()
+    if backend == "redis":
+        return RedisCoordinator()
+    raise ValueError(f"Unknown COORDINATION_BACKEND: {backend}")
+
+
+coordinator = create_coordinator()
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import logging
+import os
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Open event streams allowed per process; further clients get a 503
+EVENT_STREAM_MAX_SUBSCRIBERS = int(os.getenv("EVENT_STREAM_MAX_SUBSCRIBERS", "10000"))
+# Seconds between keep-alive comments on an idle stream (proxies drop silent connections)
+EVENT_STREAM_KEEPALIVE = float(os.getenv("EVENT_STREAM_KEEPALIVE", "15"))
+# Events buffered for a slow client before it is sent a fresh snapshot instead
+EVENT_STREAM_QUEUE_SIZE = int(os.getenv("EVENT_STREAM_QUEUE_SIZE", "64"))
+# Milliseconds the browser waits before reconnecting a dropped stream
+EVENT_STREAM_RETRY_MS = 3000
+
+# Queued in place of the dropped events when a subscriber falls behind
+RESYNC = "resync"
+
+
+class EventBroker:
+    # Fan-out of refresh events to the open /user/{id}/events streams. An idle
+    # subscriber is one small bounded queue and a parked coroutine; nothing
+    # polls. publish() must be called from the event loop thread.
+
+    def __init__(self, max_subscribers: int = EVENT_STREAM_MAX_SUBSCRIBERS,
+                 queue_size: int = EVENT_STREAM_QUEUE_SIZE):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        self._count = 0
+
+    @property
+    def subscribers(self) -> int:
+        return self._count
+
+    @property
+    def full(self) -> bool:
+        return self._count >= self.max_subscribers
+
+    def subscribe(self, user_id: int) -> Optional[asyncio.Queue]:
+        # None when the process is at its subscriber limit
+        if self.full:
+            return None
+        queue = asyncio.Queue(self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        self._count += 1
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues is None or queue not in queues:
+            return
+        queues.discard(queue)
+        self._count -= 1
+        if not queues:
+            del self._subscribers[user_id]
+
+    def publish(self, user_id: int, event: str, data: dict):
+        for queue in self._subscribers.get(user_id, ()):
+            try:
+                queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                # The client can't keep up: drop its backlog and let it catch
+                # up from a snapshot rather than buffering without bound
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait((RESYNC, None))
+
+
+def format_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+async def stream_events(broker: EventBroker, user_id: int,
+                        snapshot: Callable[[], Awaitable[dict]],
+                        render: Callable[[str, dict], Awaitable[Optional[dict]]],
+                        keepalive: float = EVENT_STREAM_KEEPALIVE) -> AsyncIterator[str]:
+    # Body of an SSE response: a snapshot first, then one event per published
+    # change. render() may turn an event into a different payload (or None to
+    # skip it). Subscribing here, rather than before the response starts,
+    # ties the subscription to the generator, so it is released however the
+    # stream ends.
+    queue = broker.subscribe(user_id)
+    if queue is None:
+        return
+    try:
+        yield f"retry: {EVENT_STREAM_RETRY_MS}\n\n"
+        yield format_event("snapshot", await snapshot())
+        while True:
+            try:
+                event, data = await asyncio.wait_for(queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if event == RESYNC:
+                yield format_event("snapshot", await snapshot())
+                continue
+            payload = await render(event, data)
+            if payload is not None:
+                yield format_event(event, payload)
+    finally:
+        broker.unsubscribe(user_id, queue)
+
+
+broker = EventBroker()
@@ -16,18 +16,61 @@ const CHART_COLORS = {
 let ratingChart;
 let dsaChart;
 
+// Stats currently shown, updated one platform at a time by the event stream
+let currentStats = null;
+
 // Fetch user stats
-async function fetchUserStats() {
+async function fetchUserStats(userId = USER_ID) {
     try {
-        const response = await fetch(`${API_URL}/user/${USER_ID}/stats`);
+        const response = await fetch(`${API_URL}/user/${userId}/stats`);
         if (!response.ok) throw new Error('Failed to fetch user stats');
         const data = await response.json();
         updateUI(data);
+        updateRatingChart(userId);
     } catch (error) {
         console.error('Error fetching user stats:', error);
     }
 }
 
+// Follow a user's stats over server-sent events: the "snapshot" event has
+// all platforms (and is sent again after a reconnect), each finished refresh
+// job then pushes its platform's new stats. The rating history is fetched
+// again on snapshots, and after a job only if it changed that platform's
+// rating. Returns the EventSource so the caller can close it.
+function watchUserStats(userId = USER_ID, { onSnapshot, onJob } = {}) {
+    if (!window.EventSource) {
+        fetchUserStats(userId);
+        return null;
+    }
+
+    const source = new EventSource(`${API_URL}/user/${userId}/events`);
+    source.addEventListener('snapshot', (event) => {
+        const snapshot = JSON.parse(event.data);
+        currentStats = snapshot.stats;
+        updateUI(currentStats);
+        updateRatingChart(userId);
+        if (onSnapshot) onSnapshot(snapshot);
+    });
+    source.addEventListener('job', (event) => {
+        const job = JSON.parse(event.data);
+        if (job.status === 'succeeded' && job.stats && currentStats) {
+            const ratingChanged = platformRating(currentStats.platform_stats[job.platform]) !== platformRating(job.stats);
+            currentStats.platform_stats[job.platform] = job.stats;
+            currentStats.total_problems_solved = job.total_problems_solved;
+            updateUI(currentStats);
+            if (ratingChanged) updateRatingChart(userId);
+        }
+        if (onJob) onJob(job);
+    });
+    return source;
+}
+
+// Rating shown in the rating chart (LeetCode reports a contest rating)
+function platformRating(stats) {
+    if (!stats) return null;
+    return stats.rating ?? stats.contest_rating ?? null;
+}
+
 // Update UI with fetched data
 function updateUI(data) {
     // Update total stats
@@ -38,7 +81,6 @@ function updateUI(data) {
     
     // Update charts
     updateDSAChart(data.platform_stats.leetcode);
-    updateRatingChart(data.platform_stats);
     
     // Update rankings
     updateRankings(data.platform_stats);
@@ -107,37 +149,47 @@ function updateDSAChart(leetcodeStats) {
 }
 
 // Update rating chart
-function updateRatingChart(stats) {
+async function updateRatingChart(userId = USER_ID) {
     const ctx = document.getElementById('ratingChart').getContext('2d');
-    
+
+    // Downsampled rating history, one series per platform
+    let series = {};
+    try {
+        const response = await fetch(`${API_URL}/user/${userId}/history?metric=rating&buckets=60`);
+        if (!response.ok) throw new Error('Failed to fetch rating history');
+        series = (await response.json()).series;
+    } catch (error) {
+        console.error('Error fetching rating history:', error);
+    }
+
     if (ratingChart) {
         ratingChart.destroy();
     }
 
-    // Sample data - you'll need to implement actual rating history
-    const ratings = {
-        leetcode: stats.leetcode.contest_rating || 0,
-        codechef: stats.codechef.rating || 0,
-        codeforces: stats.codeforces.rating || 0
-    };
+    const datasets = Object.entries(series)
+        .filter(([, points]) => points.length > 0)
+        .map(([platform, points]) => ({
+            label: platform,
+            data: points.map(point => ({ x: Date.parse(point.last_recorded_at + 'Z'), y: point.last })),
+            borderColor: CHART_COLORS[platform],
+            stepped: true,
+            fill: false
+        }));
 
     ratingChart = new Chart(ctx, {
         type: 'line',
-        data: {
-            labels: ['LeetCode', 'CodeChef', 'CodeForces'],
-            datasets: [{
-                label: 'Rating',
-                data: Object.values(ratings),
-                borderColor: CHART_COLORS.leetcode,
-                tension: 0.4,
-                fill: false
-            }]
-        },
+        data: { datasets },
         options: {
             responsive: true,
             scales: {
+                x: {
+                    type: 'linear',
+                    ticks: {
+                        callback: value => new Date(value).toLocaleDateString()
+                    }
+                },
                 y: {
-                    beginAtZero: true
+                    beginAtZero: false
                 }
             }
         }
@@ -201,5 +253,8 @@ function updateTopicAnalysis(tags) {
 
 // Initialize
 document.addEventListener('DOMContentLoaded', () => {
-    fetchUserStats();
+    // Only the dashboard; profile.html loads it after the form is submitted
+    if (document.querySelector('.total-questions')) {
+        watchUserStats();
+    }
 }); 
\ No newline at end of file
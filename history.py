@@ -0,0 +1,144 @@
+import calendar
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import BigInteger, case, func
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import FunctionElement
+
+from platforms import registry
+
+HISTORY_DEFAULT_BUCKETS = 100
+HISTORY_MAX_BUCKETS = 1000
+
+
+class epoch_seconds(FunctionElement):
+    # Whole seconds since the Unix epoch of a naive UTC timestamp column
+    type = BigInteger()
+    inherit_cache = True
+
+
+@compiles(epoch_seconds)
+def _epoch_seconds_default(element, compiler, **kw):
+    return f"CAST(FLOOR(EXTRACT(EPOCH FROM {compiler.process(element.clauses, **kw)})) AS BIGINT)"
+
+
+@compiles(epoch_seconds, "sqlite")
+def _epoch_seconds_sqlite(element, compiler, **kw):
+    return f"CAST(strftime('%s', {compiler.process(element.clauses, **kw)}) AS INTEGER)"
+
+
+def history_metrics() -> Dict[str, Dict[str, str]]:
+    # Metrics that can be charted, mapped to the column of each platform's stats table
+    metrics: Dict[str, Dict[str, str]] = {}
+    for adapter in registry:
+        for metric, column in adapter.history_columns.items():
+            metrics.setdefault(metric, {})[adapter.name] = column
+    return metrics
+
+
+def to_naive_utc(value: datetime) -> datetime:
+    # Snapshots are stored as naive UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _series(db: Session, platform: str, column_name: str, user_id: int,
+            start: datetime, end: datetime, bucket_seconds: int) -> List[dict]:
+    model = registry.get(platform).model
+    value = getattr(model, column_name)
+    start_epoch = calendar.timegm(start.timetuple())
+
+    # One row per snapshot in range, numbered newest first within its bucket
+    bucket = ((epoch_seconds(model.recorded_at) - start_epoch) // bucket_seconds).label("bucket")
+    position = func.row_number().over(
+        partition_by=bucket, order_by=(model.recorded_at.desc(), model.id.desc())
+    ).label("position")
+    points = db.query(
+        bucket, value.label("value"), model.recorded_at.label("recorded_at"), position
+    ).filter(
+        model.user_id == user_id,
+        model.recorded_at >= start,
+        model.recorded_at < end,
+        value.isnot(None)
+    ).subquery()
+
+    rows = db.query(
+        points.c.bucket,
+        func.min(points.c.value),
+        func.max(points.c.value),
+        func.max(case((points.c.position == 1, points.c.value))),
+        func.max(points.c.recorded_at),
+        func.count()
+    ).group_by(points.c.bucket).order_by(points.c.bucket).all()
+
+    return [
+        {
+            "start": (start + timedelta(seconds=index * bucket_seconds)).isoformat(),
+            "min": minimum,
+            "max": maximum,
+            "last": last,
+            "last_recorded_at": last_recorded_at.isoformat() if isinstance(last_recorded_at, datetime) else last_recorded_at,
+            "count": count
+        }
+        for index, minimum, maximum, last, last_recorded_at, count in rows
+    ]
+
+
+def _first_recorded(db: Session, platforms: List[str], user_id: int) -> Optional[datetime]:
+    firsts = []
+    for platform in platforms:
+        model = registry.get(platform).model
+        first = db.query(func.min(model.recorded_at)).filter(model.user_id == user_id).scalar()
+        if isinstance(first, str):
+            first = datetime.fromisoformat(first)
+        if first is not None:
+            firsts.append(first)
+    return min(firsts) if firsts else None
+
+
+def get_history(db: Session, user_id: int, metric: str = "total_solved", platform: Optional[str] = None,
+                start: Optional[datetime] = None, end: Optional[datetime] = None,
+                buckets: int = HISTORY_DEFAULT_BUCKETS) -> dict:
+    # Downsampled time series of one metric: the range is split into at most
+    # `buckets` equal intervals and each non-empty one reports the min, max
+    # and last value recorded in it. An unchanged value is stored once, so a
+    # bucket without points means the previous value still held.
+    metrics = history_metrics()
+    if metric not in metrics:
+        raise ValueError(f"metric must be one of {', '.join(metrics)}")
+    columns = metrics[metric]
+    if platform is not None:
+        if platform not in registry:
+            raise ValueError(f"Unknown platform: {platform}")
+        if platform not in columns:
+            raise ValueError(f"{platform} has no {metric} history")
+        columns = {platform: columns[platform]}
+    if not 1 <= buckets <= HISTORY_MAX_BUCKETS:
+        raise ValueError(f"buckets must be between 1 and {HISTORY_MAX_BUCKETS}")
+
+    end = to_naive_utc(end) if end is not None else datetime.utcnow()
+    start = to_naive_utc(start) if start is not None else _first_recorded(db, list(columns), user_id)
+    if start is None:
+        start = end
+    if start > end:
+        raise ValueError("from must not be after to")
+
+    # Whole-second buckets over the half-open range [from, to)
+    start = start.replace(microsecond=0)
+    bucket_seconds = max(1, math.ceil((end - start).total_seconds() / buckets))
+    series: Dict[str, List[dict]] = {
+        platform_name: _series(db, platform_name, column_name, user_id, start, end, bucket_seconds)
+        for platform_name, column_name in columns.items()
+    }
+    return {
+        "user_id": user_id,
+        "metric": metric,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "bucket_seconds": bucket_seconds,
+        "series": series
+    }
@@ -0,0 +1,190 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import aiohttp
+
+from rate_limit import rate_limiter, concurrency_limiter
+from circuit_breaker import circuit_breakers
+from metrics import (
+    GaugeFunction, UPSTREAM_REQUEST_SECONDS, UPSTREAM_TIMEOUTS, UPSTREAM_RATE_LIMITED, UPSTREAM_CIRCUIT_REJECTED
+)
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+# Connection pool settings (overridable from the environment)
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", "10"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+
+# Where each platform is reached (benchmarks point these at a local stub)
+UPSTREAM_BASE_URLS = {
+    "leetcode": os.getenv("LEETCODE_BASE_URL", "https://leetcode.com"),
+    "codechef": os.getenv("CODECHEF_BASE_URL", "https://www.codechef.com"),
+    "codeforces": os.getenv("CODEFORCES_BASE_URL", "https://codeforces.com"),
+}
+
+# One pooled session per process, bound to the event loop that created it
+_session: Optional[aiohttp.ClientSession] = None
+_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def upstream_url(platform: str, path: str) -> str:
+    return UPSTREAM_BASE_URLS[platform].rstrip("/") + path
+
+
+def _build_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_LIMIT_PER_HOST,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        use_dns_cache=True,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+        headers={'User-Agent': USER_AGENT},
+    )
+
+
+async def get_session() -> aiohttp.ClientSession:
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        _session = _build_session()
+        _session_loop = loop
+    return _session
+
+
+async def close_session():
+    global _session, _session_loop
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+    _session_loop = None
+
+
+class UpstreamError(Exception):
+    # The platform is throttling us (429) or failing (5xx)
+    def __init__(self, platform: str, status: int, message: str):
+        super().__init__(message)
+        self.platform = platform
+        self.status = status
+
+
+def _retry_after(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class CircuitOpenError(UpstreamError):
+    # The platform has been failing; the request was not sent
+    pass
+
+
+@asynccontextmanager
+async def upstream_request(platform: str, method: str, url: str, **kwargs):
+    # Every call to a platform goes through here so it is rate limited,
+    # backs off when the platform pushes back, fails fast while the platform
+    # is down and keeps its concurrency to what the platform handles well
+    breaker = circuit_breakers.breaker(platform)
+    if not breaker.allow():
+        UPSTREAM_CIRCUIT_REJECTED.inc(platform=platform)
+        raise CircuitOpenError(
+            platform, 503, f"{platform} circuit is open, retrying in {breaker.retry_in():.0f}s"
+        )
+    limiter = concurrency_limiter.limiter(platform)
+
+    def failed(outcome: str):
+        breaker.record_failure()
+        limiter.on_failure()
+        UPSTREAM_REQUEST_SECONDS.observe(time.monotonic() - started, platform=platform, outcome=outcome)
+        if outcome == "timeout":
+            UPSTREAM_TIMEOUTS.inc(platform=platform)
+
+    recorded = False
+    try:
+        await rate_limiter.acquire(platform)
+        await limiter.acquire()
+        try:
+            session = await get_session()
+            started = time.monotonic()
+            try:
+                response = await session.request(method, url, **kwargs)
+            except asyncio.TimeoutError:
+                recorded = True
+                failed("timeout")
+                raise
+            except aiohttp.ClientError:
+                recorded = True
+                failed("connection_error")
+                raise
+            async with response:
+                if response.status == 429 or response.status >= 500:
+                    recorded = True
+                    if response.status == 429:
+                        UPSTREAM_RATE_LIMITED.inc(platform=platform)
+                    failed("rate_limited" if response.status == 429 else "server_error")
+                    delay = rate_limiter.backoff(platform, _retry_after(response.headers.get("Retry-After")))
+                    raise UpstreamError(
+                        platform, response.status,
+                        f"{platform} returned status code {response.status}, backing off for {delay:.0f}s"
+                    )
+                rate_limiter.success(platform)
+                try:
+                    yield response
+                except asyncio.TimeoutError:
+                    # Reading the body timed out or broke off
+                    recorded = True
+                    failed("timeout")
+                    raise
+                except aiohttp.ClientError:
+                    recorded = True
+                    failed("connection_error")
+                    raise
+                recorded = True
+                latency = time.monotonic() - started
+                breaker.record_success()
+                limiter.on_success(latency)
+                UPSTREAM_REQUEST_SECONDS.observe(latency, platform=platform, outcome="success")
+        finally:
+            await limiter.release()
+    finally:
+        if not recorded:
+            breaker.release_probe()
+
+
+def upstream_state() -> dict:
+    # Per platform: circuit breaker, adaptive concurrency and rate limit state
+    circuits = circuit_breakers.state()
+    concurrency = concurrency_limiter.state()
+    rates = rate_limiter.state()
+    return {
+        platform: {
+            "circuit": circuits.get(platform),
+            "concurrency": concurrency.get(platform),
+            "rate_limit": rates.get(platform),
+        }
+        for platform in sorted(set(circuits) | set(concurrency) | set(rates))
+    }
+
+
+GaugeFunction(
+    "upstream_concurrency_limit", "Current adaptive concurrency limit per platform", ("platform",),
+    lambda: {(platform,): state["limit"] for platform, state in concurrency_limiter.state().items()}
+)
+GaugeFunction(
+    "upstream_in_flight_requests", "Requests to a platform currently in flight", ("platform",),
+    lambda: {(platform,): state["in_flight"] for platform, state in concurrency_limiter.state().items()}
+)
+GaugeFunction(
+    "upstream_circuit_open", "1 while a platform's circuit breaker is open or half-open", ("platform",),
+    lambda: {(platform,): int(state["state"] != "closed") for platform, state in circuit_breakers.state().items()}
+)
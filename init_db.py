@@ -1,6 +1,21 @@
-from models import init_db
+from models import init_db, SessionLocal
+from snapshots import backfill_latest_stats, compact_history
+from profiles import migrate_profile_handles
+from solved import backfill_solved_problems
 
 if __name__ == "__main__":
     print("Initializing database...")
     init_db()
-    print("Database initialized successfully!") 
\ No newline at end of file
+    db = SessionLocal()
+    try:
+        merged, indexed = migrate_profile_handles(db)
+        print(f"Merged {merged} duplicate profiles, indexed {indexed} handles")
+        solved = backfill_solved_problems(db)
+        print(f"Indexed {solved} solved Codeforces problems")
+        count = backfill_latest_stats(db)
+        print(f"Indexed latest snapshots for {count} user/platform pairs")
+        removed = compact_history(db)
+        print(f"Compacted history: removed {removed} old snapshots")
+    finally:
+        db.close()
+    print("Database initialized successfully!")
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import os
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from metrics import REFRESH_JOBS, REFRESH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+REFRESH_WORKERS = int(os.getenv("REFRESH_WORKERS", "4"))
+REFRESH_JOB_TIMEOUT = float(os.getenv("REFRESH_JOB_TIMEOUT", "30"))
+# Finished jobs kept around for GET /jobs/{id}
+JOB_HISTORY_LIMIT = int(os.getenv("JOB_HISTORY_LIMIT", "10000"))
+
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class Job:
+    def __init__(self, user_id: int, platform: str, url: str, allow_stale: bool = True):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.platform = platform
+        self.url = url
+        # False when the caller needs data newer than the upstream cache's TTL
+        self.allow_stale = allow_stale
+        self.status = PENDING
+        self.error: Optional[str] = None
+        self.merged_requests = 0
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        # Set by the JobQueue once the job has finished
+        self.finished = asyncio.Event()
+
+    @property
+    def key(self) -> Tuple[int, str]:
+        return (self.user_id, self.platform)
+
+    @property
+    def done(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "user_id": self.user_id,
+            "platform": self.platform,
+            "status": self.status,
+            "error": self.error,
+            "merged_requests": self.merged_requests,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+def record_finished(job: Job, seconds: float, outcome: str):
+    # Metrics of a finished refresh, run by the queue or in a batch. outcome
+    # is "success", "failure" (the fetch found nothing), "timeout" or "error".
+    REFRESH_JOBS.inc(platform=job.platform, status=job.status)
+    REFRESH_SECONDS.observe(seconds, platform=job.platform, outcome=outcome)
+
+
+class JobQueue:
+    # In-process refresh queue. While a job for a (user_id, platform) pair is
+    # pending or running, further requests for the same pair are merged into it.
+
+    def __init__(self, runner: Callable[[Job], Awaitable[bool]], workers: int = REFRESH_WORKERS,
+                 job_timeout: float = REFRESH_JOB_TIMEOUT, history_limit: int = JOB_HISTORY_LIMIT,
+                 on_change: Optional[Callable[[Job], None]] = None):
+        self._runner = runner
+        # Called whenever a job is created, starts or finishes
+        self._on_change = on_change
+        self._worker_count = workers
+        self._job_timeout = job_timeout
+        self._history_limit = history_limit
+        self._queue: Optional[asyncio.Queue] = None
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._active: Dict[Tuple[int, str], Job] = {}
+        self._workers = []
+
+    def start(self):
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+        # Re-queue anything enqueued before the workers were started
+        for job in self._active.values():
+            if job.status == PENDING:
+                self._queue.put_nowait(job)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self._worker_count)]
+        logger.info(f"Started {self._worker_count} refresh workers")
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    def enqueue(self, user_id: int, platform: str, url: str, allow_stale: bool = True) -> Job:
+        job = self._active.get((user_id, platform))
+        if job is not None:
+            job.url = url
+            job.merged_requests += 1
+            if job.status == PENDING:
+                job.allow_stale = job.allow_stale and allow_stale
+            return job
+
+        job = Job(user_id, platform, url, allow_stale)
+        self._jobs[job.id] = job
+        self._active[job.key] = job
+        if self._queue is not None:
+            self._queue.put_nowait(job)
+        self._trim_history()
+        self._notify(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def active_jobs(self, user_id: int) -> List[Job]:
+        return [job for key, job in self._active.items() if key[0] == user_id]
+
+    def is_active(self, user_id: int, platform: str) -> bool:
+        return (user_id, platform) in self._active
+
+    @property
+    def backlog(self) -> int:
+        # Jobs pending or running
+        return len(self._active)
+
+    def _notify(self, job: Job):
+        if self._on_change is None:
+            return
+        try:
+            self._on_change(job)
+        except Exception as e:
+            logger.error(f"Job listener failed for {job.id}: {str(e)}")
+
+    def _trim_history(self):
+        while len(self._jobs) > self._history_limit:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if not oldest.done:
+                break
+            del self._jobs[oldest_id]
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.status = RUNNING
+            job.started_at = datetime.utcnow()
+            self._notify(job)
+            started = time.monotonic()
+            outcome = "error"
+            try:
+                ok = await asyncio.wait_for(self._runner(job), timeout=self._job_timeout)
+                job.status = SUCCEEDED if ok else FAILED
+                outcome = "success" if ok else "failure"
+                if not ok:
+                    job.error = "Fetch failed"
+            except asyncio.TimeoutError:
+                job.status = FAILED
+                job.error = "Timed out"
+                outcome = "timeout"
+                logger.warning(f"Refresh job {job.id} ({job.platform}) timed out")
+            except Exception as e:
+                job.status = FAILED
+                job.error = str(e)
+                logger.error(f"Refresh job {job.id} failed: {str(e)}")
+                logger.error(traceback.format_exc())
+            finally:
+                job.finished_at = datetime.utcnow()
+                record_finished(job, time.monotonic() - started, outcome)
+                # From here on a new request for this profile schedules a fresh job
+                if self._active.get(job.key) is job:
+                    del self._active[job.key]
+                job.finished.set()
+                self._notify(job)
+                self._queue.task_done()
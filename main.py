@@ -1,24 +1,116 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Query, Header, Request
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, Dict
-import requests
-from bs4 import BeautifulSoup
+from pydantic import BaseModel, create_model
+from typing import Optional, Dict, List, Tuple
 import json
 from datetime import datetime
+from contextlib import asynccontextmanager
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 import asyncio
-from requests.exceptions import Timeout, RequestException
+import time
 import traceback
 import logging
+import os
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+from log_config import configure_logging
+
+# Set up logging (LOG_LEVEL, LOG_FORMAT)
+configure_logging()
 logger = logging.getLogger(__name__)
 
-from models import get_db, UserProfile, LeetCodeStats, CodeChefStats, CodeForcesStats
+from models import run_in_session, dispose_engines, UserProfile
+from http_client import upstream_state, close_session
+from jobs import JobQueue, Job, SUCCEEDED
+from scheduler import RefreshScheduler, ViewTracker, run_history_compaction
+from platforms import registry
+from platforms.refresh import run_refresh_job
+from snapshots import get_latest_stats, stream_batch_stats_json, get_leaderboard
+from response_cache import stats_response_cache, etag_matches
+from history import get_history, HISTORY_DEFAULT_BUCKETS, HISTORY_MAX_BUCKETS
+from solved import get_solved, get_tag_counts, SOLVED_DEFAULT_LIMIT, SOLVED_MAX_LIMIT
+from metrics import render as render_metrics, GaugeFunction, HTTP_REQUEST_SECONDS
+from events import broker, stream_events
+from profiles import canonical_profiles, HandleIndex
+from roster import RosterImporter, iter_lines, roster_format
+
+def publish_job(job: Job):
+    # Push job progress to the user's open /user/{id}/events streams
+    broker.publish(job.user_id, "job", job.to_dict())
+
+job_queue = JobQueue(run_refresh_job, on_change=publish_job)
+roster_importer = RosterImporter(job_queue.enqueue, job_queue.is_active, on_job_done=publish_job)
+view_tracker = ViewTracker()
+
+GaugeFunction("refresh_job_backlog", "Refresh jobs queued or running", (), lambda: {(): job_queue.backlog})
+GaugeFunction("event_stream_subscribers", "Open /user/{id}/events streams", (), lambda: {(): broker.subscribers})
+
+# Run the periodic refresh scheduler inside the API process (alternatively
+# run `python scheduler.py` as a separate worker)
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "0") == "1"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    job_queue.start()
+    background = [asyncio.create_task(view_tracker.run())]
+    if SCHEDULER_ENABLED:
+        scheduler = RefreshScheduler(
+            job_queue.enqueue, lambda: job_queue.backlog, job_queue.is_active, on_job_done=publish_job
+        )
+        background.append(asyncio.create_task(scheduler.run()))
+        background.append(asyncio.create_task(run_history_compaction()))
+    yield
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    await view_tracker.flush()
+    await job_queue.stop()
+    await roster_importer.stop()
+    # Release pooled upstream and database connections
+    await close_session()
+    await dispose_engines()
+
+app = FastAPI(title="Profile Tracker API", lifespan=lifespan)
+
+class MetricsMiddleware:
+    # Records the latency of every request, labelled with the route template
+    # (not the raw path, which would make a series per user id)
+    def __init__(self, app):
+        self.app = app
+        self._routes: Dict[object, str] = {}
 
-app = FastAPI(title="Profile Tracker API")
+    def route_path(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if endpoint not in self._routes:
+            paths = [route.path for route in scope["app"].routes if getattr(route, "endpoint", None) is endpoint]
+            self._routes[endpoint] = paths[0] if paths else "unmatched"
+        return self._routes[endpoint]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                route=self.route_path(scope), method=scope["method"], status=str(status)
+            )
+
+app.add_middleware(MetricsMiddleware)
 
 # Enable CORS
 app.add_middleware(
@@ -29,10 +121,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-class ProfileURLs(BaseModel):
-    leetcode_url: Optional[str] = None
-    codechef_url: Optional[str] = None
-    codeforces_url: Optional[str] = None
+# One optional URL field per registered platform, e.g. leetcode_url
+ProfileURLs = create_model(
+    "ProfileURLs", **{adapter.url_field: (Optional[str], None) for adapter in registry}
+)
+
+class UserIds(BaseModel):
+    user_ids: List[int]
+
+# Upper bound on user ids accepted by /users/stats:batch
+BATCH_STATS_MAX_USERS = 10000
 
 class ProblemStats(BaseModel):
     total_solved: int
@@ -43,475 +141,223 @@ class ProblemStats(BaseModel):
 async def root():
     return {"message": "Welcome to Profile Tracker API"}
 
+# Attempts at storing a profile whose new handles another request is
+# inserting at the same time
+UPSERT_ATTEMPTS = 3
+
+def upsert_profile(db: Session, profiles: ProfileURLs) -> Tuple[int, Dict[str, str]]:
+    # Returns the profile id and the canonical URL of each submitted platform
+    canonical = canonical_profiles({adapter.url_field: getattr(profiles, adapter.url_field) for adapter in registry})
+    for attempt in range(UPSERT_ATTEMPTS):
+        try:
+            return _upsert_profile(db, canonical)
+        except IntegrityError:
+            # A concurrent request took one of the handles first; the retry
+            # finds its profile and updates that one
+            db.rollback()
+            if attempt == UPSERT_ATTEMPTS - 1:
+                raise
+            logger.info("Handle claimed by a concurrent request, retrying profile upsert")
+
+def _upsert_profile(db: Session, canonical: Dict[str, Tuple[str, str]]) -> Tuple[int, Dict[str, str]]:
+    # Check if profile already exists with any of these handles
+    index = HandleIndex(db, ((platform, handle) for platform, (handle, _) in canonical.items()))
+    user_profile = index.find(canonical)
+
+    if user_profile:
+        logger.info(f"Updating existing profile with ID: {user_profile.id}")
+        user_profile.updated_at = datetime.utcnow()
+    else:
+        logger.info("Creating new user profile")
+        user_profile = UserProfile(**{adapter.url_field: "" for adapter in registry})
+        db.add(user_profile)
+        db.flush()
+        logger.info(f"Created user profile with ID: {user_profile.id}")
+    for platform, (handle, url) in canonical.items():
+        index.assign(user_profile, platform, handle, url)
+    user_id = user_profile.id
+    index.commit()
+    return user_id, {platform: url for platform, (_, url) in canonical.items()}
+
 @app.post("/track-profiles")
-async def track_profiles(profiles: ProfileURLs, db: Session = Depends(get_db)):
+async def track_profiles(profiles: ProfileURLs):
     try:
         logger.info("Received profile tracking request")
+        user_id, urls = await run_in_session(upsert_profile, profiles)
         
-        # Check if profile already exists with any of these URLs
-        existing_profile = None
-        if profiles.leetcode_url:
-            existing_profile = db.query(UserProfile).filter(UserProfile.leetcode_url == profiles.leetcode_url).first()
-        if not existing_profile and profiles.codechef_url:
-            existing_profile = db.query(UserProfile).filter(UserProfile.codechef_url == profiles.codechef_url).first()
-        if not existing_profile and profiles.codeforces_url:
-            existing_profile = db.query(UserProfile).filter(UserProfile.codeforces_url == profiles.codeforces_url).first()
-
-        if existing_profile:
-            logger.info(f"Updating existing profile with ID: {existing_profile.id}")
-            # Update existing profile
-            if profiles.leetcode_url:
-                existing_profile.leetcode_url = profiles.leetcode_url
-            if profiles.codechef_url:
-                existing_profile.codechef_url = profiles.codechef_url
-            if profiles.codeforces_url:
-                existing_profile.codeforces_url = profiles.codeforces_url
-            existing_profile.updated_at = datetime.utcnow()
-            db.commit()
-            user_profile = existing_profile
-        else:
-            logger.info("Creating new user profile")
-            # Create new profile
-            user_profile = UserProfile(
-                leetcode_url=profiles.leetcode_url or "",
-                codechef_url=profiles.codechef_url or "",
-                codeforces_url=profiles.codeforces_url or ""
-            )
-            db.add(user_profile)
-            db.commit()
-            db.refresh(user_profile)
-            logger.info(f"Created user profile with ID: {user_profile.id}")
-        
-        # Create tasks for each platform
-        tasks = []
-        if profiles.leetcode_url:
-            tasks.append(fetch_leetcode_stats(user_profile.id, profiles.leetcode_url, db))
-        if profiles.codechef_url:
-            tasks.append(fetch_codechef_stats(user_profile.id, profiles.codechef_url, db))
-        if profiles.codeforces_url:
-            tasks.append(fetch_codeforces_stats(user_profile.id, profiles.codeforces_url, db))
-        
-        if tasks:
-            try:
-                logger.info("Starting to fetch platform stats")
-                await asyncio.wait_for(asyncio.gather(*tasks), timeout=30)
-                logger.info("Successfully fetched all platform stats")
-            except asyncio.TimeoutError:
-                logger.warning("Some requests timed out")
-                return {
-                    "message": "Profiles partially tracked (some requests timed out)",
-                    "user_id": user_profile.id,
-                    "status": "partial"
-                }
-            except Exception as e:
-                logger.error(f"Error during stats fetching: {str(e)}")
-                logger.error(traceback.format_exc())
-                return {
-                    "message": "Profiles partially tracked (some errors occurred)",
-                    "user_id": user_profile.id,
-                    "status": "partial"
-                }
+        # Queue a refresh job for each platform; the fetch happens in the background.
+        # Like the scheduler, it waits for fresh data instead of storing a stale
+        # cache entry, whose revalidation would only reach the cache.
+        jobs = {platform: job_queue.enqueue(user_id, platform, url, allow_stale=False) for platform, url in urls.items()}
+        logger.info(f"Queued {len(jobs)} refresh jobs for user {user_id}")
         
         return {
-            "message": "Profiles tracked successfully",
-            "user_id": user_profile.id,
-            "status": "success"
+            "message": "Profiles tracked successfully, refresh queued",
+            "user_id": user_id,
+            "status": "queued",
+            "jobs": {platform: job.id for platform, job in jobs.items()}
         }
     except Exception as e:
         logger.error(f"Unexpected error in track_profiles: {str(e)}")
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/user/{user_id}/stats")
-async def get_user_stats(user_id: int, db: Session = Depends(get_db)):
+@app.post("/profiles:import", status_code=202)
+async def import_profiles(request: Request, format: Optional[str] = None):
+    # Roster as CSV (header row of URL fields) or JSONL (one object per
+    # line), read as it streams in. Responds once every row is stored; the
+    # first fetches continue in the background, see GET /imports/{id}.
     try:
-        # Fetch latest stats from each platform
-        leetcode_stats = db.query(LeetCodeStats).filter(
-            LeetCodeStats.user_id == user_id
-        ).order_by(LeetCodeStats.recorded_at.desc()).first()
-        
-        codechef_stats = db.query(CodeChefStats).filter(
-            CodeChefStats.user_id == user_id
-        ).order_by(CodeChefStats.recorded_at.desc()).first()
-        
-        codeforces_stats = db.query(CodeForcesStats).filter(
-            CodeForcesStats.user_id == user_id
-        ).order_by(CodeForcesStats.recorded_at.desc()).first()
-        
-        total_solved = (
-            (leetcode_stats.total_problems_solved if leetcode_stats else 0) +
-            (codechef_stats.total_problems_solved if codechef_stats else 0) +
-            (codeforces_stats.total_problems_solved if codeforces_stats else 0)
-        )
-        
-        return {
-            "total_problems_solved": total_solved,
-            "platform_stats": {
-                "leetcode": {
-                    "total_solved": leetcode_stats.total_problems_solved if leetcode_stats else 0,
-                    "easy_solved": leetcode_stats.easy_solved if leetcode_stats else 0,
-                    "medium_solved": leetcode_stats.medium_solved if leetcode_stats else 0,
-                    "hard_solved": leetcode_stats.hard_solved if leetcode_stats else 0,
-                    "contest_rating": leetcode_stats.contest_rating if leetcode_stats else None,
-                    "contests_participated": leetcode_stats.contests_participated if leetcode_stats else 0
-                },
-                "codechef": {
-                    "total_solved": codechef_stats.total_problems_solved if codechef_stats else 0,
-                    "rating": codechef_stats.contest_rating if codechef_stats else None,
-                    "highest_rating": codechef_stats.highest_rating if codechef_stats else None,
-                    "contests_participated": codechef_stats.contests_participated if codechef_stats else 0,
-                    "categories": codechef_stats.problem_categories if codechef_stats else {}
-                },
-                "codeforces": {
-                    "total_solved": codeforces_stats.total_problems_solved if codeforces_stats else 0,
-                    "rating": codeforces_stats.contest_rating if codeforces_stats else None,
-                    "rank": codeforces_stats.rank if codeforces_stats else None,
-                    "contests_participated": codeforces_stats.contests_participated if codeforces_stats else 0,
-                    "problem_tags": codeforces_stats.problem_tags if codeforces_stats else {}
-                }
-            }
+        fmt = roster_format(request.headers.get("content-type"), format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    roster_import = await roster_importer.run(iter_lines(request.stream()), fmt)
+    return roster_import.to_dict()
+
+@app.get("/imports/{import_id}")
+async def get_import(import_id: str):
+    roster_import = roster_importer.get(import_id)
+    if roster_import is None:
+        raise HTTPException(status_code=404, detail="Import not found")
+    return roster_import.to_dict()
+
+@app.get("/platforms")
+async def platforms():
+    # Supported judges: the /track-profiles field for each and what it reports
+    return [
+        {
+            "name": adapter.name,
+            "display_name": adapter.display_name,
+            "url_field": adapter.url_field,
+            "stats": list(adapter.empty_stats),
+            "history_metrics": list(adapter.history_columns),
         }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        for adapter in registry
+    ]
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 
-async def fetch_leetcode_stats(user_id: int, leetcode_url: str, db: Session):
+async def load_user_stats(user_id: int):
+    # Latest snapshot of every platform in a single query, rendered once
+    # and served from memory until a new snapshot is saved
+    return await stats_response_cache.get_or_load(user_id, lambda: run_in_session(get_latest_stats, user_id))
+
+@app.get("/user/{user_id}/stats")
+async def get_user_stats(user_id: int, if_none_match: Optional[str] = Header(None)):
     try:
-        # Skip if URL is empty
-        if not leetcode_url:
-            print("LeetCode URL is empty, skipping")
-            return
+        view_tracker.record(user_id)
+        body, etag = await load_user_stats(user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
-        # Extract username from URL and clean it
-        username = leetcode_url.strip('/').split('/')[-1]
-        # Handle both formats: /u/username and /username
-        if username == 'u':
-            username = leetcode_url.strip('/').split('/')[-2]
-            
-        if not username:
-            print("Invalid LeetCode URL format")
-            return
+@app.get("/user/{user_id}/events")
+async def user_events(user_id: int):
+    # Server-sent events: a "snapshot" of the stats and active jobs, then a
+    # "job" event whenever one of the user's refresh jobs is queued, starts
+    # or finishes; finished jobs carry the platform's new stats
+    if broker.full:
+        raise HTTPException(status_code=503, detail="Too many open event streams")
+    view_tracker.record(user_id)
 
-        print(f"Fetching LeetCode stats for user: {username}")
-        
-        # Use GraphQL API for more accurate data
-        url = "https://leetcode.com/graphql"
-        query = """
-        query getUserProfile($username: String!) {
-            matchedUser(username: $username) {
-                username
-                submitStats: submitStatsGlobal {
-                    acSubmissionNum {
-                        difficulty
-                        count
-                    }
-                }
-            }
-        }
-        """
-        
-        headers = {
-            'Content-Type': 'application/json',
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+    async def snapshot():
+        body, _ = await load_user_stats(user_id)
+        return {
+            "user_id": user_id,
+            "stats": json.loads(body),
+            "jobs": [job.to_dict() for job in job_queue.active_jobs(user_id)]
         }
-        
-        response = requests.post(
-            url,
-            json={
-                'query': query,
-                'variables': {'username': username}
-            },
-            headers=headers,
-            timeout=10
-        )
-        
-        # Check response status
-        if response.status_code != 200:
-            print(f"LeetCode API returned status code: {response.status_code}")
-            print(f"Response content: {response.text}")
-            return
-            
-        data = response.json()
-        print(f"LeetCode API Response: {json.dumps(data, indent=2)}")
 
-        if 'errors' in data:
-            print(f"LeetCode API error: {data['errors']}")
-            return
+    async def render(event: str, job: dict) -> dict:
+        if job["status"] != SUCCEEDED:
+            return job
+        body, _ = await load_user_stats(user_id)
+        stats = json.loads(body)
+        return {
+            **job,
+            "stats": stats["platform_stats"].get(job["platform"]),
+            "total_problems_solved": stats["total_problems_solved"]
+        }
 
-        user_data = data.get('data', {}).get('matchedUser')
-        if not user_data:
-            print(f"No data found for user: {username}")
-            return
+    return StreamingResponse(
+        stream_events(broker, user_id, snapshot, render),
+        media_type="text/event-stream",
+        # X-Accel-Buffering stops nginx from holding events back
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-        # Get submission stats
-        submit_stats = user_data.get('submitStats', {}).get('acSubmissionNum', [])
-        
-        # Calculate problems by difficulty
-        easy_solved = 0
-        medium_solved = 0
-        hard_solved = 0
-        
-        for stat in submit_stats:
-            difficulty = stat.get('difficulty')
-            count = stat.get('count', 0)
-            if difficulty == 'Easy':
-                easy_solved = count
-            elif difficulty == 'Medium':
-                medium_solved = count
-            elif difficulty == 'Hard':
-                hard_solved = count
-        
-        total_solved = easy_solved + medium_solved + hard_solved
-        
-        print(f"Found stats for {username}:")
-        print(f"Total solved: {total_solved}")
-        print(f"Easy: {easy_solved}")
-        print(f"Medium: {medium_solved}")
-        print(f"Hard: {hard_solved}")
-        
-        # Create new stats record
-        stats = LeetCodeStats(
-            user_id=user_id,
-            total_problems_solved=total_solved,
-            easy_solved=easy_solved,
-            medium_solved=medium_solved,
-            hard_solved=hard_solved,
-            contests_participated=0,
-            contest_rating=None,
-            global_rank=0
-        )
-        
-        db.add(stats)
-        db.commit()
-        print(f"Successfully saved LeetCode stats for {username}")
-        
-    except Timeout:
-        print(f"Timeout while fetching LeetCode stats for {username}")
-    except RequestException as e:
-        print(f"Network error while fetching LeetCode stats: {str(e)}")
-    except Exception as e:
-        print(f"Error fetching LeetCode stats: {str(e)}")
-        print(traceback.format_exc())
-        
-    return None
+@app.post("/users/stats:batch")
+async def get_users_stats_batch(request: UserIds):
+    if len(request.user_ids) > BATCH_STATS_MAX_USERS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_STATS_MAX_USERS} user ids per request")
+    return StreamingResponse(stream_batch_stats_json(request.user_ids), media_type="application/json")
 
-async def fetch_codechef_stats(user_id: int, codechef_url: str, db: Session):
+@app.get("/leaderboard")
+async def leaderboard(
+    sort_by: str = "total_solved",
+    platform: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0)
+):
     try:
-        # Skip if URL is empty
-        if not codechef_url:
-            print("CodeChef URL is empty, skipping")
-            return
+        return await run_in_session(get_leaderboard, sort_by=sort_by, platform=platform, limit=limit, offset=offset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # Extract username from URL and clean it
-        username = codechef_url.split('/')[-1].strip('/')
-        if not username:
-            print("Invalid CodeChef URL format")
-            return
+@app.get("/upstreams")
+async def upstreams():
+    # Circuit breaker, concurrency limit and rate limit of each platform
+    return upstream_state()
 
-        print(f"Fetching CodeChef stats for user: {username}")
-        
-        # Headers to mimic browser request
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Connection': 'keep-alive',
-        }
+@app.get("/metrics")
+async def metrics():
+    # Prometheus text exposition format
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4")
 
-        # Get the user profile page
-        profile_url = f"https://www.codechef.com/users/{username}"
-        response = requests.get(
-            profile_url,
-            headers=headers,
-            timeout=10
-        )
-        
-        if response.status_code != 200:
-            print(f"CodeChef returned status code: {response.status_code}")
-            return
-            
-        # Parse the HTML content
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Get current rating
-        rating_header = soup.find('div', class_='rating-header')
-        current_rating = None
-        highest_rating = None
-        if rating_header:
-            rating_number = rating_header.find('div', class_='rating-number')
-            if rating_number:
-                current_rating = float(rating_number.text.strip())
-            
-            # Get highest rating
-            highest_rating_div = rating_header.find('div', class_='rating-star')
-            if highest_rating_div:
-                highest_text = highest_rating_div.get_text(strip=True)
-                try:
-                    highest_rating = float(''.join(filter(str.isdigit, highest_text)))
-                except:
-                    pass
-
-        # Get problem counts
-        problems_solved = 0
-        problem_categories = {}
-        
-        # Find the problems solved section
-        problems_section = soup.find('section', {'class': 'rating-data-section problems-solved'})
-        if problems_section:
-            # Count fully solved problems
-            fully_solved_header = problems_section.find('h5', string='Fully Solved')
-            if fully_solved_header:
-                problems_list = fully_solved_header.find_next('article')
-                if problems_list:
-                    problems = problems_list.find_all('p')
-                    problems_solved = len(problems)
-                    
-                    # Categorize problems
-                    for problem in problems:
-                        problem_text = problem.get_text(strip=True)
-                        category = 'practice'  # Default category
-                        if '(Challenge)' in problem_text:
-                            category = 'challenge'
-                        elif '(Contest)' in problem_text:
-                            category = 'contest'
-                        problem_categories[category] = problem_categories.get(category, 0) + 1
-
-        # Get contest participation
-        contests_participated = 0
-        contest_section = soup.find('section', {'class': 'rating-data-section contests-attended'})
-        if contest_section:
-            contests_list = contest_section.find_all('p')
-            contests_participated = len(contests_list)
-
-        print(f"Found stats for {username}:")
-        print(f"Current Rating: {current_rating}")
-        print(f"Highest Rating: {highest_rating}")
-        print(f"Problems Solved: {problems_solved}")
-        print(f"Contests Participated: {contests_participated}")
-        print(f"Problem Categories: {problem_categories}")
-        
-        # Create new stats record
-        stats = CodeChefStats(
-            user_id=user_id,
-            total_problems_solved=problems_solved,
-            contest_rating=current_rating,
-            highest_rating=highest_rating,
-            contests_participated=contests_participated,
-            problem_categories=problem_categories
+@app.get("/user/{user_id}/history")
+async def user_history(
+    user_id: int,
+    metric: str = "total_solved",
+    platform: Optional[str] = None,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    buckets: int = Query(HISTORY_DEFAULT_BUCKETS, ge=1, le=HISTORY_MAX_BUCKETS)
+):
+    try:
+        return await run_in_session(
+            get_history, user_id, metric=metric, platform=platform, start=start, end=end, buckets=buckets
         )
-        
-        db.add(stats)
-        db.commit()
-        print(f"Successfully saved CodeChef stats for {username}")
-        
-    except Timeout:
-        print(f"Timeout while fetching CodeChef stats for {username}")
-    except RequestException as e:
-        print(f"Network error while fetching CodeChef stats: {str(e)}")
-    except Exception as e:
-        print(f"Error fetching CodeChef stats: {str(e)}")
-        print(traceback.format_exc())
-        
-    return None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-async def fetch_codeforces_stats(user_id: int, codeforces_url: str, db: Session):
+@app.get("/user/{user_id}/solved")
+async def user_solved(
+    user_id: int,
+    platform: Optional[str] = None,
+    tag: Optional[str] = None,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    limit: int = Query(SOLVED_DEFAULT_LIMIT, ge=1, le=SOLVED_MAX_LIMIT),
+    offset: int = Query(0, ge=0)
+):
     try:
-        # Skip if URL is empty
-        if not codeforces_url:
-            print("CodeForces URL is empty, skipping")
-            return
-
-        # Extract handle from URL and clean it
-        handle = codeforces_url.split('/')[-1].strip('/')
-        if not handle:
-            print("Invalid CodeForces URL format")
-            return
-
-        print(f"Fetching CodeForces stats for user: {handle}")
-        
-        # Get user info
-        user_info_url = f"https://codeforces.com/api/user.info?handles={handle}"
-        submissions_url = f"https://codeforces.com/api/user.status?handle={handle}"
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        # Get user info
-        user_response = requests.get(user_info_url, headers=headers, timeout=10)
-        if user_response.status_code != 200:
-            print(f"CodeForces API returned status code: {user_response.status_code}")
-            return
-            
-        user_data = user_response.json()
-        print(f"CodeForces User API Response: {json.dumps(user_data, indent=2)}")
-        
-        if user_data['status'] != 'OK':
-            print(f"CodeForces API error: {user_data.get('comment', 'Unknown error')}")
-            return
-            
-        user_info = user_data['result'][0]
-        
-        # Get submissions
-        submissions_response = requests.get(submissions_url, headers=headers, timeout=10)
-        if submissions_response.status_code != 200:
-            print(f"CodeForces Submissions API returned status code: {submissions_response.status_code}")
-            return
-            
-        submissions_data = submissions_response.json()
-        print(f"CodeForces Submissions API Response: {json.dumps(submissions_data, indent=2)}")
-        
-        if submissions_data['status'] != 'OK':
-            print(f"CodeForces Submissions API error: {submissions_data.get('comment', 'Unknown error')}")
-            return
-        
-        # Count unique solved problems and categorize by tags
-        solved_problems = set()
-        problem_tags = {}
-        
-        for submission in submissions_data['result']:
-            if submission['verdict'] == 'OK':
-                problem = submission['problem']
-                problem_id = f"{problem.get('contestId', '')}{problem.get('index', '')}"
-                
-                if problem_id not in solved_problems:
-                    solved_problems.add(problem_id)
-                    # Count problem tags
-                    for tag in problem.get('tags', []):
-                        problem_tags[tag] = problem_tags.get(tag, 0) + 1
-        
-        total_solved = len(solved_problems)
-        
-        print(f"Found stats for {handle}:")
-        print(f"Total solved: {total_solved}")
-        print(f"Rating: {user_info.get('rating', 'Not rated')}")
-        print(f"Max Rating: {user_info.get('maxRating', 'Not rated')}")
-        print(f"Rank: {user_info.get('rank', 'Not ranked')}")
-        print(f"Problem tags: {problem_tags}")
-        
-        # Create new stats record
-        stats = CodeForcesStats(
-            user_id=user_id,
-            total_problems_solved=total_solved,
-            contest_rating=user_info.get('rating'),
-            highest_rating=user_info.get('maxRating'),
-            rank=user_info.get('rank', 'newbie'),
-            contests_participated=user_info.get('maxRank', 0),
-            problem_tags=problem_tags
+        return await run_in_session(
+            get_solved, user_id, platform=platform, start=start, end=end, tag=tag, limit=limit, offset=offset
         )
-        
-        db.add(stats)
-        db.commit()
-        print(f"Successfully saved CodeForces stats for {handle}")
-        
-    except Timeout:
-        print(f"Timeout while fetching CodeForces stats for {handle}")
-    except RequestException as e:
-        print(f"Network error while fetching CodeForces stats: {str(e)}")
-    except Exception as e:
-        print(f"Error fetching CodeForces stats: {str(e)}")
-        print(traceback.format_exc())
-        
-    return None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/user/{user_id}/tags")
+async def user_tags(user_id: int):
+    return await run_in_session(get_tag_counts, user_id)
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,7 +1,15 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, JSON
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, String, DateTime, Float, JSON, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from datetime import datetime
+from typing import Callable, TypeVar
+from dotenv import load_dotenv
+import asyncio
+import os
+import threading
+
+T = TypeVar("T")
 
 Base = declarative_base()
 
@@ -15,6 +23,18 @@ class UserProfile(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+class ProfileHandle(Base):
+    # One row per tracked (platform, normalized handle): the index profiles
+    # are looked up and de-duplicated by. The URL columns of UserProfile hold
+    # the canonical URLs for display and refreshes.
+    __tablename__ = "profile_handles"
+
+    platform = Column(String, primary_key=True)
+    handle = Column(String, primary_key=True)  # adapter.handle_key() of the handle
+    user_id = Column(Integer, nullable=False)
+
+    __table_args__ = (Index("ix_profile_handles_user_platform", "user_id", "platform", unique=True),)
+
 class LeetCodeStats(Base):
     __tablename__ = "leetcode_stats"
 
@@ -28,6 +48,9 @@ class LeetCodeStats(Base):
     contest_rating = Column(Float)
     global_rank = Column(Integer)
     recorded_at = Column(DateTime, default=datetime.utcnow)
+    last_seen_at = Column(DateTime)  # Last refresh that returned these same values
+
+    __table_args__ = (Index("ix_leetcode_stats_user_recorded", "user_id", "recorded_at"),)
 
 class CodeChefStats(Base):
     __tablename__ = "codechef_stats"
@@ -42,6 +65,10 @@ class CodeChefStats(Base):
     contests_participated = Column(Integer)
     problem_categories = Column(JSON)  # Store problem categories and counts
     recorded_at = Column(DateTime, default=datetime.utcnow)
+    last_seen_at = Column(DateTime)  # Last refresh that returned these same values
+    delta_base_id = Column(Integer)  # When set, problem_categories is a delta against this row
+
+    __table_args__ = (Index("ix_codechef_stats_user_recorded", "user_id", "recorded_at"),)
 
 class CodeForcesStats(Base):
     __tablename__ = "codeforces_stats"
@@ -54,7 +81,77 @@ class CodeForcesStats(Base):
     rank = Column(String)  # e.g., newbie, pupil, expert
     contests_participated = Column(Integer)
     problem_tags = Column(JSON)  # Store problem tags and counts
+    problem_ratings = Column(JSON)  # Solved problem counts per difficulty rating
     recorded_at = Column(DateTime, default=datetime.utcnow)
+    last_seen_at = Column(DateTime)  # Last refresh that returned these same values
+    delta_base_id = Column(Integer)  # When set, problem_tags is a delta against this row
+
+    __table_args__ = (Index("ix_codeforces_stats_user_recorded", "user_id", "recorded_at"),)
+
+class CodeForcesSyncState(Base):
+    __tablename__ = "codeforces_sync_state"
+
+    handle = Column(String, primary_key=True)  # lower-cased handle
+    last_submission_id = Column(Integer, default=0)  # newest submission already counted
+    solved_problems = Column(JSON)  # List of solved problem ids, e.g. "1850A"
+    problem_tags = Column(JSON)  # Tag counts over solved problems
+    problem_ratings = Column(JSON)  # Solved problem counts per difficulty rating
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class CodeForcesProblem(Base):
+    # Local copy of problemset.problems, refreshed daily, so tag and rating
+    # histograms are lookups instead of re-reading submission payloads
+    __tablename__ = "codeforces_problems"
+
+    problem_id = Column(String, primary_key=True)  # e.g. "1850A"
+    name = Column(String)
+    rating = Column(Integer)
+    tags = Column(JSON)
+    updated_at = Column(DateTime)  # Last seen in problemset.problems; NULL if only known from submissions
+
+class Problem(Base):
+    # A problem on any platform, under a small integer key so solved sets
+    # and tag links are integer pairs
+    __tablename__ = "problems"
+
+    id = Column(Integer, primary_key=True)
+    platform = Column(String, nullable=False)
+    code = Column(String, nullable=False)  # e.g. "1850A", "two-sum", "FLOW001"
+
+    __table_args__ = (Index("ix_problems_platform_code", "platform", "code", unique=True),)
+
+class Tag(Base):
+    # Interned tag names
+    __tablename__ = "tags"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False, unique=True)
+
+class ProblemTag(Base):
+    __tablename__ = "problem_tags"
+
+    problem_id = Column(Integer, primary_key=True)
+    tag_id = Column(Integer, primary_key=True, index=True)
+
+class SolvedProblem(Base):
+    # Problems each user has solved, with the first accepted submission's
+    # time where the platform reports it (else when a refresh first saw it;
+    # NULL for problems already solved when tracking started)
+    __tablename__ = "solved_problems"
+
+    user_id = Column(Integer, primary_key=True)
+    problem_id = Column(Integer, primary_key=True, index=True)
+    solved_at = Column(DateTime)
+
+    __table_args__ = (Index("ix_solved_problems_user_solved", "user_id", "solved_at"),)
+
+class ProfileView(Base):
+    # When a user's dashboard was last opened; the scheduler refreshes
+    # recently viewed profiles more often
+    __tablename__ = "profile_views"
+
+    user_id = Column(Integer, primary_key=True)
+    last_viewed_at = Column(DateTime, index=True)
 
 class LinkedInStats(Base):
     __tablename__ = "linkedin_stats"
@@ -66,17 +163,168 @@ class LinkedInStats(Base):
     skills = Column(String)  # JSON string of skills
     recorded_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (Index("ix_linkedin_stats_user_recorded", "user_id", "recorded_at"),)
+
+class LatestStats(Base):
+    # Newest snapshot per user and platform, maintained on every write so the
+    # dashboard never has to search the history tables
+    __tablename__ = "latest_stats"
+
+    user_id = Column(Integer, primary_key=True)
+    platform = Column(String, primary_key=True)
+    snapshot_id = Column(Integer)  # id of the row in the platform's stats table
+    total_solved = Column(Integer)
+    rating = Column(Float)
+    stats = Column(JSON)  # Platform stats as returned by the API
+    recorded_at = Column(DateTime)  # Last refresh that confirmed this snapshot
+
+    __table_args__ = (
+        Index("ix_latest_stats_platform_total", "platform", "total_solved"),
+        Index("ix_latest_stats_platform_rating", "platform", "rating"),
+    )
+
 # Database setup
-SQLALCHEMY_DATABASE_URL = "sqlite:///./profile_tracker.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+load_dotenv()
+SQLALCHEMY_DATABASE_URL = os.getenv("SQLALCHEMY_DATABASE_URL", "sqlite:///./profile_tracker.db")
+# Async driver URL; derived from SQLALCHEMY_DATABASE_URL unless set explicitly
+SQLALCHEMY_ASYNC_DATABASE_URL = os.getenv("SQLALCHEMY_ASYNC_DATABASE_URL")
+# Set DB_ASYNC=0 to run database work on the sync engine in worker threads instead
+DB_ASYNC = os.getenv("DB_ASYNC", "1") == "1"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# SQLite only: write-ahead logging lets readers run alongside the writer, so
+# several worker processes can share one database file; writers wait up to
+# the busy timeout for the lock instead of failing with "database is locked"
+SQLITE_WAL = os.getenv("SQLITE_WAL", "1") == "1"
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "10"))
+
+def to_async_url(url: str) -> str:
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    for prefix in ("postgresql://", "postgres://", "postgresql+psycopg2://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+def pool_options(url: str, is_async: bool = False) -> dict:
+    # In-memory SQLite keeps a single connection; nothing to size
+    if ":memory:" in url or url.rstrip("/").endswith("sqlite:"):
+        return {}
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": not url.startswith("sqlite"),
+    }
+    if is_async and url.startswith("sqlite"):
+        # aiosqlite defaults to NullPool, which reconnects for every session
+        options["poolclass"] = AsyncAdaptedQueuePool
+    return options
+
+def configure_sqlite_connection(connection):
+    # Works on sqlite3 and aiosqlite's DB-API adapter alike
+    cursor = connection.cursor()
+    if SQLITE_WAL:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # Durable at every checkpoint rather than every commit, which is safe with WAL
+        cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT * 1000)}")
+    cursor.close()
+
+def configure_sqlite_engine(sync_engine):
+    if sync_engine.dialect.name == "sqlite":
+        event.listen(sync_engine, "connect", lambda connection, record: configure_sqlite_connection(connection))
+
+# Engines and session factories are created on first use, so importing the
+# models (scripts, workers, benchmarks) neither loads a database driver nor
+# opens a pool until a query actually runs
+_engine = None
+_session_factory = None
+_async_engine = None
+_async_session_factory = None
+# Sync sessions are also opened from worker threads (DB_ASYNC=0)
+_engine_lock = threading.Lock()
+
+def get_engine():
+    global _engine, _session_factory
+    with _engine_lock:
+        if _engine is not None:
+            return _engine
+        _engine = create_engine(SQLALCHEMY_DATABASE_URL, **pool_options(SQLALCHEMY_DATABASE_URL))
+        configure_sqlite_engine(_engine)
+        _session_factory = sessionmaker(autocommit=False, autoflush=False, bind=_engine)
+        return _engine
+
+def SessionLocal():
+    get_engine()
+    return _session_factory()
+
+def get_async_session_factory():
+    # None when DB_ASYNC is off
+    global _async_engine, _async_session_factory
+    if DB_ASYNC and _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        async_url = SQLALCHEMY_ASYNC_DATABASE_URL or to_async_url(SQLALCHEMY_DATABASE_URL)
+        _async_engine = create_async_engine(async_url, **pool_options(async_url, is_async=True))
+        configure_sqlite_engine(_async_engine.sync_engine)
+        _async_session_factory = async_sessionmaker(_async_engine, autoflush=False, expire_on_commit=False)
+    return _async_session_factory
+
+def add_missing_columns():
+    # Bring tables created by an older version up to date (new columns are
+    # always nullable, so a plain ADD COLUMN is enough)
+    engine = get_engine()
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
 
 def init_db():
+    engine = get_engine()
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    # create_all skips indexes on tables that already exist
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+async def run_in_session(fn: Callable[..., T], *args, **kwargs) -> T:
+    # Run fn(session, *args, **kwargs) in a short-lived session without
+    # blocking the event loop: through the async engine when enabled,
+    # otherwise on the sync engine in a worker thread
+    async_session_factory = get_async_session_factory()
+    if async_session_factory is not None:
+        async with async_session_factory() as db:
+            return await db.run_sync(lambda session: fn(session, *args, **kwargs))
+
+    def run():
+        db = SessionLocal()
+        try:
+            return fn(db, *args, **kwargs)
+        finally:
+            db.close()
+
+    return await asyncio.to_thread(run)
+
+async def dispose_engines():
+    # Only engines that were created; a disposed engine reconnects on next use
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    if _engine is not None:
+        _engine.dispose()
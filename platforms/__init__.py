@@ -0,0 +1,13 @@
+from platforms.base import PlatformAdapter, PlatformRegistry, registry
+from platforms.leetcode import LeetCodeAdapter
+from platforms.codechef import CodeChefAdapter
+from platforms.codeforces import CodeForcesAdapter
+
+# Built-in platforms, in the order the API reports them. A new judge is one
+# PlatformAdapter subclass (plus its snapshot table and UserProfile URL
+# column) registered here. Adapter modules only hold metadata and import
+# their fetch code (HTTP client, parsers) when a profile is first loaded,
+# so everything that only needs the registry starts quickly.
+registry.register(LeetCodeAdapter())
+registry.register(CodeChefAdapter())
+registry.register(CodeForcesAdapter())
@@ -0,0 +1,117 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+def url_segments(url: str) -> List[str]:
+    # Path segments of a profile URL, with or without a scheme, ignoring the
+    # query and fragment; a bare handle (no slash) is its own single segment
+    url = url.strip()
+    if "://" not in url:
+        if "/" not in url:
+            return [url] if url else []
+        url = "//" + url
+    return [segment for segment in urlsplit(url).path.split("/") if segment]
+
+
+def solved_entry(problem_id: str, solved_at: Optional[float] = None, tags: Iterable[str] = ()) -> dict:
+    # How fetchers report a solved problem in their results under "solved":
+    # the platform's problem id, the epoch seconds of the first accepted
+    # submission if known, and its tags
+    entry = {"id": problem_id}
+    if solved_at is not None:
+        entry["solved_at"] = solved_at
+    tags = list(tags)
+    if tags:
+        entry["tags"] = tags
+    return entry
+
+
+class PlatformAdapter:
+    # Everything the app needs to know about one judge: how to get a handle
+    # out of a profile URL, how to fetch and parse its stats (always through
+    # http_client.upstream_request, so rate limits, circuit breakers and the
+    # connection pool apply), and how they are stored and reported.
+
+    name = ""  # Key in the API, the job queue, latest_stats and all per-platform settings
+    display_name = ""
+    model = None  # Snapshot table
+    url_field = ""  # UserProfile column (and /track-profiles field) holding the profile URL
+    # Canonical profile URL, and the path segment that may come before the
+    # handle in submitted URLs (e.g. "u" for leetcode.com/u/<handle>)
+    profile_url = ""
+    handle_prefix: Optional[str] = None
+
+    # What the API reports before the first snapshot
+    empty_stats: Dict = {}
+    # JSON column stored as a delta against an earlier full row, and the key
+    # it is reported under in the stats
+    delta_json_column: Optional[str] = None
+    delta_json_stats_key: Optional[str] = None
+    # Chartable metric -> column of the snapshot table
+    history_columns: Dict[str, str] = {}
+
+    # Profiles the scheduler refreshes together through load_many; 0 for one job per profile
+    batch_size = 0
+    # Upstream requests a refresh makes: (once per batch, per profile)
+    requests_per_refresh: Tuple[int, int] = (0, 1)
+
+    def handle(self, url: str) -> Optional[str]:
+        # Handle as written in the URL; trailing segments (tabs, sub-pages) are ignored
+        segments = url_segments(url)
+        if len(segments) > 1 and segments[0] == self.handle_prefix:
+            segments = segments[1:]
+        return segments[0] if segments else None
+
+    def handle_key(self, handle: str) -> str:
+        # Normalized handle profiles are looked up and de-duplicated by
+        # (handles are case-insensitive on all supported platforms)
+        return handle.lower()
+
+    def canonical_url(self, handle: str) -> str:
+        # Stored in place of the submitted URL; a bare handle if no format is set
+        return self.profile_url.format(handle=handle) if self.profile_url else handle
+
+    async def load(self, handle: str) -> Optional[dict]:
+        # Stats of one profile, None if the profile doesn't exist
+        raise NotImplementedError
+
+    async def load_many(self, handles: List[str]) -> Dict[str, Optional[dict]]:
+        # Platforms with a batch API override this
+        return {handle: await self.load(handle) for handle in dict.fromkeys(handles)}
+
+    def row(self, user_id: int, result: dict):
+        # Snapshot row for a load() result
+        raise NotImplementedError
+
+    def stats(self, row) -> dict:
+        # API representation of a snapshot row
+        raise NotImplementedError
+
+
+class PlatformRegistry:
+    def __init__(self):
+        self._adapters: Dict[str, PlatformAdapter] = {}
+
+    def register(self, adapter: PlatformAdapter) -> PlatformAdapter:
+        if adapter.name in self._adapters:
+            raise ValueError(f"Platform already registered: {adapter.name}")
+        self._adapters[adapter.name] = adapter
+        return adapter
+
+    def get(self, name: str) -> PlatformAdapter:
+        adapter = self._adapters.get(name)
+        if adapter is None:
+            raise ValueError(f"Unknown platform: {name}")
+        return adapter
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._adapters
+
+    def __iter__(self) -> Iterator[PlatformAdapter]:
+        return iter(list(self._adapters.values()))
+
+    def names(self) -> List[str]:
+        return list(self._adapters)
+
+
+registry = PlatformRegistry()
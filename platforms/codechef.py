@@ -0,0 +1,80 @@
+import logging
+from typing import Optional
+
+from models import CodeChefStats
+from metrics import PARSE_SECONDS
+from platforms.base import PlatformAdapter, solved_entry
+
+logger = logging.getLogger(__name__)
+
+# Headers to mimic browser request
+HEADERS = {
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+}
+
+
+async def load_codechef_stats(username: str) -> Optional[dict]:
+    from http_client import upstream_request, upstream_url
+    from codechef_parser import parse_codechef_profile
+
+    # Get the user profile page
+    profile_url = upstream_url("codechef", f"/users/{username}")
+    async with upstream_request("codechef", "GET", profile_url, headers=HEADERS) as response:
+        if response.status != 200:
+            logger.warning(f"CodeChef returned status code: {response.status}")
+            return None
+        html = await response.text()
+
+    # Only the rating header and the two stats sections are parsed
+    with PARSE_SECONDS.time(platform="codechef"):
+        result = parse_codechef_profile(html)
+    # The profile lists problem codes without solve times
+    result["solved"] = [solved_entry(code) for code in result.pop("solved_problems")]
+    return result
+
+
+class CodeChefAdapter(PlatformAdapter):
+    name = "codechef"
+    display_name = "CodeChef"
+    model = CodeChefStats
+    url_field = "codechef_url"
+    profile_url = "https://www.codechef.com/users/{handle}"
+    handle_prefix = "users"
+    empty_stats = {
+        "total_solved": 0,
+        "rating": None,
+        "highest_rating": None,
+        "contests_participated": 0,
+        "categories": {}
+    }
+    delta_json_column = "problem_categories"
+    delta_json_stats_key = "categories"
+    history_columns = {
+        "total_solved": "total_problems_solved",
+        "rating": "contest_rating",
+        "highest_rating": "highest_rating",
+        "contests_participated": "contests_participated",
+    }
+
+    async def load(self, handle: str) -> Optional[dict]:
+        return await load_codechef_stats(handle)
+
+    def row(self, user_id: int, result: dict) -> CodeChefStats:
+        return CodeChefStats(
+            user_id=user_id,
+            total_problems_solved=result['total_solved'],
+            contest_rating=result['rating'],
+            highest_rating=result['highest_rating'],
+            contests_participated=result['contests_participated'],
+            problem_categories=result['categories']
+        )
+
+    def stats(self, row) -> dict:
+        return {
+            "total_solved": row.total_problems_solved,
+            "rating": row.contest_rating,
+            "highest_rating": row.highest_rating,
+            "contests_participated": row.contests_participated,
+            "categories": row.problem_categories
+        }
@@ -0,0 +1,166 @@
+import logging
+import os
+import re
+from typing import Dict, List, Optional
+
+from models import CodeForcesStats
+from platforms.base import PlatformAdapter
+
+logger = logging.getLogger(__name__)
+
+# Handles per user.info call (the API accepts semicolon-separated lists)
+USER_INFO_BATCH_SIZE = int(os.getenv("CODEFORCES_USER_INFO_BATCH_SIZE", "200"))
+# Profiles the scheduler refreshes together (one user.info call plus one
+# user.status call per profile)
+CODEFORCES_BATCH_SIZE = int(os.getenv("CODEFORCES_BATCH_SIZE", "20"))
+
+_HANDLE_NOT_FOUND = re.compile(r"handle (\S+) not found", re.IGNORECASE)
+
+
+async def _load_user_info_chunk(handles: List[str]) -> Dict[str, Optional[dict]]:
+    from http_client import upstream_request, upstream_url
+
+    url = upstream_url("codeforces", "/api/user.info")
+    results: Dict[str, Optional[dict]] = {handle.lower(): None for handle in handles}
+    remaining = list(handles)
+    while remaining:
+        params = {'handles': ";".join(remaining)}
+        async with upstream_request("codeforces", "GET", url, params=params) as response:
+            data = await response.json(content_type=None) if response.status in (200, 400) else None
+            if data is None:
+                logger.warning(f"CodeForces API returned status code: {response.status}")
+                return results
+
+        if data.get('status') == 'OK':
+            for user_info in data['result']:
+                results[user_info['handle'].lower()] = user_info
+            return results
+
+        # One unknown handle fails the whole call; drop it and ask again
+        comment = data.get('comment', '')
+        missing = _HANDLE_NOT_FOUND.search(comment)
+        if not missing or missing.group(1).lower() not in results:
+            logger.warning(f"CodeForces API error: {comment or 'Unknown error'}")
+            return results
+        logger.info(f"CodeForces handle not found: {missing.group(1)}")
+        remaining = [handle for handle in remaining if handle.lower() != missing.group(1).lower()]
+    return results
+
+
+async def load_user_infos(handles: List[str]) -> Dict[str, Optional[dict]]:
+    # Lower-cased handle -> user.info result (None if unknown or failed)
+    unique = list({handle.lower(): handle for handle in handles}.values())
+    results = {}
+    for start in range(0, len(unique), USER_INFO_BATCH_SIZE):
+        results.update(await _load_user_info_chunk(unique[start:start + USER_INFO_BATCH_SIZE]))
+    return results
+
+
+async def build_codeforces_stats(handle: str, user_info: dict) -> Optional[dict]:
+    # Only submissions newer than the last sync are downloaded; solved
+    # problems are updated incrementally and the histograms come from the
+    # cached problemset
+    from codeforces_sync import sync_codeforces_submissions, CodeForcesSyncError
+
+    try:
+        sync_state = await sync_codeforces_submissions(handle)
+    except CodeForcesSyncError as e:
+        logger.warning(str(e))
+        return None
+
+    return {
+        "total_solved": len(sync_state["solved_problems"]),
+        "rating": user_info.get('rating'),
+        "highest_rating": user_info.get('maxRating'),
+        "rank": user_info.get('rank', 'newbie'),
+        "contests_participated": user_info.get('maxRank', 0),
+        "problem_tags": sync_state["problem_tags"],
+        "problem_ratings": sync_state.get("problem_ratings", {}),
+    }
+
+
+async def load_codeforces_stats(handle: str) -> Optional[dict]:
+    user_info = (await load_user_infos([handle])).get(handle.lower())
+    if user_info is None:
+        return None
+    return await build_codeforces_stats(handle, user_info)
+
+
+def codeforces_row(user_id: int, result: dict) -> CodeForcesStats:
+    return CodeForcesStats(
+        user_id=user_id,
+        total_problems_solved=result['total_solved'],
+        contest_rating=result['rating'],
+        highest_rating=result['highest_rating'],
+        rank=result['rank'],
+        contests_participated=result['contests_participated'],
+        problem_tags=result['problem_tags'],
+        # Cached results from before rating histograms were kept lack this
+        problem_ratings=result.get('problem_ratings', {})
+    )
+
+
+async def load_codeforces_users(handles: List[str]) -> Dict[str, Optional[dict]]:
+    # User info for all handles in one call, then each user's new submissions
+    user_infos = await load_user_infos(handles)
+    results: Dict[str, Optional[dict]] = {}
+    by_key: Dict[str, Optional[dict]] = {}
+    for handle in handles:
+        key = handle.lower()
+        if key not in by_key:
+            by_key[key] = None
+            if user_infos.get(key) is not None:
+                try:
+                    by_key[key] = await build_codeforces_stats(handle, user_infos[key])
+                except Exception as e:
+                    # One user's failed sync doesn't fail the others
+                    logger.warning(f"CodeForces sync for {handle} failed: {str(e)}")
+        results[handle] = by_key[key]
+    return results
+
+
+class CodeForcesAdapter(PlatformAdapter):
+    name = "codeforces"
+    display_name = "CodeForces"
+    model = CodeForcesStats
+    url_field = "codeforces_url"
+    profile_url = "https://codeforces.com/profile/{handle}"
+    handle_prefix = "profile"
+    empty_stats = {
+        "total_solved": 0,
+        "rating": None,
+        "rank": None,
+        "contests_participated": 0,
+        "problem_tags": {},
+        "problem_ratings": {}
+    }
+    delta_json_column = "problem_tags"
+    delta_json_stats_key = "problem_tags"
+    history_columns = {
+        "total_solved": "total_problems_solved",
+        "rating": "contest_rating",
+        "highest_rating": "highest_rating",
+        "contests_participated": "contests_participated",
+    }
+    # One user.info call per batch and one user.status call per profile
+    batch_size = CODEFORCES_BATCH_SIZE
+    requests_per_refresh = (1, 1)
+
+    async def load(self, handle: str) -> Optional[dict]:
+        return await load_codeforces_stats(handle)
+
+    async def load_many(self, handles: List[str]) -> Dict[str, Optional[dict]]:
+        return await load_codeforces_users(handles)
+
+    def row(self, user_id: int, result: dict) -> CodeForcesStats:
+        return codeforces_row(user_id, result)
+
+    def stats(self, row) -> dict:
+        return {
+            "total_solved": row.total_problems_solved,
+            "rating": row.contest_rating,
+            "rank": row.rank,
+            "contests_participated": row.contests_participated,
+            "problem_tags": row.problem_tags,
+            "problem_ratings": row.problem_ratings or {}
+        }
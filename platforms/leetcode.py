@@ -0,0 +1,184 @@
+import logging
+import os
+from typing import Dict, List, Optional
+
+from models import LeetCodeStats
+from metrics import PARSE_SECONDS
+from platforms.base import PlatformAdapter, solved_entry
+
+logger = logging.getLogger(__name__)
+
+# Usernames combined into one GraphQL document
+LEETCODE_BATCH_SIZE = int(os.getenv("LEETCODE_BATCH_SIZE", "20"))
+# Recent accepted submissions read per profile for the solved-problem store
+# (LeetCode only lists the most recent ones); 0 to skip
+LEETCODE_RECENT_AC_LIMIT = int(os.getenv("LEETCODE_RECENT_AC_LIMIT", "20"))
+
+USER_FIELDS = """
+            username
+            submitStats: submitStatsGlobal {
+                acSubmissionNum {
+                    difficulty
+                    count
+                }
+            }"""
+
+CONTEST_FIELDS = """
+            attendedContestsCount
+            rating
+            globalRanking"""
+
+RECENT_AC_FIELDS = """
+            titleSlug
+            timestamp"""
+
+
+def build_query(count: int) -> str:
+    # u<i>/c<i>/r<i> aliases select the profile, contest ranking and recent
+    # accepted submissions of $u<i>
+    variables = ", ".join(f"$u{i}: String!" for i in range(count))
+    fields = "".join(
+        f"""
+        u{i}: matchedUser(username: $u{i}) {{{USER_FIELDS}
+        }}
+        c{i}: userContestRanking(username: $u{i}) {{{CONTEST_FIELDS}
+        }}"""
+        + (f"""
+        r{i}: recentAcSubmissionList(username: $u{i}, limit: {LEETCODE_RECENT_AC_LIMIT}) {{{RECENT_AC_FIELDS}
+        }}""" if LEETCODE_RECENT_AC_LIMIT else "")
+        for i in range(count)
+    )
+    return f"query getUserProfiles({variables}) {{{fields}\n    }}"
+
+
+def parse_user(user_data: dict, ranking: Optional[dict], recent_ac: Optional[list] = None) -> dict:
+    # Calculate problems by difficulty
+    solved = {'Easy': 0, 'Medium': 0, 'Hard': 0}
+    for stat in user_data.get('submitStats', {}).get('acSubmissionNum', []):
+        if stat.get('difficulty') in solved:
+            solved[stat['difficulty']] = stat.get('count', 0)
+
+    ranking = ranking or {}
+    return {
+        "total_solved": sum(solved.values()),
+        "easy_solved": solved['Easy'],
+        "medium_solved": solved['Medium'],
+        "hard_solved": solved['Hard'],
+        "contest_rating": ranking.get('rating'),
+        "contests_participated": ranking.get('attendedContestsCount') or 0,
+        "global_rank": ranking.get('globalRanking'),
+        "solved": [
+            solved_entry(submission['titleSlug'], int(submission['timestamp']))
+            for submission in recent_ac or [] if submission.get('titleSlug') and submission.get('timestamp')
+        ],
+    }
+
+
+async def _load_chunk(usernames: List[str]) -> Dict[str, Optional[dict]]:
+    # Imported here, like the other adapters' fetch code, so that importing
+    # the registry for its metadata doesn't load the HTTP stack
+    from http_client import upstream_request, upstream_url
+
+    async with upstream_request(
+        "leetcode",
+        "POST",
+        upstream_url("leetcode", "/graphql"),
+        json={
+            'query': build_query(len(usernames)),
+            'variables': {f"u{i}": username for i, username in enumerate(usernames)}
+        },
+        headers={'Content-Type': 'application/json'}
+    ) as response:
+        if response.status != 200:
+            logger.warning(f"LeetCode API returned status code {response.status}: {await response.text()}")
+            return {username: None for username in usernames}
+        payload = await response.json(content_type=None)
+
+    # Unknown users come back as null with an entry in "errors"; the other
+    # aliases in the document are still answered
+    data = payload.get('data') or {}
+    if payload.get('errors'):
+        logger.info(f"LeetCode API errors: {payload['errors']}")
+    results = {}
+    with PARSE_SECONDS.time(platform="leetcode"):
+        for i, username in enumerate(usernames):
+            user_data = data.get(f"u{i}")
+            if not user_data:
+                logger.info(f"No LeetCode data found for user: {username}")
+            results[username] = parse_user(user_data, data.get(f"c{i}"), data.get(f"r{i}")) if user_data else None
+    return results
+
+
+async def load_leetcode_users(usernames: List[str]) -> Dict[str, Optional[dict]]:
+    # One GraphQL request per LEETCODE_BATCH_SIZE usernames
+    unique = list(dict.fromkeys(usernames))
+    results = {}
+    for start in range(0, len(unique), LEETCODE_BATCH_SIZE):
+        results.update(await _load_chunk(unique[start:start + LEETCODE_BATCH_SIZE]))
+    return results
+
+
+async def load_leetcode_stats(username: str) -> Optional[dict]:
+    return (await load_leetcode_users([username])).get(username)
+
+
+def leetcode_row(user_id: int, result: dict) -> LeetCodeStats:
+    return LeetCodeStats(
+        user_id=user_id,
+        total_problems_solved=result['total_solved'],
+        easy_solved=result['easy_solved'],
+        medium_solved=result['medium_solved'],
+        hard_solved=result['hard_solved'],
+        # Cached results from before contest ranking was fetched lack these
+        contests_participated=result.get('contests_participated', 0),
+        contest_rating=result.get('contest_rating'),
+        global_rank=result.get('global_rank')
+    )
+
+
+class LeetCodeAdapter(PlatformAdapter):
+    name = "leetcode"
+    display_name = "LeetCode"
+    model = LeetCodeStats
+    url_field = "leetcode_url"
+    # Both leetcode.com/u/<username> and leetcode.com/<username> are accepted
+    profile_url = "https://leetcode.com/u/{handle}/"
+    handle_prefix = "u"
+    empty_stats = {
+        "total_solved": 0,
+        "easy_solved": 0,
+        "medium_solved": 0,
+        "hard_solved": 0,
+        "contest_rating": None,
+        "contests_participated": 0
+    }
+    history_columns = {
+        "total_solved": "total_problems_solved",
+        "rating": "contest_rating",
+        "contests_participated": "contests_participated",
+        "easy_solved": "easy_solved",
+        "medium_solved": "medium_solved",
+        "hard_solved": "hard_solved",
+    }
+    # A batch is one GraphQL call
+    batch_size = LEETCODE_BATCH_SIZE
+    requests_per_refresh = (1, 0)
+
+    async def load(self, handle: str) -> Optional[dict]:
+        return await load_leetcode_stats(handle)
+
+    async def load_many(self, handles: List[str]) -> Dict[str, Optional[dict]]:
+        return await load_leetcode_users(handles)
+
+    def row(self, user_id: int, result: dict) -> LeetCodeStats:
+        return leetcode_row(user_id, result)
+
+    def stats(self, row) -> dict:
+        return {
+            "total_solved": row.total_problems_solved,
+            "easy_solved": row.easy_solved,
+            "medium_solved": row.medium_solved,
+            "hard_solved": row.hard_solved,
+            "contest_rating": row.contest_rating,
+            "contests_participated": row.contests_participated
+        }
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import os
+import random
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+import aiohttp
+
+from cache import upstream_cache
+from http_client import UpstreamError, CircuitOpenError
+from models import run_in_session
+from jobs import Job
+from snapshots import save_snapshot, save_snapshots
+from platforms import registry, PlatformAdapter
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Extra attempts after a timeout, connection error, 429 or 5xx. The rate
+# limiter's backoff still applies, so a retry after a 429 waits for it.
+REFRESH_RETRIES = int(os.getenv("REFRESH_RETRIES", "1"))
+# Delay before the first retry; doubles for each further one
+REFRESH_RETRY_DELAY = float(os.getenv("REFRESH_RETRY_DELAY", "1"))
+
+
+async def with_retries(adapter: PlatformAdapter, load: Callable[[], Awaitable[T]]) -> T:
+    attempt = 0
+    while True:
+        try:
+            return await load()
+        except CircuitOpenError:
+            # Failing fast is the point of an open circuit
+            raise
+        except (asyncio.TimeoutError, aiohttp.ClientError, UpstreamError) as e:
+            if attempt >= REFRESH_RETRIES:
+                raise
+            delay = REFRESH_RETRY_DELAY * 2 ** attempt * random.uniform(0.5, 1.5)
+            attempt += 1
+            logger.info(f"Retrying {adapter.display_name} request in {delay:.1f}s after: {str(e) or type(e).__name__}")
+            await asyncio.sleep(delay)
+
+
+async def refresh_profile(platform: str, user_id: int, url: str, allow_stale: bool = True) -> Optional[bool]:
+    # Fetch one profile (through the upstream cache) and store a snapshot.
+    # Returns True on success; failures are logged, not raised.
+    adapter = registry.get(platform)
+    handle = None
+    try:
+        if not url:
+            logger.debug(f"{adapter.display_name} URL is empty, skipping")
+            return None
+        handle = adapter.handle(url)
+        if not handle:
+            logger.warning(f"Invalid {adapter.display_name} URL format")
+            return None
+
+        logger.info(f"Fetching {adapter.display_name} stats for user: {handle}")
+        result = await upstream_cache.fetch(
+            platform, handle, lambda: with_retries(adapter, lambda: adapter.load(handle)), allow_stale=allow_stale
+        )
+        if result is None:
+            return None
+        logger.debug(f"Found {adapter.display_name} stats for {handle}: {result}")
+
+        # Each refresh writes through its own short-lived session
+        await run_in_session(save_snapshot, platform, adapter.row(user_id, result), result.get("solved"))
+        logger.info(f"Successfully saved {adapter.display_name} stats for {handle}")
+        return True
+
+    except asyncio.TimeoutError:
+        logger.warning(f"Timeout while fetching {adapter.display_name} stats for {handle}")
+    except aiohttp.ClientError as e:
+        logger.warning(f"Network error while fetching {adapter.display_name} stats: {str(e)}")
+    except UpstreamError as e:
+        logger.warning(f"Upstream error while fetching {adapter.display_name} stats: {str(e)}")
+    except Exception as e:
+        logger.exception(f"Error fetching {adapter.display_name} stats: {str(e)}")
+
+    return None
+
+
+async def run_refresh_job(job: Job) -> bool:
+    # JobQueue runner shared by the API and the standalone workers
+    return bool(await refresh_profile(job.platform, job.user_id, job.url, allow_stale=job.allow_stale))
+
+
+async def refresh_cohort(platform: str, profiles: List[Tuple[int, str]]) -> Dict[int, bool]:
+    # Refresh many (user_id, url) profiles through the adapter's batch loader
+    # and store all new snapshots in a single transaction. Returns whether
+    # each user's refresh succeeded.
+    adapter = registry.get(platform)
+    handles = {user_id: adapter.handle(url or "") for user_id, url in profiles}
+    wanted = [handle for handle in handles.values() if handle]
+    results = await with_retries(adapter, lambda: adapter.load_many(wanted)) if wanted else {}
+
+    rows = []
+    solved = {}
+    outcome = {}
+    for user_id, handle in handles.items():
+        result = results.get(handle) if handle else None
+        outcome[user_id] = result is not None
+        if result is not None:
+            await upstream_cache.set(platform, handle, result)
+            rows.append(adapter.row(user_id, result))
+            solved[user_id] = result.get("solved")
+    if rows:
+        await run_in_session(save_snapshots, platform, rows, solved)
+    logger.info(f"Refreshed {len(rows)} of {len(profiles)} {adapter.display_name} profiles")
+    return outcome
@@ -0,0 +1,234 @@
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+
+from models import UserProfile, ProfileHandle, LatestStats, ProfileView
+from platforms import registry
+from response_cache import stats_response_cache
+from solved import move_solved, delete_solved
+
+logger = logging.getLogger(__name__)
+
+# (platform, normalized handle)
+ProfileKey = Tuple[str, str]
+
+# Keys per IN () query; each key is two variables
+LOOKUP_BATCH_SIZE = 5000
+
+
+def canonical_profiles(urls: Dict[str, Optional[str]]) -> Dict[str, Tuple[str, str]]:
+    # Submitted URLs by UserProfile column -> (normalized handle, canonical
+    # URL) by platform. Empty URLs and URLs without a handle are left out.
+    result = {}
+    for adapter in registry:
+        url = urls.get(adapter.url_field)
+        handle = adapter.handle(url) if url else None
+        if handle:
+            result[adapter.name] = (adapter.handle_key(handle), adapter.canonical_url(handle))
+    return result
+
+
+class HandleIndex:
+    # The ProfileHandle rows for a set of keys, their owners and the owners'
+    # other handles, loaded up front so that any number of upserts against
+    # them needs a fixed number of queries
+
+    def __init__(self, db: Session, keys: Iterable[ProfileKey]):
+        self.db = db
+        # Profiles whose stats changed hands, for commit() to invalidate
+        self.moved_stats: Set[int] = set()
+        self.by_key: Dict[ProfileKey, ProfileHandle] = {}
+        self.by_user: Dict[Tuple[int, str], ProfileHandle] = {}
+        self.profiles: Dict[int, UserProfile] = {}
+        keys = list(set(keys))
+        user_ids = set()
+        for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+            chunk = keys[start:start + LOOKUP_BATCH_SIZE]
+            for row in db.query(ProfileHandle).filter(tuple_(ProfileHandle.platform, ProfileHandle.handle).in_(chunk)):
+                user_ids.add(row.user_id)
+        user_ids = list(user_ids)
+        for start in range(0, len(user_ids), LOOKUP_BATCH_SIZE):
+            chunk = user_ids[start:start + LOOKUP_BATCH_SIZE]
+            for profile in db.query(UserProfile).filter(UserProfile.id.in_(chunk)):
+                self.profiles[profile.id] = profile
+            for row in db.query(ProfileHandle).filter(ProfileHandle.user_id.in_(chunk)):
+                self.by_key[(row.platform, row.handle)] = row
+                self.by_user[(row.user_id, row.platform)] = row
+
+    def profile(self, key: ProfileKey) -> Optional[UserProfile]:
+        row = self.by_key.get(key)
+        return self.profiles.get(row.user_id) if row is not None else None
+
+    def find(self, profiles: Dict[str, Tuple[str, str]]) -> Optional[UserProfile]:
+        # Like the old URL lookup, the first platform that matches picks the profile
+        for platform, (handle, _) in profiles.items():
+            profile = self.profile((platform, handle))
+            if profile is not None:
+                return profile
+        return None
+
+    def assign(self, profile: UserProfile, platform: str, handle: str, url: str):
+        # Point (platform, handle) at the profile (which must have an id) and
+        # store its canonical URL. A handle tracked by another profile moves
+        # here with its snapshots, latest stats and solved problems, and that
+        # profile stops tracking the platform. Data of the handle the profile
+        # tracked before is dropped, like merge_duplicate_profiles does for a
+        # different handle.
+        adapter = registry.get(platform)
+        setattr(profile, adapter.url_field, url)
+        self.profiles[profile.id] = profile
+        key = (platform, handle)
+        row = self.by_key.get(key)
+        if row is not None and row.user_id == profile.id:
+            return
+        current = self.by_user.pop((profile.id, platform), None)
+        if current is not None:
+            del self.by_key[(platform, current.handle)]
+            _drop_platform(self.db, platform, profile.id)
+            self.moved_stats.add(profile.id)
+        if row is None:
+            if current is not None:
+                current.handle = handle
+                row = current
+            else:
+                row = ProfileHandle(platform=platform, handle=handle, user_id=profile.id)
+                self.db.add(row)
+        else:
+            previous = self.profiles.get(row.user_id)
+            if previous is not None:
+                setattr(previous, adapter.url_field, "")
+            del self.by_user[(row.user_id, platform)]
+            if current is not None:
+                # Deletes are flushed after updates; clear the way for the move
+                self.db.delete(current)
+                self.db.flush()
+            _move_platform(self.db, platform, row.user_id, profile.id, keep_history=True)
+            self.moved_stats.update((row.user_id, profile.id))
+            row.user_id = profile.id
+        self.by_key[key] = row
+        self.by_user[(profile.id, platform)] = row
+
+    def commit(self):
+        # Cached stats responses are dropped once the moves are visible
+        self.db.commit()
+        for user_id in self.moved_stats:
+            stats_response_cache.invalidate(user_id)
+        self.moved_stats.clear()
+
+
+def _drop_platform(db: Session, platform: str, user_id: int):
+    # Delete a profile's snapshots, latest stats and solved problems of one platform
+    model = registry.get(platform).model
+    db.query(model).filter(model.user_id == user_id).delete(synchronize_session=False)
+    for row in db.query(LatestStats).filter(LatestStats.user_id == user_id, LatestStats.platform == platform):
+        db.delete(row)
+    delete_solved(db, user_id, platform)
+
+
+def _move_platform(db: Session, platform: str, source: int, target: int, keep_history: bool):
+    # Hand the source profile's snapshots and solved problems of one
+    # platform to the target, or drop them when they belong to a different
+    # handle than the target's
+    if not keep_history:
+        _drop_platform(db, platform, source)
+        return
+    model = registry.get(platform).model
+    latest = {
+        row.user_id: row
+        for row in db.query(LatestStats).filter(LatestStats.user_id.in_((source, target)), LatestStats.platform == platform)
+    }
+    db.query(model).filter(model.user_id == source).update({model.user_id: target}, synchronize_session=False)
+    move_solved(db, platform, source, target)
+    old, new = latest.get(source), latest.get(target)
+    if old is None:
+        return
+    if new is None or (old.recorded_at and new.recorded_at and old.recorded_at > new.recorded_at):
+        if new is not None:
+            db.delete(new)
+            db.flush()
+        old.user_id = target
+    else:
+        db.delete(old)
+
+
+def merge_duplicate_profiles(db: Session) -> int:
+    # Profiles whose URLs name the same (platform, handle) are merged into
+    # the oldest: its snapshots, latest stats, solved problems and views
+    # move over, and platforms it didn't track are taken over from the
+    # others. Returns the number of profiles removed.
+    profiles = db.query(UserProfile).order_by(UserProfile.id).all()
+    keys = {
+        profile.id: canonical_profiles({adapter.url_field: getattr(profile, adapter.url_field) for adapter in registry})
+        for profile in profiles
+    }
+
+    # Union-find over profiles sharing a key; the root is the oldest profile
+    parent: Dict[int, int] = {}
+
+    def root(user_id: int) -> int:
+        while parent.get(user_id, user_id) != user_id:
+            user_id = parent[user_id]
+        return user_id
+
+    owners: Dict[ProfileKey, int] = {}
+    for profile in profiles:
+        for platform, (handle, _) in keys[profile.id].items():
+            owner = owners.setdefault((platform, handle), profile.id)
+            a, b = root(owner), root(profile.id)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+
+    by_id = {profile.id: profile for profile in profiles}
+    merged = 0
+    for profile in profiles:
+        target_id = root(profile.id)
+        if target_id == profile.id:
+            continue
+        target = by_id[target_id]
+        for platform, (handle, url) in keys[profile.id].items():
+            target_keys = keys[target_id]
+            if platform not in target_keys:
+                target_keys[platform] = (handle, url)
+                setattr(target, registry.get(platform).url_field, url)
+            _move_platform(db, platform, profile.id, target_id, keep_history=target_keys[platform][0] == handle)
+        view = db.get(ProfileView, profile.id)
+        if view is not None:
+            target_view = db.get(ProfileView, target_id)
+            if target_view is None:
+                db.add(ProfileView(user_id=target_id, last_viewed_at=view.last_viewed_at))
+            elif view.last_viewed_at and (target_view.last_viewed_at is None or view.last_viewed_at > target_view.last_viewed_at):
+                target_view.last_viewed_at = view.last_viewed_at
+            db.delete(view)
+        # Solves on platforms the profile no longer tracks
+        delete_solved(db, profile.id)
+        db.delete(profile)
+        merged += 1
+        logger.info(f"Merged duplicate profile {profile.id} into {target_id}")
+    db.flush()
+    return merged
+
+
+def rebuild_profile_handles(db: Session) -> int:
+    # Store canonical URLs in UserProfile and re-create the handle index from them
+    db.query(ProfileHandle).delete(synchronize_session=False)
+    rows: List[dict] = []
+    for profile in db.query(UserProfile):
+        for platform, (handle, url) in canonical_profiles(
+            {adapter.url_field: getattr(profile, adapter.url_field) for adapter in registry}
+        ).items():
+            setattr(profile, registry.get(platform).url_field, url)
+            rows.append({"platform": platform, "handle": handle, "user_id": profile.id})
+    if rows:
+        db.bulk_insert_mappings(ProfileHandle, rows)
+    return len(rows)
+
+
+def migrate_profile_handles(db: Session) -> Tuple[int, int]:
+    # Idempotent: merge duplicates, then index every profile's handles.
+    # Returns (profiles merged, handles indexed).
+    merged = merge_duplicate_profiles(db)
+    indexed = rebuild_profile_handles(db)
+    db.commit()
+    return merged, indexed
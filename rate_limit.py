@@ -0,0 +1,215 @@
+import asyncio
+import os
+import time
+from typing import Dict, Optional, Set
+
+from coordination import coordinator, Coordinator, SharedCoordinator
+
+# Requests per second allowed to each upstream (Codeforces asks for ~1 per 2 s)
+PLATFORM_RATES = {
+    "leetcode": float(os.getenv("RATE_LIMIT_LEETCODE", "2")),
+    "codechef": float(os.getenv("RATE_LIMIT_CODECHEF", "1")),
+    "codeforces": float(os.getenv("RATE_LIMIT_CODEFORCES", "0.5")),
+}
+DEFAULT_RATE = float(os.getenv("RATE_LIMIT_DEFAULT", "1"))
+# Requests that may go out back to back after an idle period
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "1"))
+# Backoff after a 429/5xx: doubles on each consecutive failure up to the max
+BACKOFF_BASE = float(os.getenv("RATE_LIMIT_BACKOFF_BASE", "5"))
+BACKOFF_MAX = float(os.getenv("RATE_LIMIT_BACKOFF_MAX", "600"))
+# Adaptive concurrency (AIMD): requests in flight per platform start at the
+# initial limit, grow by one per window of fast successes and halve on a
+# failure or a response slower than the target latency
+CONCURRENCY_INITIAL = float(os.getenv("CONCURRENCY_INITIAL", "4"))
+CONCURRENCY_MIN = float(os.getenv("CONCURRENCY_MIN", "1"))
+CONCURRENCY_MAX = float(os.getenv("CONCURRENCY_MAX", os.getenv("HTTP_LIMIT_PER_HOST", "10")))
+CONCURRENCY_TARGET_LATENCY = float(os.getenv("CONCURRENCY_TARGET_LATENCY", "2"))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = RATE_LIMIT_BURST):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.failures = 0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        # The lock makes waiters take tokens in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def backoff(self, retry_after: Optional[float] = None) -> float:
+        self.failures += 1
+        delay = min(BACKOFF_BASE * 2 ** (self.failures - 1), BACKOFF_MAX)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, BACKOFF_MAX))
+        self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+        return delay
+
+    def reset_backoff(self):
+        self.failures = 0
+
+    def state(self) -> dict:
+        return {
+            "rate": self.rate,
+            "tokens": round(self.tokens, 3),
+            "failures": self.failures,
+            "blocked_for": round(max(0.0, self.blocked_until - time.monotonic()), 3),
+        }
+
+
+class SharedTokenBucket(TokenBucket):
+    # Token bucket kept by the coordination backend, so the rate holds for all
+    # worker processes together. A backoff blocks the bucket for everyone;
+    # consecutive failures are still counted per process.
+
+    def __init__(self, name: str, rate: float, coordinator: SharedCoordinator, capacity: float = RATE_LIMIT_BURST):
+        super().__init__(rate, capacity)
+        self.name = name
+        self._coordinator = coordinator
+        self._pending: Set[asyncio.Task] = set()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                # Our own backoff applies at once, before the shared block is written
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                wait = await self._coordinator.take_token(self.name, self.rate, self.capacity)
+                if wait <= 0:
+                    return
+                await asyncio.sleep(wait)
+
+    def backoff(self, retry_after: Optional[float] = None) -> float:
+        delay = super().backoff(retry_after)
+        task = asyncio.get_running_loop().create_task(self._coordinator.block(self.name, delay))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+        return delay
+
+    def state(self) -> dict:
+        # tokens is the shared bucket's business; only the rate and this
+        # process's backoff are known here
+        state = super().state()
+        state.pop("tokens")
+        state["shared"] = True
+        return state
+
+
+class PlatformRateLimiter:
+    def __init__(self, rates: Dict[str, float] = PLATFORM_RATES, coordinator: Coordinator = coordinator):
+        self._rates = rates
+        self._coordinator = coordinator
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def bucket(self, platform: str) -> TokenBucket:
+        bucket = self._buckets.get(platform)
+        if bucket is None:
+            rate = self._rates.get(platform, DEFAULT_RATE)
+            if self._coordinator.shared:
+                bucket = SharedTokenBucket(f"upstream:{platform}", rate, self._coordinator)
+            else:
+                bucket = TokenBucket(rate)
+            self._buckets[platform] = bucket
+        return bucket
+
+    async def acquire(self, platform: str):
+        await self.bucket(platform).acquire()
+
+    def backoff(self, platform: str, retry_after: Optional[float] = None) -> float:
+        return self.bucket(platform).backoff(retry_after)
+
+    def success(self, platform: str):
+        self.bucket(platform).reset_backoff()
+
+    def state(self) -> dict:
+        return {platform: bucket.state() for platform, bucket in self._buckets.items()}
+
+
+rate_limiter = PlatformRateLimiter()
+
+
+class AdaptiveConcurrencyLimiter:
+    def __init__(self, initial: float = CONCURRENCY_INITIAL, minimum: float = CONCURRENCY_MIN,
+                 maximum: float = CONCURRENCY_MAX, target_latency: float = CONCURRENCY_TARGET_LATENCY):
+        self.minimum = max(minimum, 1.0)
+        self.maximum = max(maximum, self.minimum)
+        self.limit = min(max(initial, self.minimum), self.maximum)
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self.latency = None  # Moving average of recent response times
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            while self.in_flight >= int(self.limit):
+                await self._condition.wait()
+            self.in_flight += 1
+
+    async def release(self):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self, latency: float):
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        if latency > self.target_latency:
+            self._decrease()
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def on_failure(self):
+        self._decrease()
+
+    def _decrease(self):
+        # Requests already in flight when the limit was cut report back
+        # afterwards; count them as one congestion signal
+        now = time.monotonic()
+        if now - self._last_decrease < (self.latency or self.target_latency):
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit / 2)
+
+    def state(self) -> dict:
+        return {
+            "limit": round(self.limit, 3),
+            "in_flight": self.in_flight,
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+        }
+
+
+class PlatformConcurrencyLimiter:
+    def __init__(self):
+        self._limiters: Dict[str, AdaptiveConcurrencyLimiter] = {}
+
+    def limiter(self, platform: str) -> AdaptiveConcurrencyLimiter:
+        limiter = self._limiters.get(platform)
+        if limiter is None:
+            limiter = AdaptiveConcurrencyLimiter()
+            self._limiters[platform] = limiter
+        return limiter
+
+    def state(self) -> dict:
+        return {platform: limiter.state() for platform, limiter in self._limiters.items()}
+
+
+concurrency_limiter = PlatformConcurrencyLimiter()
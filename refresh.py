@@ -0,0 +1,112 @@
+import argparse
+import asyncio
+import logging
+import sys
+import time
+
+# Lightweight entry point for cron and batch refreshes: refreshes the
+# selected profiles once and exits. Nothing of the HTTP API is imported, the
+# app's modules only after the arguments are parsed, and each platform's
+# fetch code (HTTP client, parsers) only once one of its profiles is loaded.
+#
+#   python refresh.py                              # every tracked profile
+#   python refresh.py --platform codeforces --stale 3600
+#   python refresh.py --user 12 --user 15
+
+logger = logging.getLogger("refresh")
+
+_started = time.perf_counter()
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Refresh tracked profiles once and exit.")
+    parser.add_argument("--platform", action="append", dest="platforms", metavar="NAME",
+                        help="Only profiles on this platform (repeatable)")
+    parser.add_argument("--user", action="append", dest="users", type=int, metavar="ID",
+                        help="Only this user id (repeatable)")
+    parser.add_argument("--stale", type=float, metavar="SECONDS",
+                        help="Only profiles whose latest stats are older than this (or missing)")
+    parser.add_argument("--concurrency", type=int, metavar="N",
+                        help="Single-profile refreshes (or batches) in flight, default REFRESH_WORKERS")
+    return parser.parse_args(argv)
+
+
+def select_targets(targets, platforms=None, users=None, stale=None):
+    from datetime import datetime
+
+    now = datetime.utcnow()
+    return [
+        target for target in targets
+        if (not platforms or target.platform in platforms)
+        and (not users or target.user_id in users)
+        and (stale is None or target.last_refreshed is None
+             or (now - target.last_refreshed).total_seconds() >= stale)
+    ]
+
+
+async def refresh(args: argparse.Namespace) -> int:
+    from models import run_in_session, dispose_engines
+    from jobs import REFRESH_WORKERS
+    from scheduler import load_refresh_targets
+    from platforms import registry
+    from platforms.refresh import refresh_profile, refresh_cohort
+    from http_client import close_session
+
+    unknown = [name for name in args.platforms or [] if name not in registry]
+    if unknown:
+        logger.error(f"Unknown platform: {', '.join(unknown)} (expected one of {', '.join(registry.names())})")
+        return 2
+    logger.info(f"Ready in {time.perf_counter() - _started:.3f}s")
+
+    semaphore = asyncio.Semaphore(args.concurrency or REFRESH_WORKERS)
+    outcome = {}
+
+    async def run_single(target):
+        async with semaphore:
+            outcome[target.key] = bool(await refresh_profile(
+                target.platform, target.user_id, target.url, allow_stale=False
+            ))
+
+    async def run_batch(platform, batch):
+        async with semaphore:
+            try:
+                results = await refresh_cohort(platform, [(target.user_id, target.url) for target in batch])
+            except Exception as e:
+                logger.warning(f"{registry.get(platform).display_name} batch refresh failed: {str(e)}")
+                results = {}
+        for target in batch:
+            outcome[target.key] = results.get(target.user_id, False)
+
+    try:
+        targets = select_targets(await run_in_session(load_refresh_targets), args.platforms, args.users, args.stale)
+        tasks = []
+        for adapter in registry:
+            group = [target for target in targets if target.platform == adapter.name]
+            if adapter.batch_size > 0:
+                for start in range(0, len(group), adapter.batch_size):
+                    tasks.append(run_batch(adapter.name, group[start:start + adapter.batch_size]))
+            else:
+                tasks.extend(run_single(target) for target in group)
+        await asyncio.gather(*tasks)
+    finally:
+        await close_session()
+        await dispose_engines()
+
+    failed = sum(1 for succeeded in outcome.values() if not succeeded)
+    logger.info(
+        f"Refreshed {len(outcome) - failed} of {len(outcome)} profiles ({failed} failed) "
+        f"in {time.perf_counter() - _started:.1f}s"
+    )
+    return 1 if failed else 0
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    from log_config import configure_logging
+
+    configure_logging()
+    return asyncio.run(refresh(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
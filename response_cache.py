@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from metrics import STATS_CACHE_LOOKUPS
+
+# Rendered /user/{id}/stats bodies kept in memory
+STATS_CACHE_MAX_ENTRIES = int(os.getenv("STATS_CACHE_MAX_ENTRIES", "10000"))
+# Snapshots written in this process invalidate their user's entry at once;
+# the TTL bounds how long writes from other processes (a separate scheduler
+# worker) can go unnoticed
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "60"))
+
+
+def render_json(content) -> bytes:
+    # Same encoding as FastAPI's JSONResponse
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # If-None-Match uses weak comparison, so W/"x" matches "x"
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    # user_id -> (body, etag), LRU bounded. Thread-safe, since snapshots are
+    # saved (and invalidate entries) from database worker threads.
+
+    def __init__(self, max_entries: int = STATS_CACHE_MAX_ENTRIES, ttl: float = STATS_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Tuple[bytes, str, float]]" = OrderedDict()
+        # Keys being loaded -> [loads running, invalidations since the first
+        # started], so a load that raced with a write is not stored. Dropped
+        # with the key's last load, so only running loads take space.
+        self._loading: Dict[int, List[int]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: int) -> Optional[Tuple[bytes, str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[2] > self.ttl:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0], entry[1]
+
+    def invalidate(self, key: int):
+        with self._lock:
+            self._entries.pop(key, None)
+            loading = self._loading.get(key)
+            if loading is not None:
+                loading[1] += 1
+
+    async def get_or_load(self, key: int, loader: Callable[[], Awaitable]) -> Tuple[bytes, str]:
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            STATS_CACHE_LOOKUPS.inc(result="hit")
+            return cached
+        self.misses += 1
+        STATS_CACHE_LOOKUPS.inc(result="miss")
+
+        with self._lock:
+            loading = self._loading.setdefault(key, [0, 0])
+            loading[0] += 1
+            version = loading[1]
+        body = etag = None
+        try:
+            body = render_json(await loader())
+            etag = make_etag(body)
+        finally:
+            with self._lock:
+                if etag is not None and loading[1] == version and self.max_entries > 0:
+                    self._entries[key] = (body, etag, time.monotonic())
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                loading[0] -= 1
+                if loading[0] == 0:
+                    del self._loading[key]
+        return body, etag
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+stats_response_cache = ResponseCache()
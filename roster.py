@@ -0,0 +1,416 @@
+import asyncio
+import codecs
+import csv
+import json
+import logging
+import os
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import run_in_session, UserProfile
+from profiles import canonical_profiles, HandleIndex, ProfileKey
+from jobs import Job, SUCCEEDED
+from scheduler import BatchRefresher, default_batch_refreshers, run_batch
+from platforms import registry
+
+logger = logging.getLogger(__name__)
+
+# Roster rows upserted per transaction
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "500"))
+# First-time fetches (single profiles or batches) running at once, over all imports
+IMPORT_CONCURRENCY = int(os.getenv("IMPORT_CONCURRENCY", "8"))
+# Finished imports kept around for GET /imports/{id}
+IMPORT_HISTORY_LIMIT = int(os.getenv("IMPORT_HISTORY_LIMIT", "100"))
+# Invalid rows reported per import
+IMPORT_MAX_ERRORS = 100
+# Attempts at storing a chunk whose handles are claimed concurrently by
+# /track-profiles or another import; its rows are reported failed after that
+IMPORT_CHUNK_ATTEMPTS = 2
+
+CSV = "csv"
+JSONL = "jsonl"
+CONTENT_TYPES = {
+    "text/csv": CSV,
+    "application/csv": CSV,
+    "application/x-ndjson": JSONL,
+    "application/jsonl": JSONL,
+    "application/json-lines": JSONL,
+}
+
+IMPORTING = "importing"
+FETCHING = "fetching"
+DONE = "done"
+
+RosterRecord = Tuple[int, Optional[dict], Optional[str]]
+
+
+def roster_format(content_type: Optional[str], requested: Optional[str] = None) -> Optional[str]:
+    # CSV or JSONL from ?format=, else from the Content-Type; None to sniff the first line
+    if requested:
+        if requested not in (CSV, JSONL):
+            raise ValueError(f"Unknown roster format: {requested}")
+        return requested
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    return CONTENT_TYPES.get(media_type)
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    # Lines of a streamed UTF-8 body, without holding more than one chunk
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+class CSVRecords:
+    # One csv.reader over a roster's lines, so quoted fields may span lines.
+    # Lines are held back until their quotes balance, so the reader never
+    # runs out of input in the middle of a record. The first row is the
+    # header naming the columns.
+
+    def __init__(self, first_line: int = 1):
+        self._lines = deque()
+        self._quotes = 0
+        self._offset = first_line - 1
+        self._reader = csv.reader(self)
+        self._header: Optional[List[str]] = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self._lines:
+            raise StopIteration
+        return self._lines.popleft()
+
+    def feed(self, line: str) -> List[RosterRecord]:
+        self._lines.append(line + "\n")
+        self._quotes += line.count('"')
+        return self.records() if self._quotes % 2 == 0 else []
+
+    def records(self) -> List[RosterRecord]:
+        # Every record in the lines fed so far; at the end of the roster,
+        # also an unterminated last one
+        records = []
+        while self._lines:
+            number = self._offset + self._reader.line_num + 1
+            try:
+                values = next(self._reader)
+            except StopIteration:
+                break
+            except csv.Error as e:
+                records.append((number, None, f"Invalid CSV: {e}"))
+                continue
+            if not any(value.strip() for value in values):
+                continue
+            if self._header is None:
+                self._header = [value.strip() for value in values]
+                continue
+            records.append((number, dict(zip(self._header, values)), None))
+        self._quotes = 0
+        return records
+
+
+async def parse_roster(lines: AsyncIterator[str], fmt: Optional[str]) -> AsyncIterator[RosterRecord]:
+    # (line number, record, error) per record: a non-empty JSONL line, or a
+    # CSV row (which starts on that line)
+    records: Optional[CSVRecords] = None
+    number = 0
+    async for line in lines:
+        number += 1
+        if fmt is None:
+            if not line.strip():
+                continue
+            fmt = JSONL if line.lstrip().startswith("{") else CSV
+        if fmt == CSV:
+            if records is None:
+                records = CSVRecords(number)
+            for record in records.feed(line):
+                yield record
+            continue
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, None, "Invalid JSON"
+            continue
+        if not isinstance(record, dict):
+            yield number, None, "Expected a JSON object"
+            continue
+        yield number, record, None
+    if records is not None:
+        for record in records.records():
+            yield record
+
+
+def roster_urls(record: dict) -> Tuple[Dict[str, str], Optional[str]]:
+    # Profile URLs of a roster record by UserProfile column; a column may be
+    # named after the URL field (leetcode_url) or the platform (leetcode).
+    # Other columns (names, emails) are ignored.
+    urls = {}
+    for adapter in registry:
+        value = record.get(adapter.url_field, record.get(adapter.name))
+        if value is None:
+            continue
+        if not isinstance(value, str):
+            return {}, f"{adapter.url_field} must be a string"
+        value = value.strip()
+        if not value:
+            continue
+        if not adapter.handle(value):
+            return {}, f"Invalid {adapter.display_name} URL"
+        urls[adapter.url_field] = value
+    if not urls:
+        return {}, "No profile URL"
+    return urls, None
+
+
+def upsert_profiles(db: Session, rows: List[Dict[str, str]]) -> Tuple[Dict[str, int], List[Tuple[int, str, str]]]:
+    # Bulk version of main.upsert_profile: the handles of the whole chunk are
+    # looked up with a fixed number of queries and everything is written in
+    # one transaction. Rows in the same roster that share a handle end up on
+    # the same profile. Returns counts and the (user_id, platform, canonical
+    # URL) of each handle that is new or changed and so needs a first fetch.
+    canonical = [canonical_profiles(row) for row in rows]
+    index = HandleIndex(db, ((platform, handle) for profiles in canonical for platform, (handle, _) in profiles.items()))
+    # Keys taken (or given up, None) by earlier rows of this chunk, and the
+    # handle each profile ends up with per platform
+    claimed: Dict[ProfileKey, Optional[UserProfile]] = {}
+    handles: Dict[Tuple[int, str], Tuple[UserProfile, str, str]] = {}
+    counts = {"created": 0, "updated": 0, "unchanged": 0}
+    now = datetime.utcnow()
+    for profiles in canonical:
+        # Like /track-profiles, the first platform that matches picks the profile
+        owners = {
+            platform: claimed[(platform, handle)] if (platform, handle) in claimed else index.profile((platform, handle))
+            for platform, (handle, _) in profiles.items()
+        }
+        profile = next((owner for owner in owners.values() if owner is not None), None)
+        if profile is None:
+            profile = UserProfile(**{adapter.url_field: "" for adapter in registry})
+            db.add(profile)
+            counts["created"] += 1
+            changed = dict(profiles)
+        else:
+            changed = {platform: key for platform, key in profiles.items() if owners[platform] is not profile}
+            if changed:
+                profile.updated_at = now
+            counts["updated" if changed else "unchanged"] += 1
+        for platform, (handle, url) in changed.items():
+            previous = handles.get((id(profile), platform))
+            if previous is None and profile.id is not None and (profile.id, platform) in index.by_user:
+                previous = (profile, index.by_user[(profile.id, platform)].handle, "")
+            if previous is not None:
+                claimed[(platform, previous[1])] = None
+            claimed[(platform, handle)] = profile
+            handles[(id(profile), platform)] = (profile, handle, url)
+
+    # One flush gives every new profile its id
+    db.flush()
+    pending = []
+    for (_, platform), (profile, handle, url) in handles.items():
+        index.assign(profile, platform, handle, url)
+        pending.append((profile.id, platform, url))
+    index.commit()
+    return counts, pending
+
+
+class RosterImport:
+    def __init__(self, fmt: Optional[str]):
+        self.id = uuid.uuid4().hex
+        self.format = fmt
+        self.status = IMPORTING
+        self.error: Optional[str] = None
+        self.rows = 0
+        self.counts = {"created": 0, "updated": 0, "unchanged": 0, "invalid": 0, "failed": 0}
+        self.invalid_rows: List[dict] = []
+        self.failed_rows: List[dict] = []
+        # Per platform: profiles queued, succeeded and failed
+        self.fetches: Dict[str, Dict[str, int]] = {}
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self._running = 0
+
+    @property
+    def done(self) -> bool:
+        return self.status == DONE
+
+    def invalid(self, line: int, error: str):
+        self.counts["invalid"] += 1
+        if len(self.invalid_rows) < IMPORT_MAX_ERRORS:
+            self.invalid_rows.append({"line": line, "error": error})
+
+    def failed(self, line: int, error: str):
+        # A valid row that couldn't be stored
+        self.counts["failed"] += 1
+        if len(self.failed_rows) < IMPORT_MAX_ERRORS:
+            self.failed_rows.append({"line": line, "error": error})
+
+    def fetch_counts(self, platform: str) -> Dict[str, int]:
+        return self.fetches.setdefault(platform, {"queued": 0, "succeeded": 0, "failed": 0})
+
+    def to_dict(self) -> dict:
+        totals = {"queued": 0, "succeeded": 0, "failed": 0}
+        for counts in self.fetches.values():
+            for name, value in counts.items():
+                totals[name] += value
+        return {
+            "import_id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "rows": self.rows,
+            **self.counts,
+            "invalid_rows": self.invalid_rows,
+            "failed_rows": self.failed_rows,
+            "fetches": {**totals, "remaining": totals["queued"] - totals["succeeded"] - totals["failed"]},
+            "fetches_by_platform": self.fetches,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class RosterImporter:
+    # Imports a roster in chunks of IMPORT_CHUNK_SIZE rows, one transaction
+    # each, and starts the first fetch of every new or changed profile as soon
+    # as its chunk is stored. At most IMPORT_CONCURRENCY fetches run at once,
+    # so a big roster doesn't hold up interactive /track-profiles requests.
+    # Like the scheduler, single profiles go through the job queue (merged
+    # with any job already queued for them) and batched platforms are fetched
+    # a batch at a time, leaving out profiles the queue is already refreshing.
+    # Per-platform rate limits still apply.
+
+    def __init__(self, enqueue: Callable[..., Job], is_active: Callable[[int, str], bool],
+                 concurrency: int = IMPORT_CONCURRENCY, chunk_size: int = IMPORT_CHUNK_SIZE,
+                 history_limit: int = IMPORT_HISTORY_LIMIT,
+                 batch_refreshers: Optional[Dict[str, Tuple[BatchRefresher, int]]] = None,
+                 on_job_done: Optional[Callable[[Job], None]] = None):
+        self._enqueue = enqueue
+        self._is_active = is_active
+        self._batch_refreshers = batch_refreshers if batch_refreshers is not None else default_batch_refreshers()
+        # Called for each profile of a finished batch (queued jobs report through the queue)
+        self._on_job_done = on_job_done
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.chunk_size = chunk_size
+        self._history_limit = history_limit
+        self._imports: "OrderedDict[str, RosterImport]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def get(self, import_id: str) -> Optional[RosterImport]:
+        return self._imports.get(import_id)
+
+    async def run(self, lines: AsyncIterator[str], fmt: Optional[str] = None) -> RosterImport:
+        # Store every row of the roster; returns once the last chunk is
+        # committed, with the fetches still running
+        roster_import = RosterImport(fmt)
+        self._imports[roster_import.id] = roster_import
+        self._trim_history()
+        chunk: List[Tuple[int, Dict[str, str]]] = []
+        try:
+            async for line, record, error in parse_roster(lines, fmt):
+                roster_import.rows += 1
+                urls, error = roster_urls(record) if error is None else ({}, error)
+                if error is not None:
+                    roster_import.invalid(line, error)
+                    continue
+                chunk.append((line, urls))
+                if len(chunk) >= self.chunk_size:
+                    await self._store_chunk(roster_import, chunk)
+                    chunk = []
+            if chunk:
+                await self._store_chunk(roster_import, chunk)
+        except Exception as e:
+            roster_import.error = str(e)
+            logger.error(f"Roster import {roster_import.id} failed after {roster_import.rows} rows: {str(e)}")
+        roster_import.status = FETCHING
+        self._finish_if_idle(roster_import)
+        logger.info(
+            f"Roster import {roster_import.id}: {roster_import.rows} rows, {roster_import.counts}, "
+            f"{sum(counts['queued'] for counts in roster_import.fetches.values())} fetches queued"
+        )
+        return roster_import
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _store_chunk(self, roster_import: RosterImport, chunk: List[Tuple[int, Dict[str, str]]]):
+        rows = [urls for _, urls in chunk]
+        for attempt in range(IMPORT_CHUNK_ATTEMPTS):
+            try:
+                counts, pending = await run_in_session(upsert_profiles, rows)
+                break
+            except IntegrityError as e:
+                # Another request took one of the chunk's handles first; the
+                # retry finds its profile
+                error = str(e.orig)
+                logger.info(f"Roster import {roster_import.id}: handle claimed concurrently, attempt {attempt + 1}")
+        else:
+            logger.warning(f"Roster import {roster_import.id}: {len(chunk)} rows not stored: {error}")
+            for line, _ in chunk:
+                roster_import.failed(line, f"Not stored: {error}")
+            return
+        for name, value in counts.items():
+            roster_import.counts[name] += value
+
+        batches: Dict[str, List[Job]] = {}
+        for user_id, platform, url in pending:
+            roster_import.fetch_counts(platform)["queued"] += 1
+            if platform in self._batch_refreshers and not self._is_active(user_id, platform):
+                # Jobs outside the queue, only used to track the outcome per profile
+                batches.setdefault(platform, []).append(Job(user_id, platform, url))
+            else:
+                self._start(roster_import, self._fetch_queued, user_id, platform, url)
+        for platform, jobs in batches.items():
+            batch_size = self._batch_refreshers[platform][1]
+            for start in range(0, len(jobs), batch_size):
+                self._start(roster_import, self._fetch_batch, jobs[start:start + batch_size])
+
+    def _start(self, roster_import: RosterImport, fetch: Callable[..., Awaitable[None]], *args):
+        roster_import._running += 1
+        task = asyncio.create_task(self._run_fetch(roster_import, fetch, *args))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_fetch(self, roster_import: RosterImport, fetch: Callable[..., Awaitable[None]], *args):
+        try:
+            async with self._semaphore:
+                await fetch(roster_import, *args)
+        finally:
+            roster_import._running -= 1
+            self._finish_if_idle(roster_import)
+
+    async def _fetch_queued(self, roster_import: RosterImport, user_id: int, platform: str, url: str):
+        job = self._enqueue(user_id, platform, url, allow_stale=False)
+        await job.finished.wait()
+        roster_import.fetch_counts(platform)["succeeded" if job.status == SUCCEEDED else "failed"] += 1
+
+    async def _fetch_batch(self, roster_import: RosterImport, jobs: List[Job]):
+        await run_batch(self._batch_refreshers[jobs[0].platform][0], jobs, self._on_job_done, "First fetch")
+        counts = roster_import.fetch_counts(jobs[0].platform)
+        for job in jobs:
+            counts["succeeded" if job.status == SUCCEEDED else "failed"] += 1
+
+    def _finish_if_idle(self, roster_import: RosterImport):
+        if roster_import.status == FETCHING and roster_import._running == 0:
+            roster_import.status = DONE
+            roster_import.finished_at = datetime.utcnow()
+
+    def _trim_history(self):
+        while len(self._imports) > self._history_limit:
+            oldest_id, oldest = next(iter(self._imports.items()))
+            if not oldest.done:
+                break
+            del self._imports[oldest_id]
@@ -0,0 +1,345 @@
+import asyncio
+import functools
+import logging
+import os
+import random
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import run_in_session, UserProfile, LatestStats, ProfileView
+from rate_limit import PLATFORM_RATES, DEFAULT_RATE
+from coordination import coordinator
+from log_config import configure_logging
+from jobs import Job, JobQueue, REFRESH_JOB_TIMEOUT, RUNNING, SUCCEEDED, FAILED, record_finished
+from snapshots import compact_history
+from platforms import registry
+from platforms.refresh import refresh_cohort, run_refresh_job
+
+logger = logging.getLogger(__name__)
+
+# Target maximum age of every tracked profile's stats
+SCHEDULER_INTERVAL = float(os.getenv("SCHEDULER_INTERVAL", "3600"))
+# How often the plan is rebuilt; work due later in the interval waits for a later tick
+SCHEDULER_TICK = float(os.getenv("SCHEDULER_TICK", "60"))
+# Random extra delay, as a fraction of each job's slot
+SCHEDULER_JITTER = float(os.getenv("SCHEDULER_JITTER", "0.5"))
+# Profiles viewed within this window are refreshed VIEWED_INTERVAL_FACTOR times as often
+SCHEDULER_VIEW_WINDOW = float(os.getenv("SCHEDULER_VIEW_WINDOW", "86400"))
+SCHEDULER_VIEWED_INTERVAL_FACTOR = float(os.getenv("SCHEDULER_VIEWED_INTERVAL_FACTOR", "0.25"))
+# Stop feeding the job queue while this many jobs are pending or running
+SCHEDULER_MAX_BACKLOG = int(os.getenv("SCHEDULER_MAX_BACKLOG", "200"))
+# Per-profile retry delay after a failed refresh doubles up to this cap
+SCHEDULER_FAILURE_BACKOFF_MAX = float(os.getenv("SCHEDULER_FAILURE_BACKOFF_MAX", "21600"))
+VIEW_FLUSH_INTERVAL = float(os.getenv("VIEW_FLUSH_INTERVAL", "30"))
+# How often old snapshot history is downsampled
+HISTORY_COMPACT_INTERVAL = float(os.getenv("HISTORY_COMPACT_INTERVAL", "86400"))
+
+BatchRefresher = Callable[[List[Tuple[int, str]]], Awaitable[Dict[int, bool]]]
+
+
+def default_batch_refreshers() -> Dict[str, Tuple[BatchRefresher, int]]:
+    # Platforms whose profiles are refreshed many at a time, bypassing the
+    # job queue: (refresher, profiles per batch)
+    return {
+        adapter.name: (functools.partial(refresh_cohort, adapter.name), adapter.batch_size)
+        for adapter in registry
+        if adapter.batch_size > 0
+    }
+
+
+async def run_batch(refresh: BatchRefresher, jobs: List[Job], on_job_done: Optional[Callable[[Job], None]] = None,
+                    description: str = "Batch refresh"):
+    # Refresh one batch of a platform's profiles, tracking the outcome per
+    # profile in jobs that stay outside the queue
+    started = datetime.utcnow()
+    for job in jobs:
+        job.status = RUNNING
+        job.started_at = started
+    error, failure = "Fetch failed", "failure"
+    # Rate limiting alone makes a big batch take a while
+    platform = jobs[0].platform
+    timeout = REFRESH_JOB_TIMEOUT + RefreshScheduler.requests(platform, len(jobs)) / PLATFORM_RATES.get(platform, DEFAULT_RATE)
+    clock = time.monotonic()
+    try:
+        outcome = await asyncio.wait_for(refresh([(job.user_id, job.url) for job in jobs]), timeout=timeout)
+    except asyncio.TimeoutError:
+        outcome, error, failure = {}, "Timed out", "timeout"
+        logger.warning(f"{description} of {len(jobs)} {platform} profiles timed out")
+    except Exception as e:
+        outcome, error, failure = {}, str(e), "error"
+        logger.error(f"{description} of {len(jobs)} {platform} profiles failed: {str(e)}")
+    finished = datetime.utcnow()
+    elapsed = time.monotonic() - clock
+    for job in jobs:
+        ok = outcome.get(job.user_id, False)
+        job.status = SUCCEEDED if ok else FAILED
+        job.error = None if ok else error
+        job.finished_at = finished
+        record_finished(job, elapsed, "success" if ok else failure)
+        if on_job_done is not None:
+            on_job_done(job)
+
+
+class RefreshTarget:
+    __slots__ = ("user_id", "platform", "url", "last_refreshed", "last_viewed")
+
+    def __init__(self, user_id: int, platform: str, url: str,
+                 last_refreshed: Optional[datetime], last_viewed: Optional[datetime]):
+        self.user_id = user_id
+        self.platform = platform
+        self.url = url
+        self.last_refreshed = last_refreshed
+        self.last_viewed = last_viewed
+
+    @property
+    def key(self) -> Tuple[int, str]:
+        return (self.user_id, self.platform)
+
+
+def load_refresh_targets(db: Session) -> List[RefreshTarget]:
+    # Three flat queries regardless of how many profiles are tracked
+    refreshed = {
+        (user_id, platform): recorded_at
+        for user_id, platform, recorded_at in db.query(
+            LatestStats.user_id, LatestStats.platform, LatestStats.recorded_at
+        )
+    }
+    viewed = dict(db.query(ProfileView.user_id, ProfileView.last_viewed_at))
+
+    platforms = registry.names()
+    targets = []
+    rows = db.query(UserProfile.id, *(getattr(UserProfile, adapter.url_field) for adapter in registry))
+    for user_id, *urls in rows:
+        for platform, url in zip(platforms, urls):
+            if url:
+                targets.append(RefreshTarget(
+                    user_id, platform, url, refreshed.get((user_id, platform)), viewed.get(user_id)
+                ))
+    return targets
+
+
+class ViewTracker:
+    # Collects dashboard views in memory and writes them out in batches,
+    # so reading stats never waits on a write
+
+    def __init__(self):
+        self._views: Dict[int, datetime] = {}
+
+    def record(self, user_id: int):
+        self._views[user_id] = datetime.utcnow()
+
+    async def flush(self):
+        if not self._views:
+            return
+        views, self._views = self._views, {}
+        await run_in_session(_store_views, views)
+
+    async def run(self, interval: float = VIEW_FLUSH_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to store profile views: {str(e)}")
+
+
+def _store_views(db: Session, views: Dict[int, datetime]):
+    for user_id, viewed_at in views.items():
+        db.merge(ProfileView(user_id=user_id, last_viewed_at=viewed_at))
+    db.commit()
+
+
+async def run_history_compaction(interval: float = HISTORY_COMPACT_INTERVAL):
+    while True:
+        try:
+            # The lease is kept for the whole interval, so of several workers
+            # only the first to get here compacts
+            if await coordinator.acquire("history-compaction", interval):
+                removed = await run_in_session(compact_history)
+                logger.info(f"History compaction removed {removed} snapshots")
+        except Exception as e:
+            logger.error(f"History compaction failed: {str(e)}")
+        await asyncio.sleep(interval)
+
+
+class RefreshScheduler:
+    # Periodically re-fetches every tracked profile. Each tick it ranks the
+    # profiles that are due (never fetched first, then by how overdue they
+    # are, recently viewed ones becoming due sooner), spreads them over the
+    # interval per platform without exceeding that platform's rate limit,
+    # and hands the ones whose slot falls into this tick to the job queue
+    # (or, for batched platforms, refreshes them a batch at a time).
+
+    def __init__(self, enqueue: Callable[..., Job], backlog: Callable[[], int],
+                 is_active: Callable[[int, str], bool], interval: float = SCHEDULER_INTERVAL,
+                 tick: float = SCHEDULER_TICK, jitter: float = SCHEDULER_JITTER,
+                 max_backlog: int = SCHEDULER_MAX_BACKLOG,
+                 batch_refreshers: Optional[Dict[str, Tuple[BatchRefresher, int]]] = None,
+                 on_job_done: Optional[Callable[[Job], None]] = None):
+        self._enqueue = enqueue
+        # Called for each profile of a finished batch (queued jobs report through the queue)
+        self._on_job_done = on_job_done
+        self._backlog = backlog
+        self._is_active = is_active
+        self._batch_refreshers = batch_refreshers if batch_refreshers is not None else default_batch_refreshers()
+        self._batches: Set[asyncio.Task] = set()
+        self.interval = interval
+        self.tick = min(tick, interval)
+        self.jitter = jitter
+        self.max_backlog = max_backlog
+        self._submitted: Dict[Tuple[int, str], Job] = {}
+        self._failures: Dict[Tuple[int, str], int] = {}
+        self._retry_at: Dict[Tuple[int, str], float] = {}
+
+    def _target_age(self, target: RefreshTarget, now: datetime) -> float:
+        if target.last_viewed and (now - target.last_viewed).total_seconds() < SCHEDULER_VIEW_WINDOW:
+            return self.interval * SCHEDULER_VIEWED_INTERVAL_FACTOR
+        return self.interval
+
+    def due(self, targets: List[RefreshTarget], now: datetime) -> List[RefreshTarget]:
+        clock = time.monotonic()
+        ranked = []
+        for target in targets:
+            if (self._retry_at.get(target.key, 0) > clock or target.key in self._submitted
+                    or self._is_active(*target.key)):
+                continue
+            target_age = self._target_age(target, now)
+            if target.last_refreshed is None:
+                priority = float("inf")
+            else:
+                age = (now - target.last_refreshed).total_seconds()
+                if age < target_age:
+                    continue
+                priority = age / target_age
+            ranked.append((priority, target))
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        return [target for _, target in ranked]
+
+    @staticmethod
+    def requests(platform: str, profiles: int) -> int:
+        per_batch, per_profile = registry.get(platform).requests_per_refresh
+        return per_batch + per_profile * profiles
+
+    def plan(self, due: List[RefreshTarget]) -> List[Tuple[float, List[RefreshTarget]]]:
+        # Delay (seconds from now) for each refresh that starts within this
+        # tick; a refresh is a single profile, or a batch on batched platforms
+        by_platform: Dict[str, List[RefreshTarget]] = {}
+        for target in due:
+            by_platform.setdefault(target.platform, []).append(target)
+
+        plan = []
+        for platform, targets in by_platform.items():
+            batch_size = self._batch_refreshers[platform][1] if platform in self._batch_refreshers else 1
+            groups = [targets[start:start + batch_size] for start in range(0, len(targets), batch_size)]
+            min_slot = self.requests(platform, len(groups[0])) / PLATFORM_RATES.get(platform, DEFAULT_RATE)
+            slot = max(self.interval / len(groups), min_slot)
+            for position, group in enumerate(groups):
+                delay = position * slot + random.uniform(0, min(slot, self.tick) * self.jitter)
+                if delay >= self.tick:
+                    break
+                plan.append((delay, group))
+        plan.sort(key=lambda item: item[0])
+        return plan
+
+    def _collect_results(self):
+        clock = time.monotonic()
+        for key, job in list(self._submitted.items()):
+            if not job.done:
+                continue
+            del self._submitted[key]
+            if job.status == SUCCEEDED:
+                self._failures.pop(key, None)
+                self._retry_at.pop(key, None)
+            else:
+                failures = self._failures.get(key, 0) + 1
+                self._failures[key] = failures
+                self._retry_at[key] = clock + min(self.tick * 2 ** failures, SCHEDULER_FAILURE_BACKOFF_MAX)
+
+    def _start_batch(self, platform: str, targets: List[RefreshTarget]):
+        refresh = self._batch_refreshers[platform][0]
+        # Jobs outside the queue, only used to track the outcome per profile
+        jobs = [Job(target.user_id, platform, target.url, allow_stale=False) for target in targets]
+        for job in jobs:
+            self._submitted[job.key] = job
+        task = asyncio.create_task(run_batch(refresh, jobs, self._on_job_done))
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+
+    async def run_tick(self):
+        started = time.monotonic()
+        self._collect_results()
+        targets = await run_in_session(load_refresh_targets)
+        due = self.due(targets, datetime.utcnow())
+        plan = self.plan(due)
+        logger.info(f"Scheduler: {len(targets)} tracked, {len(due)} due, {len(plan)} starting this tick")
+
+        for delay, group in plan:
+            wait = started + delay - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            platform = group[0].platform
+            if platform in self._batch_refreshers:
+                self._start_batch(platform, group)
+                continue
+            while self._backlog() >= self.max_backlog:
+                await asyncio.sleep(1)
+            for target in group:
+                job = self._enqueue(target.user_id, target.platform, target.url, allow_stale=False)
+                self._submitted[target.key] = job
+
+        remaining = self.tick - (time.monotonic() - started)
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+
+    async def run(self):
+        logger.info(f"Refresh scheduler started (interval {self.interval:.0f}s, tick {self.tick:.0f}s)")
+        try:
+            while True:
+                try:
+                    # Of several API or refresh workers only the lease holder plans refreshes
+                    if not await coordinator.acquire("scheduler", self.tick * 3):
+                        await asyncio.sleep(self.tick)
+                        continue
+                    await self.run_tick()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Scheduler tick failed: {str(e)}")
+                    await asyncio.sleep(self.tick)
+        finally:
+            batches = list(self._batches)
+            for task in batches:
+                task.cancel()
+            await asyncio.gather(*batches, return_exceptions=True)
+            await coordinator.release("scheduler")
+
+
+async def run_worker():
+    # Standalone refresh worker: its own job queue and scheduler, no HTTP API
+    # (and none of its imports)
+    from http_client import close_session
+    from models import dispose_engines
+
+    job_queue = JobQueue(run_refresh_job)
+    scheduler = RefreshScheduler(job_queue.enqueue, lambda: job_queue.backlog, job_queue.is_active)
+    job_queue.start()
+    compaction = asyncio.create_task(run_history_compaction())
+    try:
+        await scheduler.run()
+    finally:
+        compaction.cancel()
+        await asyncio.gather(compaction, return_exceptions=True)
+        await job_queue.stop()
+        await close_session()
+        await dispose_engines()
+
+
+if __name__ == "__main__":
+    configure_logging()
+    try:
+        asyncio.run(run_worker())
+    except KeyboardInterrupt:
+        pass
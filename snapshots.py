@@ -0,0 +1,410 @@
+import json
+import os
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional
+
+from sqlalchemy import func, String, type_coerce
+from sqlalchemy.orm import Session
+
+from response_cache import stats_response_cache
+from metrics import DB_WRITE_SECONDS
+from models import run_in_session, LatestStats
+from solved import add_solved, users_with_solved
+from platforms import registry
+
+# Largest IN () list sent in one statement (SQLite allows 32766 variables)
+BATCH_QUERY_SIZE = 10000
+STREAM_USERS_PER_CHUNK = 500
+
+LEADERBOARD_SORTS = ("total_solved", "rating")
+
+# Columns that say where/when a snapshot was taken rather than what it contains
+SNAPSHOT_META_COLUMNS = {"id", "user_id", "recorded_at", "last_seen_at", "delta_base_id"}
+
+# History older than this is downsampled to the last snapshot of each day
+HISTORY_FULL_RESOLUTION_DAYS = float(os.getenv("HISTORY_FULL_RESOLUTION_DAYS", "30"))
+
+
+def platform_stats(platform: str, row) -> dict:
+    return registry.get(platform).stats(row)
+
+
+def json_delta(base: dict, new: dict) -> dict:
+    # Changed and added keys with their new value, removed keys as None
+    delta = {key: value for key, value in new.items() if key not in base or base[key] != value}
+    delta.update({key: None for key in base if key not in new})
+    return delta
+
+
+def apply_json_delta(base: dict, delta: dict) -> dict:
+    result = dict(base)
+    for key, value in delta.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = value
+    return result
+
+
+def encode_json_delta(keyframe_json: Optional[dict], full: Optional[dict]) -> Optional[dict]:
+    # Only worth it when the delta is well under the size of the full value
+    delta = json_delta(keyframe_json or {}, full or {})
+    if len(json.dumps(delta)) * 2 < len(json.dumps(full or {})):
+        return delta
+    return None
+
+
+def materialize_json(db: Session, platform: str, row) -> Optional[dict]:
+    # Full tag/category JSON of a stored row. Deltas always point at a full
+    # row, so this is at most one extra lookup.
+    adapter = registry.get(platform)
+    column = adapter.delta_json_column
+    value = getattr(row, column)
+    if row.delta_base_id is None:
+        return value
+    keyframe = db.get(adapter.model, row.delta_base_id)
+    base = getattr(keyframe, column) if keyframe is not None else None
+    return apply_json_delta(base or {}, value or {})
+
+
+def stored_platform_stats(db: Session, platform: str, row) -> dict:
+    # platform_stats for a row read back from the history tables
+    adapter = registry.get(platform)
+    stats = adapter.stats(row)
+    if adapter.delta_json_column and row.delta_base_id is not None:
+        stats[adapter.delta_json_stats_key] = materialize_json(db, platform, row)
+    return stats
+
+
+def snapshot_values(row) -> dict:
+    return {
+        column.name: getattr(row, column.name)
+        for column in row.__table__.columns
+        if column.name not in SNAPSHOT_META_COLUMNS
+    }
+
+
+def update_latest(db: Session, platform: str, row, stats: Optional[dict] = None):
+    db.merge(LatestStats(
+        user_id=row.user_id,
+        platform=platform,
+        snapshot_id=row.id,
+        total_solved=row.total_problems_solved or 0,
+        rating=row.contest_rating,
+        stats=stats if stats is not None else platform_stats(platform, row),
+        recorded_at=row.last_seen_at or row.recorded_at
+    ))
+
+
+def _record_snapshot(db: Session, platform: str, row):
+    # If nothing changed since the user's previous snapshot, that row's
+    # validity is extended instead of adding a new one; otherwise the new row
+    # is added (tag/category JSON delta-encoded where that is smaller) and the
+    # latest pointer moves. The caller commits.
+    adapter = registry.get(platform)
+    model = adapter.model
+    json_column = adapter.delta_json_column
+    now = row.recorded_at or datetime.utcnow()
+    row.recorded_at = row.last_seen_at = now
+    stats = adapter.stats(row)
+
+    latest = db.get(LatestStats, (row.user_id, platform))
+    previous = db.get(model, latest.snapshot_id) if latest is not None and latest.snapshot_id else None
+    if previous is not None:
+        previous_values = snapshot_values(previous)
+        if json_column:
+            previous_values[json_column] = materialize_json(db, platform, previous)
+        if previous_values == snapshot_values(row):
+            previous.last_seen_at = now
+            latest.recorded_at = now
+            return previous
+
+        if json_column:
+            keyframe = previous
+            if previous.delta_base_id is not None:
+                keyframe = db.get(model, previous.delta_base_id)
+            if keyframe is not None:
+                delta = encode_json_delta(getattr(keyframe, json_column), getattr(row, json_column))
+                if delta is not None:
+                    setattr(row, json_column, delta)
+                    row.delta_base_id = keyframe.id
+
+    db.add(row)
+    db.flush()
+    update_latest(db, platform, row, stats)
+    return row
+
+
+def _add_solved(db: Session, platform: str, solved: Dict[int, Optional[list]], changed: set):
+    # Solved problems reported with the snapshots, in the same transaction.
+    # Totals only grow, so an unchanged snapshot means no new solves: those
+    # users' lists are skipped unless nothing is stored for them yet.
+    solved = {user_id: entries for user_id, entries in solved.items() if entries}
+    unchanged = [user_id for user_id in solved if user_id not in changed]
+    if unchanged:
+        stored = users_with_solved(db, platform, unchanged)
+        solved = {user_id: entries for user_id, entries in solved.items() if user_id in changed or user_id not in stored}
+    add_solved(db, platform, solved)
+
+
+def save_snapshot(db: Session, platform: str, row, solved: Optional[list] = None):
+    with DB_WRITE_SECONDS.time(platform=platform):
+        saved = _record_snapshot(db, platform, row)
+        if solved:
+            _add_solved(db, platform, {row.user_id: solved}, {row.user_id} if saved is row else set())
+        db.commit()
+    if saved is row:
+        # A new snapshot changes what /user/{id}/stats returns
+        stats_response_cache.invalidate(row.user_id)
+    return saved
+
+
+def save_snapshots(db: Session, platform: str, rows: list, solved: Optional[Dict[int, Optional[list]]] = None) -> list:
+    # Bulk variant for cohort refreshes: the previous snapshots of all users
+    # are loaded up front (two queries per chunk) and everything is written
+    # in one transaction
+    model = registry.get(platform).model
+    user_ids = sorted({row.user_id for row in rows})
+    with DB_WRITE_SECONDS.time(platform=platform):
+        # Held here so the identity map (weakly referenced) keeps them for db.get
+        loaded = []
+        for start in range(0, len(user_ids), BATCH_QUERY_SIZE):
+            chunk = user_ids[start:start + BATCH_QUERY_SIZE]
+            latest = db.query(LatestStats).filter(
+                LatestStats.platform == platform, LatestStats.user_id.in_(chunk)
+            ).all()
+            snapshot_ids = [entry.snapshot_id for entry in latest if entry.snapshot_id]
+            loaded.extend(latest)
+            if snapshot_ids:
+                loaded.extend(db.query(model).filter(model.id.in_(snapshot_ids)).all())
+        saved = [_record_snapshot(db, platform, row) for row in rows]
+        if solved:
+            _add_solved(db, platform, solved, {row.user_id for row, result in zip(rows, saved) if result is row})
+        db.commit()
+    for row, result in zip(rows, saved):
+        if result is row:
+            stats_response_cache.invalidate(row.user_id)
+    return saved
+
+
+def build_user_stats(latest_rows) -> dict:
+    platform_data = {adapter.name: dict(adapter.empty_stats) for adapter in registry}
+    for latest in latest_rows:
+        if latest.platform in platform_data:
+            platform_data[latest.platform] = latest.stats
+    return {
+        "total_problems_solved": sum(stats["total_solved"] or 0 for stats in platform_data.values()),
+        "platform_stats": platform_data
+    }
+
+
+def get_latest_stats(db: Session, user_id: int) -> dict:
+    # One indexed primary-key range scan, independent of history size
+    rows = db.query(LatestStats).filter(LatestStats.user_id == user_id).all()
+    return build_user_stats(rows)
+
+
+def load_latest_raw(db: Session, user_ids: List[int]) -> dict:
+    # user_id -> ({platform: stats JSON text}, total solved)
+    rows = db.query(
+        LatestStats.user_id,
+        LatestStats.platform,
+        LatestStats.total_solved,
+        type_coerce(LatestStats.stats, String)
+    ).filter(LatestStats.user_id.in_(user_ids)).all()
+
+    found = {}
+    for user_id, platform, total_solved, raw in rows:
+        if platform not in registry:
+            continue
+        if not isinstance(raw, str):
+            raw = json.dumps(raw)
+        entry = found.setdefault(user_id, [{}, 0])
+        entry[0][platform] = raw
+        entry[1] += total_solved or 0
+    return found
+
+
+async def stream_batch_stats_json(user_ids: List[int]) -> AsyncIterator[str]:
+    # Streams {"<user_id>": <same shape as /user/{id}/stats>, ...}. The stored
+    # stats JSON is spliced in as text instead of being decoded and re-encoded.
+    user_ids = sorted(set(user_ids))
+    empty = {adapter.name: json.dumps(adapter.empty_stats) for adapter in registry}
+
+    def render(user_id, raw_stats, total):
+        platform_data = ", ".join(
+            f'"{platform}": {raw_stats.get(platform, empty_stats)}' for platform, empty_stats in empty.items()
+        )
+        return f'"{user_id}": {{"total_problems_solved": {total}, "platform_stats": {{{platform_data}}}}}'
+
+    yield "{"
+    first = True
+    for start in range(0, len(user_ids), BATCH_QUERY_SIZE):
+        chunk = user_ids[start:start + BATCH_QUERY_SIZE]
+        found = await run_in_session(load_latest_raw, chunk)
+
+        # Emit a few hundred users per write rather than one tiny chunk each
+        parts = []
+        for user_id in chunk:
+            raw_stats, total = found.get(user_id, ({}, 0))
+            parts.append(("" if first else ", ") + render(user_id, raw_stats, total))
+            first = False
+            if len(parts) >= STREAM_USERS_PER_CHUNK:
+                yield "".join(parts)
+                parts = []
+        if parts:
+            yield "".join(parts)
+    yield "}"
+
+
+def get_leaderboard(db: Session, sort_by: str = "total_solved", platform: Optional[str] = None,
+                    limit: int = 50, offset: int = 0) -> dict:
+    if sort_by not in LEADERBOARD_SORTS:
+        raise ValueError(f"sort_by must be one of {', '.join(LEADERBOARD_SORTS)}")
+    if platform is not None and platform not in registry:
+        raise ValueError(f"Unknown platform: {platform}")
+    # Each judge rates on its own scale
+    if sort_by == "rating" and platform is None:
+        raise ValueError("sort_by=rating requires a platform")
+
+    total_solved = func.sum(LatestStats.total_solved).label("total_solved")
+    rating = func.max(LatestStats.rating).label("rating")
+    query = db.query(LatestStats.user_id, total_solved, rating)
+    count_query = db.query(func.count(func.distinct(LatestStats.user_id)))
+    if platform is not None:
+        query = query.filter(LatestStats.platform == platform)
+        count_query = count_query.filter(LatestStats.platform == platform)
+    if sort_by == "rating":
+        query = query.filter(LatestStats.rating.isnot(None))
+        count_query = count_query.filter(LatestStats.rating.isnot(None))
+
+    sort_column = total_solved if sort_by == "total_solved" else rating
+    rows = query.group_by(LatestStats.user_id).order_by(
+        sort_column.desc(), LatestStats.user_id
+    ).limit(limit).offset(offset).all()
+
+    return {
+        "sort_by": sort_by,
+        "platform": platform,
+        "limit": limit,
+        "offset": offset,
+        "total": count_query.scalar(),
+        "items": [
+            {
+                "rank": offset + position + 1,
+                "user_id": row.user_id,
+                "total_solved": row.total_solved or 0,
+                "rating": row.rating
+            }
+            for position, row in enumerate(rows)
+        ]
+    }
+
+
+def backfill_latest_stats(db: Session, batch_size: int = 1000) -> int:
+    # Rebuild latest_stats from the history tables (used when migrating an
+    # existing database)
+    count = 0
+    for adapter in registry:
+        platform, model = adapter.name, adapter.model
+        newest = db.query(
+            model.user_id.label("user_id"),
+            func.max(model.recorded_at).label("recorded_at")
+        ).group_by(model.user_id).subquery()
+        rows = db.query(model).join(
+            newest,
+            (model.user_id == newest.c.user_id) & (model.recorded_at == newest.c.recorded_at)
+        ).order_by(model.user_id, model.id).yield_per(batch_size)
+
+        # If two rows share the newest timestamp the highest id wins
+        for row in rows:
+            if row.user_id is None:
+                continue
+            update_latest(db, platform, row, stored_platform_stats(db, platform, row))
+            count += 1
+            if count % batch_size == 0:
+                db.flush()
+    db.commit()
+    return count
+
+
+def _compact_user_history(db: Session, platform: str, user_id: int, cutoff: datetime) -> int:
+    adapter = registry.get(platform)
+    model = adapter.model
+    json_column = adapter.delta_json_column
+    rows = db.query(model).filter(model.user_id == user_id).order_by(model.recorded_at, model.id).all()
+
+    # Before the cutoff only the last snapshot of each day survives
+    last_of_day: Dict = {}
+    for row in rows:
+        if row.recorded_at is not None and row.recorded_at < cutoff:
+            last_of_day[row.recorded_at.date()] = row
+    keep = {row.id for row in last_of_day.values()}
+    latest = db.get(LatestStats, (user_id, platform))
+    if latest is not None and latest.snapshot_id is not None:
+        keep.add(latest.snapshot_id)
+    doomed = [
+        row.id for row in rows
+        if row.recorded_at is not None and row.recorded_at < cutoff and row.id not in keep
+    ]
+    if not doomed:
+        return 0
+
+    if json_column:
+        # Survivors whose keyframe is removed are re-encoded against the most
+        # recent surviving full row, or stored in full if there is none
+        by_id = {row.id: row for row in rows}
+        doomed_ids = set(doomed)
+        full_json = {}
+        for row in rows:
+            value = getattr(row, json_column)
+            if row.delta_base_id is not None:
+                base = by_id.get(row.delta_base_id)
+                value = apply_json_delta((getattr(base, json_column) if base else None) or {}, value or {})
+            full_json[row.id] = value
+
+        keyframe = None
+        for row in rows:
+            if row.id in doomed_ids:
+                continue
+            if row.delta_base_id is None:
+                keyframe = row
+            elif row.delta_base_id in doomed_ids:
+                delta = None
+                if keyframe is not None:
+                    delta = encode_json_delta(getattr(keyframe, json_column), full_json[row.id])
+                if delta is None:
+                    setattr(row, json_column, full_json[row.id])
+                    row.delta_base_id = None
+                    keyframe = row
+                else:
+                    setattr(row, json_column, delta)
+                    row.delta_base_id = keyframe.id
+        db.flush()
+
+    for start in range(0, len(doomed), BATCH_QUERY_SIZE):
+        db.query(model).filter(
+            model.id.in_(doomed[start:start + BATCH_QUERY_SIZE])
+        ).delete(synchronize_session=False)
+    db.commit()
+    return len(doomed)
+
+
+def compact_history(db: Session, now: Optional[datetime] = None) -> int:
+    # Retention: keep every snapshot for HISTORY_FULL_RESOLUTION_DAYS, then
+    # one per user and day. Returns the number of rows removed.
+    cutoff = (now or datetime.utcnow()) - timedelta(days=HISTORY_FULL_RESOLUTION_DAYS)
+    removed = 0
+    for adapter in registry:
+        platform, model = adapter.name, adapter.model
+        # Only users that actually have a day with more than one old snapshot
+        user_ids = [
+            user_id for (user_id,) in db.query(model.user_id).filter(
+                model.recorded_at < cutoff, model.user_id.isnot(None)
+            ).group_by(model.user_id, func.date(model.recorded_at)).having(
+                func.count(model.id) > 1
+            ).distinct()
+        ]
+        for user_id in user_ids:
+            removed += _compact_user_history(db, platform, user_id, cutoff)
+    return removed
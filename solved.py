@@ -0,0 +1,283 @@
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import Problem, Tag, ProblemTag, SolvedProblem, ProfileHandle, CodeForcesSyncState, CodeForcesProblem
+from history import to_naive_utc
+from platforms import registry
+from platforms.base import solved_entry
+
+# Largest IN () list sent in one statement (SQLite allows 32766 variables)
+BATCH_QUERY_SIZE = 10000
+SOLVED_DEFAULT_LIMIT = 100
+SOLVED_MAX_LIMIT = 1000
+# Problem ids kept in memory; a problem's id never changes once committed,
+# so refreshes of profiles listing known problems skip the lookup query
+PROBLEM_ID_CACHE_SIZE = int(os.getenv("PROBLEM_ID_CACHE_SIZE", "200000"))
+
+_problem_ids: Dict[Tuple[str, str], int] = {}
+
+
+def _chunks(values: list) -> Iterable[list]:
+    for start in range(0, len(values), BATCH_QUERY_SIZE):
+        yield values[start:start + BATCH_QUERY_SIZE]
+
+
+def insert_ignoring_conflicts(db: Session, model, rows: List[dict]):
+    # Concurrent refreshes intern the same problems and tags; rows another
+    # session inserted first are skipped instead of failing the refresh
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        db.bulk_insert_mappings(model, rows)
+        return
+    db.execute(insert(model.__table__).on_conflict_do_nothing(), rows)
+
+
+def intern_tags(db: Session, names: Iterable[str]) -> Dict[str, int]:
+    names = list(set(names))
+    ids = {}
+    for chunk in _chunks(names):
+        ids.update(db.query(Tag.name, Tag.id).filter(Tag.name.in_(chunk)))
+    missing = [name for name in names if name not in ids]
+    if missing:
+        insert_ignoring_conflicts(db, Tag, [{"name": name} for name in missing])
+        for chunk in _chunks(missing):
+            ids.update(db.query(Tag.name, Tag.id).filter(Tag.name.in_(chunk)))
+    return ids
+
+
+def intern_problems(db: Session, platform: str, entries: Iterable[dict]) -> Dict[str, int]:
+    # Integer keys of the given problems, creating the new ones with their tags
+    tags_by_code: Dict[str, List[str]] = {}
+    for entry in entries:
+        if entry.get("tags") or entry["id"] not in tags_by_code:
+            tags_by_code[entry["id"]] = entry.get("tags") or []
+    ids = {}
+    unknown = []
+    for code in tags_by_code:
+        problem_id = _problem_ids.get((platform, code))
+        if problem_id is None:
+            unknown.append(code)
+        else:
+            ids[code] = problem_id
+
+    def lookup(codes: List[str]):
+        for chunk in _chunks(codes):
+            ids.update(db.query(Problem.code, Problem.id).filter(Problem.platform == platform, Problem.code.in_(chunk)))
+
+    lookup(unknown)
+    # Only rows that existed before this transaction; ours could still roll back
+    if len(_problem_ids) + len(unknown) > PROBLEM_ID_CACHE_SIZE:
+        _problem_ids.clear()
+    _problem_ids.update(((platform, code), ids[code]) for code in unknown if code in ids)
+    missing = [code for code in unknown if code not in ids]
+    if missing:
+        insert_ignoring_conflicts(db, Problem, [{"platform": platform, "code": code} for code in missing])
+        lookup(missing)
+        tag_ids = intern_tags(db, (tag for code in missing for tag in tags_by_code[code]))
+        insert_ignoring_conflicts(db, ProblemTag, [
+            {"problem_id": ids[code], "tag_id": tag_ids[tag]}
+            for code in missing for tag in set(tags_by_code[code])
+        ])
+    return ids
+
+
+def add_solved(db: Session, platform: str, solved: Dict[int, List[dict]], backfill: bool = False):
+    # Merge the solved problems a refresh saw (user_id -> solved entries)
+    # into the store, keeping the earliest known solve time, without
+    # committing. Undated entries count as solved now, except on a user's
+    # first refresh of the platform (or a backfill), when they were solved at
+    # some unknown earlier time. Entries are diffed against what is stored,
+    # so an unchanged profile costs one read and no writes.
+    solved = {user_id: entries for user_id, entries in solved.items() if entries}
+    if not solved:
+        return
+    # code -> (problem_id, solved_at) of what each user already has here
+    known: Dict[int, Dict[str, tuple]] = {user_id: {} for user_id in solved}
+    for chunk in _chunks(list(solved)):
+        rows = db.query(SolvedProblem.user_id, Problem.code, SolvedProblem.problem_id, SolvedProblem.solved_at).join(
+            Problem, Problem.id == SolvedProblem.problem_id
+        ).filter(Problem.platform == platform, SolvedProblem.user_id.in_(chunk))
+        for user_id, code, problem_id, solved_at in rows:
+            known[user_id][code] = (problem_id, solved_at)
+
+    now = datetime.utcnow()
+    new: Dict[Tuple[int, str], Optional[datetime]] = {}
+    earlier: Dict[Tuple[int, int], datetime] = {}
+    for user_id, entries in solved.items():
+        have = known[user_id]
+        first_refresh = backfill or not have
+        for entry in entries:
+            dated = entry.get("solved_at") is not None
+            if dated:
+                solved_at = datetime.utcfromtimestamp(entry["solved_at"])
+            else:
+                solved_at = None if first_refresh else now
+            stored = have.get(entry["id"])
+            if stored is not None:
+                problem_id, stored_at = stored
+                if dated and (stored_at is None or solved_at < stored_at):
+                    have[entry["id"]] = (problem_id, solved_at)
+                    earlier[(user_id, problem_id)] = solved_at
+                continue
+            key = (user_id, entry["id"])
+            if key not in new or (solved_at is not None and (new[key] is None or solved_at < new[key])):
+                new[key] = solved_at
+
+    if new:
+        codes = {code for _, code in new}
+        problem_ids = intern_problems(
+            db, platform, (entry for entries in solved.values() for entry in entries if entry["id"] in codes)
+        )
+        insert_ignoring_conflicts(db, SolvedProblem, [
+            {"user_id": user_id, "problem_id": problem_ids[code], "solved_at": solved_at}
+            for (user_id, code), solved_at in new.items()
+        ])
+    if earlier:
+        db.bulk_update_mappings(SolvedProblem, [
+            {"user_id": user_id, "problem_id": problem_id, "solved_at": solved_at}
+            for (user_id, problem_id), solved_at in earlier.items()
+        ])
+
+
+def users_with_solved(db: Session, platform: str, user_ids: List[int]) -> set:
+    # Users with at least one stored solve on the platform
+    found = set()
+    for chunk in _chunks(list(user_ids)):
+        found.update(user_id for user_id, in db.query(SolvedProblem.user_id).join(
+            Problem, Problem.id == SolvedProblem.problem_id
+        ).filter(Problem.platform == platform, SolvedProblem.user_id.in_(chunk)).distinct())
+    return found
+
+
+def _solves(db: Session, user_id: int, platform: Optional[str] = None):
+    query = db.query(SolvedProblem).filter(SolvedProblem.user_id == user_id)
+    if platform is not None:
+        query = query.filter(SolvedProblem.problem_id.in_(db.query(Problem.id).filter(Problem.platform == platform)))
+    return query
+
+
+def move_solved(db: Session, platform: str, source: int, target: int):
+    # Hand a user's solves on a platform to another user (when merging
+    # profiles); problems both have keep the earliest solve time
+    moved = dict(_solves(db, source, platform).with_entities(SolvedProblem.problem_id, SolvedProblem.solved_at))
+    if moved:
+        have = dict(_solves(db, target, platform).with_entities(SolvedProblem.problem_id, SolvedProblem.solved_at))
+        insert_ignoring_conflicts(db, SolvedProblem, [
+            {"user_id": target, "problem_id": problem_id, "solved_at": solved_at}
+            for problem_id, solved_at in moved.items() if problem_id not in have
+        ])
+        earlier = [
+            {"user_id": target, "problem_id": problem_id, "solved_at": solved_at}
+            for problem_id, solved_at in moved.items()
+            if problem_id in have and solved_at is not None and (have[problem_id] is None or solved_at < have[problem_id])
+        ]
+        if earlier:
+            db.bulk_update_mappings(SolvedProblem, earlier)
+    delete_solved(db, source, platform)
+
+
+def delete_solved(db: Session, user_id: int, platform: Optional[str] = None):
+    _solves(db, user_id, platform).delete(synchronize_session=False)
+
+
+def save_solved(db: Session, platform: str, solved: Dict[int, List[dict]], backfill: bool = False):
+    add_solved(db, platform, solved, backfill)
+    db.commit()
+
+
+def _problem_tags(db: Session, problem_ids: List[int]) -> Dict[int, List[str]]:
+    tags: Dict[int, List[str]] = {}
+    for chunk in _chunks(problem_ids):
+        rows = db.query(ProblemTag.problem_id, Tag.name).join(Tag, Tag.id == ProblemTag.tag_id).filter(
+            ProblemTag.problem_id.in_(chunk)
+        )
+        for problem_id, name in rows:
+            tags.setdefault(problem_id, []).append(name)
+    return tags
+
+
+def get_solved(db: Session, user_id: int, platform: Optional[str] = None, start: Optional[datetime] = None,
+               end: Optional[datetime] = None, tag: Optional[str] = None, limit: int = SOLVED_DEFAULT_LIMIT,
+               offset: int = 0) -> dict:
+    # A user's solved problems, newest first (undated ones last), optionally
+    # limited to a platform, a tag and a [from, to) range of solve times
+    if platform is not None and platform not in registry:
+        raise ValueError(f"Unknown platform: {platform}")
+    query = db.query(Problem.id, Problem.platform, Problem.code, SolvedProblem.solved_at).join(
+        Problem, Problem.id == SolvedProblem.problem_id
+    ).filter(SolvedProblem.user_id == user_id)
+    if platform is not None:
+        query = query.filter(Problem.platform == platform)
+    if start is not None:
+        query = query.filter(SolvedProblem.solved_at >= to_naive_utc(start))
+    if end is not None:
+        query = query.filter(SolvedProblem.solved_at < to_naive_utc(end))
+    if tag is not None:
+        query = query.join(ProblemTag, ProblemTag.problem_id == Problem.id).join(Tag, Tag.id == ProblemTag.tag_id).filter(
+            Tag.name == tag
+        )
+
+    total = query.count()
+    rows = query.order_by(
+        SolvedProblem.solved_at.is_(None), SolvedProblem.solved_at.desc(), Problem.id
+    ).limit(limit).offset(offset).all()
+    tags = _problem_tags(db, [row[0] for row in rows])
+    return {
+        "user_id": user_id,
+        "total": total,
+        "problems": [
+            {
+                "platform": problem_platform,
+                "problem": code,
+                "solved_at": solved_at.isoformat() if solved_at else None,
+                "tags": tags.get(problem_id, []),
+            }
+            for problem_id, problem_platform, code, solved_at in rows
+        ],
+    }
+
+
+def get_tag_counts(db: Session, user_id: int) -> dict:
+    # Solved problems per tag and platform, so tags practised on several
+    # platforms can be compared
+    rows = db.query(Tag.name, Problem.platform, func.count()).select_from(SolvedProblem).join(
+        Problem, Problem.id == SolvedProblem.problem_id
+    ).join(ProblemTag, ProblemTag.problem_id == Problem.id).join(Tag, Tag.id == ProblemTag.tag_id).filter(
+        SolvedProblem.user_id == user_id
+    ).group_by(Tag.name, Problem.platform).all()
+
+    tags: Dict[str, Dict[str, int]] = {}
+    for name, platform, count in rows:
+        tags.setdefault(name, {})[platform] = count
+    return {
+        "user_id": user_id,
+        "tags": {
+            name: {"total": sum(counts.values()), "platforms": counts}
+            for name, counts in sorted(tags.items(), key=lambda item: -sum(item[1].values()))
+        },
+    }
+
+
+def backfill_solved_problems(db: Session) -> int:
+    # Codeforces problems solved before the store existed, from the
+    # submission sync state of every tracked handle (solve times unknown)
+    tags = dict(db.query(CodeForcesProblem.problem_id, CodeForcesProblem.tags))
+    count = 0
+    handles = db.query(ProfileHandle.user_id, CodeForcesSyncState.solved_problems).join(
+        CodeForcesSyncState, CodeForcesSyncState.handle == ProfileHandle.handle
+    ).filter(ProfileHandle.platform == "codeforces")
+    for user_id, solved_problems in handles.all():
+        entries = [solved_entry(problem_id, tags=tags.get(problem_id) or []) for problem_id in solved_problems or []]
+        save_solved(db, "codeforces", {user_id: entries}, backfill=True)
+        count += len(entries)
+    return count
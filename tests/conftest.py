@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+# The app reads its settings at import time: point it at a scratch database
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/profile_tracker.db"
+
+from models import init_db  # noqa: E402
+
+init_db()
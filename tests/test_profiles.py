@@ -0,0 +1,92 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import main
+import profiles
+from models import SessionLocal, UserProfile, ProfileHandle, CodeForcesStats, LatestStats
+from platforms.base import solved_entry
+from solved import save_solved, get_solved
+
+CONCURRENT_REQUESTS = 5
+
+
+def test_concurrent_upserts_of_a_new_handle_share_one_profile(monkeypatch):
+    # Hold every request after its handle lookup until all of them have
+    # looked up, so that each one sees the handle as new and inserts it
+    barrier = threading.Barrier(CONCURRENT_REQUESTS, timeout=10)
+    waited = threading.local()
+    load_index = profiles.HandleIndex.__init__
+
+    def racing_index(self, db, keys):
+        load_index(self, db, keys)
+        if not getattr(waited, "done", False):
+            waited.done = True
+            barrier.wait()
+
+    monkeypatch.setattr(main.HandleIndex, "__init__", racing_index)
+
+    def track(_):
+        db = SessionLocal()
+        try:
+            return main.upsert_profile(db, main.ProfileURLs(leetcode_url="https://leetcode.com/u/Zed/"))
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(CONCURRENT_REQUESTS) as pool:
+        results = list(pool.map(track, range(CONCURRENT_REQUESTS)))
+
+    assert len({user_id for user_id, _ in results}) == 1
+    db = SessionLocal()
+    try:
+        assert db.query(ProfileHandle).filter(ProfileHandle.platform == "leetcode").count() == 1
+        assert db.query(UserProfile).filter(UserProfile.id == results[0][0]).count() == 1
+    finally:
+        db.close()
+
+
+def _track(**urls):
+    db = SessionLocal()
+    try:
+        return main.upsert_profile(db, main.ProfileURLs(**urls))[0]
+    finally:
+        db.close()
+
+
+def _record(user_id, solved, problem):
+    db = SessionLocal()
+    try:
+        db.add(CodeForcesStats(user_id=user_id, total_problems_solved=solved))
+        db.add(LatestStats(user_id=user_id, platform="codeforces", total_solved=solved))
+        db.commit()
+        save_solved(db, "codeforces", {user_id: [solved_entry(problem)]})
+    finally:
+        db.close()
+
+
+def _codeforces_data(user_id):
+    db = SessionLocal()
+    try:
+        return (
+            [row.total_problems_solved for row in db.query(CodeForcesStats).filter(CodeForcesStats.user_id == user_id)],
+            [row.total_solved for row in db.query(LatestStats).filter(LatestStats.user_id == user_id)],
+            [problem["problem"] for problem in get_solved(db, user_id, "codeforces")["problems"]],
+        )
+    finally:
+        db.close()
+
+
+def test_changing_a_handle_keeps_only_the_new_handles_data():
+    amy = _track(leetcode_url="https://leetcode.com/u/amy/", codeforces_url="https://codeforces.com/profile/amy_old")
+    _record(amy, 10, "1A")
+    bob = _track(codeforces_url="https://codeforces.com/profile/bob")
+    _record(bob, 20, "4A")
+
+    # A new handle starts without the old one's data
+    assert _track(leetcode_url="https://leetcode.com/u/amy/", codeforces_url="https://codeforces.com/profile/amy_new") == amy
+    assert _codeforces_data(amy) == ([], [], [])
+    _record(amy, 11, "1A")
+
+    # A handle taken from another profile brings its own data only
+    assert _track(leetcode_url="https://leetcode.com/u/amy/", codeforces_url="https://codeforces.com/profile/bob") == amy
+    assert _codeforces_data(amy) == ([20], [20], ["4A"])
+    assert _codeforces_data(bob) == ([], [], [])
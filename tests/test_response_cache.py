@@ -0,0 +1,39 @@
+import asyncio
+
+from response_cache import ResponseCache
+
+
+def test_invalidating_uncached_users_keeps_no_state():
+    cache = ResponseCache(max_entries=2)
+    for user_id in range(1000):
+        cache.invalidate(user_id)
+    assert cache._loading == {}
+
+
+def test_a_load_that_raced_with_an_invalidation_is_not_stored():
+    cache = ResponseCache(max_entries=2)
+
+    async def run():
+        loading = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow_loader():
+            loading.set()
+            await release.wait()
+            return {"total_solved": 1}
+
+        load = asyncio.create_task(cache.get_or_load(1, slow_loader))
+        await loading.wait()
+        cache.invalidate(1)
+        release.set()
+        await load
+
+        async def loader():
+            return {"total_solved": 2}
+
+        assert cache.get(1) is None
+        await cache.get_or_load(1, loader)
+
+    asyncio.run(run())
+    assert cache.get(1)[0] == b'{"total_solved":2}'
+    assert cache._loading == {}
@@ -0,0 +1,52 @@
+import asyncio
+
+from sqlalchemy.exc import IntegrityError
+
+import roster
+from jobs import Job
+from models import SessionLocal, ProfileHandle
+
+
+async def _lines(rows):
+    for row in rows:
+        yield row
+
+
+def test_a_chunk_that_keeps_conflicting_is_reported_and_the_import_goes_on(monkeypatch):
+    store = roster.run_in_session
+    attempts = []
+
+    async def conflicting_first_chunk(fn, rows):
+        attempts.append(len(attempts))
+        if any("conflict" in url for urls in rows for url in urls.values()):
+            raise IntegrityError("INSERT INTO profile_handles", {}, Exception("UNIQUE constraint failed"))
+        return await store(fn, rows)
+
+    monkeypatch.setattr(roster, "run_in_session", conflicting_first_chunk)
+
+    async def run():
+        importer = roster.RosterImporter(
+            lambda user_id, platform, url, allow_stale=True: Job(user_id, platform, url, allow_stale), lambda user_id, platform: False,
+            chunk_size=2, batch_refreshers={},
+        )
+        rows = ["leetcode_url"] + [
+            f"https://leetcode.com/u/{name}/" for name in ("conflict-a", "conflict-b", "roster-c", "roster-d", "roster-e")
+        ]
+        roster_import = await importer.run(_lines(rows), roster.CSV)
+        await importer.stop()
+        return roster_import
+
+    roster_import = asyncio.run(run())
+
+    assert len(attempts) == roster.IMPORT_CHUNK_ATTEMPTS + 2
+    assert roster_import.error is None
+    assert roster_import.counts["created"] == 3
+    assert roster_import.counts["failed"] == 2
+    assert [row["line"] for row in roster_import.failed_rows] == [2, 3]
+    db = SessionLocal()
+    try:
+        assert {row.handle for row in db.query(ProfileHandle).filter(ProfileHandle.handle.like("roster-%"))} == {
+            "roster-c", "roster-d", "roster-e"
+        }
+    finally:
+        db.close()